@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -67,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'catalogue.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'api.urls'
@@ -136,8 +137,123 @@ SITE_ID = 1
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Shared Redis cache when CACHE_REDIS_URL is set (e.g. redis://redis:6379/1),
+# otherwise a per-process local memory cache, which only suits a single process:
+# the catalogue generation that invalidates cached lists is then per process too
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'catalogue',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Seconds product and category list responses, facets and the category index are cached;
+# 0 disables the cache. Off by default without a shared cache, where other processes
+# would keep serving lists from before a write.
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=300 if CACHE_REDIS_URL else 0, cast=int)
+# Serialized product cards kept in each process's LRU in front of the shared cache
+PRODUCT_CARD_CACHE_SIZE = config('PRODUCT_CARD_CACHE_SIZE', default=2048, cast=int)
+# Seconds product cards are kept in the shared cache; 0 keeps them in the local LRU only
+PRODUCT_CARD_CACHE_TIMEOUT = config('PRODUCT_CARD_CACHE_TIMEOUT', default=3600, cast=int)
+# Serialize the product and category lists from values() rows (catalogue.fastpath).
+# Opt-in: the ModelSerializer path stays the default until the fast path has run in production.
+CATALOGUE_FAST_LISTS = config('CATALOGUE_FAST_LISTS', default=False, cast=bool)
+# Upper bounds of the price histogram buckets returned by /products/facets/
+PRODUCT_FACET_PRICE_BUCKETS = config('PRODUCT_FACET_PRICE_BUCKETS', default='25,50,100,250,500,1000', cast=Csv(int))
+# Resized copies of product images made at ingest for listing pages: longest side of
+# each size in pixels, formats ('webp', 'jpeg') and encoder quality
+PRODUCT_IMAGE_SIZES = config('PRODUCT_IMAGE_SIZES', default='640,320,160', cast=Csv(int))
+PRODUCT_IMAGE_FORMATS = config('PRODUCT_IMAGE_FORMATS', default='webp,jpeg', cast=Csv())
+PRODUCT_IMAGE_QUALITY = config('PRODUCT_IMAGE_QUALITY', default=80, cast=int)
+
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://redis:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://redis:6379/0')
+CELERY_BEAT_SCHEDULE = {}
+
+# Image search admission control (per web process)
+SEARCH_MAX_CONCURRENCY = config('SEARCH_MAX_CONCURRENCY', default=2, cast=int)
+SEARCH_MAX_QUEUE = config('SEARCH_MAX_QUEUE', default=16, cast=int)
+SEARCH_MAX_QUEUE_PER_CLIENT = config('SEARCH_MAX_QUEUE_PER_CLIENT', default=2, cast=int)
+SEARCH_QUEUE_TIMEOUT = config('SEARCH_QUEUE_TIMEOUT', default=5.0, cast=float)
+# Reverse proxies (addresses or CIDR ranges) whose X-Forwarded-For is trusted when
+# queuing anonymous searches per client IP. Empty means REMOTE_ADDR is used as is.
+SEARCH_TRUSTED_PROXIES = config('SEARCH_TRUSTED_PROXIES', default='', cast=Csv())
+
+# Degrade search quality (smaller inputs, fewer IVF probes) as the queue fills
+SEARCH_ADAPTIVE_QUALITY = config('SEARCH_ADAPTIVE_QUALITY', default=True, cast=bool)
+SEARCH_TIER_MIN_DWELL = config('SEARCH_TIER_MIN_DWELL', default=10.0, cast=float)
+
+# Upper bound on k when a search widens to fill its limit with active products
+SEARCH_MAX_CANDIDATES = config('SEARCH_MAX_CANDIDATES', default=1000, cast=int)
+
+# Ranked candidates kept per search for cursor pagination, for how long (seconds), and in
+# which cache. The next pages may be served by any process, so the cache must be shared:
+# without CACHE_REDIS_URL cursors are off (0) and searches return their first page only.
+SEARCH_CURSOR_CANDIDATES = config('SEARCH_CURSOR_CANDIDATES', default=1000, cast=int)
+SEARCH_CURSOR_TTL = config('SEARCH_CURSOR_TTL', default=600 if CACHE_REDIS_URL else 0, cast=int)
+SEARCH_CURSOR_CACHE = config('SEARCH_CURSOR_CACHE', default='default')
+
+# Candidates each side of a hybrid text + image search ranks before reciprocal rank
+# fusion merges them, and the fusion's damping constant
+SEARCH_HYBRID_CANDIDATES = config('SEARCH_HYBRID_CANDIDATES', default=200, cast=int)
+SEARCH_RRF_K = config('SEARCH_RRF_K', default=60, cast=int)
+
+# Vector store used for a new index: 'faiss', or 'numpy' (exact brute force, no faiss needed)
+SEARCH_VECTOR_BACKEND = config('SEARCH_VECTOR_BACKEND', default='faiss')
+# 'cosine' ranks L2-normalized embeddings by inner product and scores results by cosine
+# similarity; 'l2' is the older Euclidean index. Indexes written with the other metric are
+# rebuilt on load.
+SEARCH_METRIC = config('SEARCH_METRIC', default='cosine')
+# Default cut-off for search results; searches can also pass min_similarity. Empty means none.
+SEARCH_MIN_SIMILARITY = config(
+    'SEARCH_MIN_SIMILARITY', default='', cast=lambda value: float(value) if value not in (None, '') else None)
+
+# Unix socket of the node's search sidecar (manage.py run_search_sidecar).
+# Empty means the model and index are loaded in-process.
+SEARCH_SIDECAR_SOCKET = config('SEARCH_SIDECAR_SOCKET', default='')
+SEARCH_SIDECAR_TIMEOUT = config('SEARCH_SIDECAR_TIMEOUT', default=30.0, cast=float)
+
+# Split the index across shards searched in parallel, partitioned by 'hash' (product id)
+# or 'category'. SEARCH_SHARD_SOCKETS lists one shard process per shard
+# (manage.py run_search_shards); without it the shards are local index files.
+SEARCH_SHARDS = config('SEARCH_SHARDS', default=1, cast=int)
+SEARCH_SHARD_PARTITION = config('SEARCH_SHARD_PARTITION', default='hash')
+SEARCH_SHARD_SOCKETS = config('SEARCH_SHARD_SOCKETS', default='', cast=Csv())
+
+# Shared directory for versioned index snapshots. The builder publishes INDEX_FILE
+# there every SEARCH_SNAPSHOT_PUBLISH_INTERVAL seconds, and search nodes poll for new
+# versions every SEARCH_SNAPSHOT_POLL_INTERVAL seconds. Empty disables snapshots.
+SEARCH_SNAPSHOT_DIR = config('SEARCH_SNAPSHOT_DIR', default='')
+SEARCH_SNAPSHOT_PUBLISH_INTERVAL = config('SEARCH_SNAPSHOT_PUBLISH_INTERVAL', default=300, cast=int)
+SEARCH_SNAPSHOT_POLL_INTERVAL = config('SEARCH_SNAPSHOT_POLL_INTERVAL', default=30, cast=int)
+SEARCH_SNAPSHOT_DELTAS = config('SEARCH_SNAPSHOT_DELTAS', default=True, cast=bool)
+SEARCH_SNAPSHOT_KEEP = config('SEARCH_SNAPSHOT_KEEP', default=3, cast=int)
+# Whether this process follows the published snapshots. Turn it off for the processes
+# writing INDEX_FILE (the Celery workers running generate_embedding): their own index
+# is newer than any snapshot. A subscribed process still adds on top of INDEX_FILE.
+SEARCH_SNAPSHOT_SUBSCRIBE = config('SEARCH_SNAPSHOT_SUBSCRIBE', default=True, cast=bool)
+if SEARCH_SNAPSHOT_DIR:
+    CELERY_BEAT_SCHEDULE['publish-index-snapshot'] = {
+        'task': 'catalogue.tasks.publish_index_snapshot',
+        'schedule': SEARCH_SNAPSHOT_PUBLISH_INTERVAL,
+    }
+
+# Return the number of SQL queries of each request in an X-Query-Count header
+# (read by manage.py load_test)
+QUERY_COUNT_HEADER = config('QUERY_COUNT_HEADER', default=False, cast=bool)
+
+# Bearer token Prometheus scrapes /api/v1/metrics/ with (Authorization: Bearer <token>).
+# Staff users can always read the metrics; empty means only they can.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
 
 
 # Media files
@@ -153,7 +269,18 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'dj_rest_auth.jwt_auth.JWTCookieAuthentication',
-    )
+    ),
+    # orjson versions of the JSON renderer and parser: the same JSON values as DRF's,
+    # only floats may be spelled differently (see catalogue.renderers)
+    'DEFAULT_RENDERER_CLASSES': (
+        'catalogue.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'catalogue.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # Allauth settings
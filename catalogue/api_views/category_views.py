@@ -2,8 +2,20 @@ from rest_framework import generics
 from catalogue.models import Category
 from catalogue.serializers.category_serializers import CategorySerializer
 from rest_framework.permissions import AllowAny
+from catalogue.caching import CachedListMixin
+from catalogue.category_tree import CategoryTreeMixin
+from catalogue.conditional import ConditionalGetMixin, queryset_validators
+from catalogue.fastpath import ValuesListMixin
 
-class CategoryListAPIView(generics.ListAPIView):
+class CategoryListAPIView(ConditionalGetMixin, CachedListMixin, CategoryTreeMixin, ValuesListMixin,
+                          generics.ListAPIView):
+    """
+    All categories, flat; ?tree=true nests them under their parents.
+    """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+
+    def get_validators(self, request):
+        return self.cached_validators(
+            request, lambda: queryset_validators(self.filter_queryset(self.get_queryset())))
@@ -0,0 +1,21 @@
+from django.http import HttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from catalogue.authentication import MetricsTokenAuthentication
+from catalogue.permissions import HasMetricsToken, IsAdminUser
+from catalogue.search.metrics import render_prometheus
+# Importing the search pipeline registers its index and admission gauges
+import catalogue.tasks  # noqa: F401
+import catalogue.search.admission  # noqa: F401
+
+
+class MetricsAPIView(APIView):
+    """
+    Prometheus text endpoint for the search pipeline metrics of this process.
+    Readable by staff users and by scrapers sending the METRICS_TOKEN bearer token.
+    """
+    authentication_classes = [MetricsTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
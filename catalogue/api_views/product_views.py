@@ -1,54 +1,106 @@
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny
 from drf_yasg.utils import swagger_auto_schema
+from django.conf import settings
+from django.urls import reverse
+from urllib.parse import urlencode
 from catalogue.models import Product
+from catalogue.caching import CachedListMixin, get_generation
+from catalogue.category_tree import filter_subtree
+from catalogue.conditional import ConditionalGetMixin, make_etag, queryset_validators
+from catalogue.facets import cached_facets
+from catalogue.fastpath import ValuesListMixin
+from catalogue.sparse_fields import FIELDS_PARAM, SparseFieldsViewMixin, parse_fields
+from catalogue.pagination import KeysetPagination
 from catalogue.serializers.product_serializers import ProductSerializer, ProductCreateSerializer
-from catalogue.serializers.search_serializers import ImageSearchSerializer, ProductSearchResultSerializer
-from catalogue.tasks import generate_embedding, generate_image_embedding, search_similar_products
+from catalogue.serializers.search_serializers import (
+    EmbeddingSearchSerializer, HybridSearchSerializer, ImageSearchSerializer, ProductSearchResultSerializer,
+    SearchPageSerializer, TextSearchSerializer
+)
+from catalogue.tasks import (
+    EMBEDDING_DIM, EMBEDDING_MODEL_VERSION,
+    generate_embedding, generate_image_embedding, search_similar_products
+)
+from catalogue.parsers import ORJSONParser, RawEmbeddingParser
 from catalogue.permissions import IsAdminUser, IsAdminOrReadOnly
+from catalogue.search.admission import AdmissionRejected, get_admission_controller, get_client_key
+from catalogue.search.cursors import CursorError, decode_cursor, encode_cursor, load_candidates, store_candidates
+from catalogue.search.hydration import fetch_ranked, hydrate_from
+from catalogue.search.metrics import record, timed, track_request
+from catalogue.search.text import RRF_K, TEXT_TIER, reciprocal_rank_fusion, text_search
+from catalogue.search.tiers import TIERS, get_quality_governor
 import tempfile
 import os
 
-class ProductPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+class ProductPagination(KeysetPagination):
+    # Newest first, on the primary key index
+    ordering = '-id'
+    filter_params = ('category_slug', 'min_price', 'max_price', 'min_stock', 'max_stock')
+    link_params = (FIELDS_PARAM,)
 
-class ProductListAPIView(generics.ListAPIView):
+def filter_products(queryset, params):
+    """Apply the product list filters (ProductPagination.filter_params) to a queryset."""
+    #Filtering by category_slug, which covers its subcategories too
+    category_slug = params.get('category_slug')
+    if category_slug:
+        queryset = filter_subtree(queryset, category_slug)
+    
+    # Filtering by price range
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+        
+    # Filtering by stock quantity
+    min_stock = params.get('min_stock')
+    max_stock = params.get('max_stock')
+    
+    if min_stock:
+        queryset = queryset.filter(stock_quantity__gte=min_stock)
+    if max_stock:
+        queryset = queryset.filter(stock_quantity__lte=max_stock)
+        
+    return queryset
+
+class ProductListAPIView(ConditionalGetMixin, CachedListMixin, SparseFieldsViewMixin, ValuesListMixin,
+                         generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
     pagination_class = ProductPagination
 
+    def get_validators(self, request):
+        def compute():
+            # Only the rows of the requested page, plus the one telling whether a next page exists
+            page = self.paginator.get_page_queryset(self.filter_queryset(self.get_queryset()), request)
+            extra = ()
+            if request.query_params.get(self.paginator.count_query_param, '').lower() in ('1', 'true', 'yes'):
+                # The count covers the whole list, which any catalogue change may move
+                extra = (get_generation(),)
+            return queryset_validators(page, *extra)
+        return self.cached_validators(request, compute)
+
     def get_queryset(self):
-        queryset = Product.objects.all()
+        # Filters come from the cursor when paging, so every page keeps the first page's filters
+        return filter_products(Product.objects.all(), self.paginator.get_filters(self.request))
+
+class ProductFacetsAPIView(APIView):
+    """
+    Category, price bucket and stock counts of the products matching the
+    product list filters (or those of a list ``cursor``), from one grouped
+    aggregate query, cached per filter combination.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        filters = ProductPagination().get_filters(request)
+        queryset = filter_products(Product.objects.all(), filters)
+        return Response(cached_facets(queryset, filters))
 
-        #Filtering by category_slug
-        category_slug = self.request.query_params.get('category_slug')
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
-        
-        # Filtering by price range
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-            
-        # Filtering by stock quantity
-        min_stock = self.request.query_params.get('min_stock')
-        max_stock = self.request.query_params.get('max_stock')
-        
-        if min_stock:
-            queryset = queryset.filter(stock_quantity__gte=min_stock)
-        if max_stock:
-            queryset = queryset.filter(stock_quantity__lte=max_stock)
-            
-        return queryset
 
 class ProductByCategoryListAPIView(ProductListAPIView):
     # This is actually unneccessary since we are already filtering by category_slug in the ProductListAPIView
@@ -56,7 +108,7 @@ class ProductByCategoryListAPIView(ProductListAPIView):
     def get_queryset(self):
         queryset = super().get_queryset()
         slug = self.kwargs['slug']
-        return queryset.filter(category__slug=slug)
+        return filter_subtree(queryset, slug)
 
 
 class ProductCreateAPIView(generics.CreateAPIView):
@@ -70,10 +122,11 @@ class ProductCreateAPIView(generics.CreateAPIView):
         generate_embedding.delay(product.id)
 
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailAPIView(ConditionalGetMixin, SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     API View for retrieving, updating, or deleting a product.
-    GET: AllowAny
+    GET: AllowAny, answered with 304 while the client's ETag or Last-Modified is current;
+    ?fields=name,price narrows the response
     PUT/PATCH/DELETE: IsAdminUser
     """
     queryset = Product.objects.all()
@@ -81,6 +134,53 @@ class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'id'
 
+    def get_validators(self, request):
+        updated_at = self.get_queryset().filter(id=self.kwargs['id']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None
+        return make_etag(self.kwargs['id'], updated_at.isoformat()), updated_at
+
+
+def search_page_response(request, results, cursor, tier):
+    """Serialize one page of search results with the cursor for the next page."""
+    fields = parse_fields(request, ProductSearchResultSerializer.Meta.fields)
+    with timed('serialize'):
+        result_data = ProductSearchResultSerializer(results, many=True, context={'fields': fields}).data
+    next_url = None
+    if cursor:
+        params = {'cursor': cursor}
+        if fields:
+            params[FIELDS_PARAM] = ','.join(fields)
+        next_url = request.build_absolute_uri(f"{reverse('product-search-page')}?{urlencode(params)}")
+    return Response({
+        'results': result_data,
+        'count': len(results),
+        'cursor': cursor,
+        'next': next_url,
+        'tier': tier
+    }, status=status.HTTP_200_OK)
+
+
+def ranked_response(request, results, candidates, position, limit, tier, scored=False,
+                    message='No similar products found.'):
+    """
+    First page of a search, with a cursor over the candidates left after
+    ``position`` (see store_candidates for ``scored``).
+    """
+    if not results:
+        return Response({
+            'results': [],
+            'message': message,
+            'tier': tier
+        }, status=status.HTTP_200_OK)
+
+    cursor = None
+    if position < len(candidates):
+        token = store_candidates(candidates, tier, scored)
+        if token is not None:
+            cursor = encode_cursor(token, position, limit)
+    return search_page_response(request, results, cursor, tier)
+
 
 class ProductImageSearchAPIView(APIView):
     """
@@ -88,61 +188,62 @@ class ProductImageSearchAPIView(APIView):
     Accepts an uploaded image and returns similar products.
     """
     permission_classes = [AllowAny]
+    input_serializer_class = ImageSearchSerializer
     
     @swagger_auto_schema(request_body=ImageSearchSerializer)
     def post(self, request, *args, **kwargs):
-        serializer = ImageSearchSerializer(data=request.data)
+        # Per-stage timings go to the search_stage_seconds histogram and back
+        # to the client in a Server-Timing header
+        with track_request() as timings:
+            with timed('total'):
+                response = self.handle_search(request)
+        response['Server-Timing'] = timings.header()
+        return response
+
+    def handle_search(self, request):
+        # Reject a bad ?fields= before any search work
+        parse_fields(request, ProductSearchResultSerializer.Meta.fields)
+        with timed('upload'):
+            serializer = self.input_serializer_class(data=request.data)
+            is_valid = serializer.is_valid()
         
-        if not serializer.is_valid():
+        if not is_valid:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        self.search_params = serializer.validated_data
         
         uploaded_image = serializer.validated_data['image']
         limit = serializer.validated_data.get('limit', 10)
-        
+        min_similarity = serializer.validated_data.get(
+            'min_similarity', getattr(settings, 'SEARCH_MIN_SIMILARITY', None))
+
+        # Inference is CPU bound, so only a few searches run at once and the rest
+        # wait in a bounded queue. Shed load early rather than letting p99 explode.
+        controller = get_admission_controller()
+        try:
+            with controller.admit(get_client_key(request)) as waited:
+                record('queue', waited)
+                # Under load, trade a little accuracy for throughput instead of rejecting
+                tier = get_quality_governor().select(controller.queue_depth)
+                return self.search(request, uploaded_image, limit, tier, min_similarity)
+        except AdmissionRejected as e:
+            response = Response({'error': e.reason}, status=e.status_code)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+    def search(self, request, uploaded_image, limit, tier, min_similarity=None):
         # Save uploaded image to temporary file
         temp_file = None
         try:
             # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            for chunk in uploaded_image.chunks():
-                temp_file.write(chunk)
-            temp_file.close()
+            with timed('spool'):
+                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
+                for chunk in uploaded_image.chunks():
+                    temp_file.write(chunk)
+                temp_file.close()
             
             # Generate embedding for the uploaded image
-            query_embedding = generate_image_embedding(temp_file.name)
-            
-            # Search for similar products
-            search_results = search_similar_products(query_embedding, k=limit)
-            
-            if not search_results:
-                return Response({
-                    'results': [],
-                    'message': 'No similar products found.'
-                }, status=status.HTTP_200_OK)
-            
-            # Fetch products and attach similarity scores
-            product_ids = [pid for pid, _ in search_results]
-            products = Product.objects.filter(id__in=product_ids)
-            
-            # Create a mapping of product_id to distance
-            distance_map = {pid: distance for pid, distance in search_results}
-            
-            # Attach similarity scores and sort by distance
-            results = []
-            for product in products:
-                distance = distance_map.get(product.id, float('inf'))
-                product.similarity_score = 1.0 / (1.0 + distance)
-                results.append(product)
-            
-            # Sort by similarity score descending
-            results.sort(key=lambda x: x.similarity_score, reverse=True)
-
-            result_serializer = ProductSearchResultSerializer(results, many=True)
-            
-            return Response({
-                'results': result_serializer.data,
-                'count': len(results)
-            }, status=status.HTTP_200_OK)
+            query_embedding = generate_image_embedding(temp_file.name, **tier.embedding_kwargs())
+            return self.rank(request, query_embedding, limit, tier, min_similarity)
             
         except Exception as e:
             return Response({
@@ -152,4 +253,168 @@ class ProductImageSearchAPIView(APIView):
         finally:
             # Clean up temporary file
             if temp_file and os.path.exists(temp_file.name):
-                os.unlink(temp_file.name)
\ No newline at end of file
+                os.unlink(temp_file.name)
+
+    def rank(self, request, query_embedding, limit, tier, min_similarity=None):
+        # Search for similar products, over-fetching so that inactive
+        # products can be skipped and the response still has `limit` items.
+        # The whole ranked list is kept for follow-up pages, shorter at the
+        # cheaper tiers. Products below min_similarity are cut off inside the index.
+        results, candidates, position = fetch_ranked(
+            lambda k: search_similar_products(
+                query_embedding, k=k, nprobe=tier.nprobe, min_similarity=min_similarity),
+            limit,
+            overfetch=tier.overfetch,
+            min_candidates=tier.candidate_pool(getattr(settings, 'SEARCH_CURSOR_CANDIDATES', 1000)),
+        )
+        return ranked_response(request, results, candidates, position, limit, tier.name)
+
+
+class ProductHybridSearchAPIView(ProductImageSearchAPIView):
+    """
+    API View for searching with a text query and an image together.
+    The text search and the image search each rank a bounded candidate list
+    (SEARCH_HYBRID_CANDIDATES) and the two lists are merged with reciprocal
+    rank fusion; similarity_score is the fused score. Admission control and
+    quality tiers apply as for image search.
+    """
+    input_serializer_class = HybridSearchSerializer
+
+    @swagger_auto_schema(request_body=HybridSearchSerializer)
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+    def rank(self, request, query_embedding, limit, tier, min_similarity=None):
+        size = max(limit, tier.candidate_pool(getattr(settings, 'SEARCH_HYBRID_CANDIDATES', 200)))
+        image_candidates = search_similar_products(
+            query_embedding, k=size, nprobe=tier.nprobe, min_similarity=min_similarity)
+        text_candidates = text_search(self.search_params['q'], size)
+        candidates = reciprocal_rank_fusion(
+            [text_candidates, image_candidates], k=getattr(settings, 'SEARCH_RRF_K', RRF_K))
+        results, position = hydrate_from(candidates, 0, limit, overfetch=tier.overfetch, score=float)
+        return ranked_response(request, results, candidates, position, limit, tier.name, scored=True)
+
+
+class ProductTextSearchAPIView(APIView):
+    """
+    API View for full-text search over product names and descriptions.
+    Uses the GIN indexed search vector on PostgreSQL; similarity_score is the
+    text rank. Later pages come from ProductImageSearchPageAPIView's cursor.
+    """
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(query_serializer=TextSearchSerializer)
+    def get(self, request, *args, **kwargs):
+        with track_request() as timings:
+            with timed('total'):
+                response = self.handle_search(request)
+        response['Server-Timing'] = timings.header()
+        return response
+
+    def handle_search(self, request):
+        parse_fields(request, ProductSearchResultSerializer.Meta.fields)
+        serializer = TextSearchSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        query = serializer.validated_data['q']
+        limit = serializer.validated_data['limit']
+        # Inactive products are filtered out by the query, so no over-fetching
+        results, candidates, position = fetch_ranked(
+            lambda k: text_search(query, k),
+            limit,
+            min_candidates=getattr(settings, 'SEARCH_CURSOR_CANDIDATES', 1000),
+            score=float,
+        )
+        return ranked_response(request, results, candidates, position, limit, TEXT_TIER, scored=True,
+                               message='No matching products found.')
+
+class ProductEmbeddingSearchAPIView(APIView):
+    """
+    API View for searching with an embedding computed by the client.
+    Accepts the vector as JSON (base64 of little-endian float32 bytes) or as a raw
+    application/octet-stream body with model_version and limit in the query string.
+    Upload, decode and inference are skipped entirely.
+    """
+    permission_classes = [AllowAny]
+    parser_classes = [ORJSONParser, RawEmbeddingParser]
+
+    def get(self, request, *args, **kwargs):
+        """Describe the vectors this endpoint accepts."""
+        return Response({
+            'model_version': EMBEDDING_MODEL_VERSION,
+            'dimension': EMBEDDING_DIM,
+            'dtype': 'float32',
+            'byte_order': 'little',
+        })
+
+    @swagger_auto_schema(request_body=EmbeddingSearchSerializer)
+    def post(self, request, *args, **kwargs):
+        with track_request() as timings:
+            with timed('total'):
+                response = self.handle_search(request)
+        response['Server-Timing'] = timings.header()
+        return response
+
+    def handle_search(self, request):
+        parse_fields(request, ProductSearchResultSerializer.Meta.fields)
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Raw bodies carry only the vector, so the other fields come from the query string
+        data = {**request.query_params.dict(), **request.data}
+        serializer = EmbeddingSearchSerializer(data=data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        query_embedding = serializer.validated_data['embedding']
+        limit = serializer.validated_data['limit']
+        min_similarity = serializer.validated_data.get(
+            'min_similarity', getattr(settings, 'SEARCH_MIN_SIMILARITY', None))
+        # No inference happens here, so always search at full quality
+        tier = TIERS[0]
+
+        results, candidates, position = fetch_ranked(
+            lambda k: search_similar_products(
+                query_embedding, k=k, nprobe=tier.nprobe, min_similarity=min_similarity),
+            limit,
+            overfetch=tier.overfetch,
+            min_candidates=getattr(settings, 'SEARCH_CURSOR_CANDIDATES', 1000),
+        )
+        return ranked_response(request, results, candidates, position, limit, tier.name)
+
+
+class ProductImageSearchPageAPIView(APIView):
+    """
+    API View for the follow-up pages of an image search.
+    Pages are served from the ranked candidate list kept by the original
+    search, so no inference or index search happens here.
+    """
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(query_serializer=SearchPageSerializer)
+    def get(self, request, *args, **kwargs):
+        with track_request() as timings:
+            response = self.get_page(request)
+        response['Server-Timing'] = timings.header()
+        return response
+
+    def get_page(self, request):
+        parse_fields(request, ProductSearchResultSerializer.Meta.fields)
+        serializer = SearchPageSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            token, offset, limit = decode_cursor(serializer.validated_data['cursor'])
+            candidates, tier, scored = load_candidates(token)
+        except CursorError as e:
+            code = status.HTTP_410_GONE if e.expired else status.HTTP_400_BAD_REQUEST
+            return Response({'error': str(e)}, status=code)
+
+        limit = serializer.validated_data.get('limit', limit)
+        results, position = hydrate_from(candidates, offset, limit, overfetch=1.5, score=float if scored else None)
+
+        cursor = None
+        if position < len(candidates):
+            cursor = encode_cursor(token, position, limit)
+        return search_page_response(request, results, cursor, tier)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CatalogueConfig(AppConfig):
     name = 'catalogue'
+
+    def ready(self):
+        from catalogue import checks, signals  # noqa: F401
@@ -0,0 +1,26 @@
+import hmac
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates Prometheus scrapes by the METRICS_TOKEN bearer token.
+
+    Any other Authorization header is left to the next authentication class,
+    so staff users keep signing in with their JWT.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if not token:
+            return None
+        scheme, _, credentials = get_authorization_header(request).partition(b' ')
+        if scheme.lower() != self.keyword or not hmac.compare_digest(credentials.strip(), token.encode()):
+            return None
+        return AnonymousUser(), token
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="metrics"'
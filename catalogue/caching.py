@@ -0,0 +1,94 @@
+"""
+Response cache for the public catalogue lists.
+
+Cached responses are keyed by a catalogue generation number. Any change to
+a Product or Category bumps the generation (see catalogue.signals), which
+orphans every cached page at once: invalidation is one counter increment,
+with no key scans, and the orphaned entries simply expire.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from catalogue.conditional import is_conditional
+
+GENERATION_KEY = 'catalogue:generation'
+RESPONSE_KEY = 'catalogue:response:{generation}:{digest}'
+
+
+def get_generation():
+    """Current catalogue generation; starts at the current time so a lost counter never reuses old keys."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Invalidate every cached catalogue response. Returns the new generation."""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Counter evicted or never set: start a fresh, larger one
+        get_generation()
+        return cache.incr(GENERATION_KEY)
+
+
+def response_cache_key(request, view_name):
+    """
+    Cache key of a list request: the view, the host (links in the response
+    are absolute), the path and the query parameters with their order and
+    empty values normalized away. The page cursor is one of the parameters.
+    """
+    params = sorted(
+        (name, value) for name, values in request.query_params.lists() for value in values if value != ''
+    )
+    raw = '\n'.join([view_name, request.get_host(), request.path] + [f'{name}={value}' for name, value in params])
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    return RESPONSE_KEY.format(generation=get_generation(), digest=digest)
+
+
+class CachedListMixin:
+    """
+    Serve ``list`` from the catalogue response cache.
+
+    Only successful responses are stored, for CATALOGUE_CACHE_TIMEOUT
+    seconds (0 disables the cache). Responses carry ``X-Cache: HIT`` or ``MISS``.
+    """
+    def list(self, request, *args, **kwargs):
+        timeout = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return super().list(request, *args, **kwargs)
+
+        key = response_cache_key(request, type(self).__name__)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def cached_validators(self, request, compute):
+        """
+        Conditional GET validators of a list request (see catalogue.conditional),
+        cached beside its response so that cache hits stay free of queries.
+        ``compute`` is called on a miss. With the cache off it is only called
+        for conditional requests: a plain GET gets (None, None).
+        """
+        timeout = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return compute() if is_conditional(request) else (None, None)
+
+        key = response_cache_key(request, type(self).__name__) + ':validators'
+        validators = cache.get(key)
+        if validators is None:
+            validators = compute()
+            cache.set(key, validators, timeout)
+        return validators
@@ -0,0 +1,148 @@
+"""
+Shared cache of serialized product cards.
+
+A card is ProductSerializer's representation of one product, rendered
+without a request so that image URLs are relative (see render_card). Cards
+are keyed by product id and ``updated_at``: an edited product gets a new
+key, so a stale card is never served and nothing needs invalidating.
+
+There are two tiers, a small per-process LRU in front of the Django cache
+(Redis when CACHE_REDIS_URL is set). Lookups are batched per response: one
+``get_many`` for the cards missing locally, and one query for the products
+missing from both tiers.
+"""
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from catalogue.images import derivative_urls
+from catalogue.models import Product
+from catalogue.serializers.product_serializers import ProductSerializer
+
+CARD_KEY = 'catalogue:card:{id}:{version}'
+
+
+class LRUCache:
+    """A thread safe, size bounded mapping that drops the least recently used entries."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ProductCardCache:
+    """
+    Two-tier cache of product cards.
+
+    Args:
+        local_size: cards kept in this process's LRU
+        timeout: seconds cards are kept in the shared cache; 0 skips it
+    """
+
+    def __init__(self, local_size=2048, timeout=3600):
+        self.local = LRUCache(local_size)
+        self.timeout = timeout
+
+    @staticmethod
+    def key(product_id, updated_at):
+        return CARD_KEY.format(id=product_id, version=updated_at.isoformat())
+
+    def get_cards(self, versions):
+        """
+        Cards of the given product versions.
+
+        Args:
+            versions: dict of product id to its updated_at
+
+        Returns:
+            dict: product id to card, for the products that still exist
+        """
+        cards = {}
+        missing = {}
+        for product_id, updated_at in versions.items():
+            key = self.key(product_id, updated_at)
+            card = self.local.get(key)
+            if card is None:
+                missing[key] = product_id
+            else:
+                cards[product_id] = card
+
+        if missing and self.timeout:
+            for key, card in cache.get_many(list(missing)).items():
+                cards[missing.pop(key)] = card
+                self.local.set(key, card)
+
+        if missing:
+            products = Product.objects.in_bulk(list(missing.values()))
+            rendered = {}
+            for product_id in missing.values():
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                card = dict(ProductSerializer(product).data)
+                # Keyed by the row just read, which may be newer than the version asked for
+                key = self.key(product_id, product.updated_at)
+                rendered[key] = cards[product_id] = card
+                self.local.set(key, card)
+            if rendered and self.timeout:
+                cache.set_many(rendered, self.timeout)
+        return cards
+
+    def cards_for_ids(self, product_ids):
+        """Cards of products given by id, at the cost of one query for their versions."""
+        versions = dict(Product.objects.filter(id__in=set(product_ids)).values_list('id', 'updated_at'))
+        return self.get_cards(versions)
+
+    def cards_for_products(self, products):
+        """Cards of loaded products; only ``id`` and ``updated_at`` need to have been loaded."""
+        return self.get_cards({product.id: product.updated_at for product in products})
+
+
+def render_card(card, request=None):
+    """A copy of a card for one response, with absolute image URLs when there is a request."""
+    card = dict(card)
+    if request is not None:
+        if card.get('image'):
+            card['image'] = request.build_absolute_uri(card['image'])
+        if card.get('images'):
+            card['images'] = derivative_urls(card['images'], request.build_absolute_uri)
+    return card
+
+
+_CARD_CACHE = None
+
+
+def get_card_cache():
+    global _CARD_CACHE
+    if _CARD_CACHE is not None:
+        return _CARD_CACHE
+
+    _CARD_CACHE = ProductCardCache(
+        local_size=getattr(settings, 'PRODUCT_CARD_CACHE_SIZE', 2048),
+        timeout=getattr(settings, 'PRODUCT_CARD_CACHE_TIMEOUT', 3600),
+    )
+    return _CARD_CACHE
@@ -0,0 +1,113 @@
+"""
+Category subtrees and the nested category tree.
+
+Every category stores its materialized path ("/1/5/12/", see
+Category.path), so a subtree is one prefix match. The slug -> (id, path)
+index of all categories is cached under the catalogue generation (see
+catalogue.caching), which lets the product list turn ``category_slug``
+into a ``category_id IN (...)`` filter on the product category index
+without joining categories at all. With the cache off, the subtree ids
+come from one ``path LIKE`` query instead of a read of the whole table.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Subquery
+from rest_framework.response import Response
+from catalogue.caching import get_generation
+from catalogue.fastpath import ValuesSerializer
+from catalogue.models import Category
+
+INDEX_KEY = 'catalogue:category-index:{generation}'
+TREE_PARAM = 'tree'
+
+
+def _index_timeout():
+    return getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+
+
+def category_index():
+    """{slug: (id, path)} of every category, cached for CATALOGUE_CACHE_TIMEOUT seconds (0 disables)."""
+    timeout = _index_timeout()
+    key = INDEX_KEY.format(generation=get_generation()) if timeout else None
+    index = cache.get(key) if key else None
+    if index is None:
+        index = {slug: (category_id, path)
+                 for category_id, slug, path in Category.objects.values_list('id', 'slug', 'path')}
+        if key:
+            cache.set(key, index, timeout)
+    return index
+
+
+def _subtree_queryset(slug):
+    """
+    Categories in the subtree of ``slug`` as one query, for when the index is
+    not cached: the path of ``slug`` is a subquery of the prefix match. A
+    category with no path yet only matches itself.
+    """
+    path = Category.objects.filter(slug=slug).exclude(path='').values('path')[:1]
+    return Category.objects.filter(Q(slug=slug) | Q(path__startswith=Subquery(path)))
+
+
+def subtree_ids(slug):
+    """
+    Ids of the category ``slug`` and all of its descendants.
+
+    Returns:
+        list: the ids, empty for an unknown slug
+    """
+    if not _index_timeout():
+        return list(_subtree_queryset(slug).values_list('id', flat=True))
+    index = category_index()
+    if slug not in index:
+        return []
+    category_id, path = index[slug]
+    if not path:
+        # Created without save() and never rebuilt: only the category itself is known
+        return [category_id]
+    return [descendant_id for descendant_id, descendant_path in index.values()
+            if descendant_path.startswith(path)]
+
+
+def filter_subtree(queryset, slug, field='category_id'):
+    """Products (or any rows with a category ``field``) in the subtree of ``slug``."""
+    ids = subtree_ids(slug)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(**{f'{field}__in': ids})
+
+
+def build_tree(items):
+    """
+    Nest serialized categories under their parents.
+
+    Args:
+        items: serialized categories with ``id`` and ``parent``, in sibling order
+
+    Returns:
+        list: the roots, each with a ``children`` list; a category whose parent
+        is not among ``items`` is a root
+    """
+    nodes = {item['id']: {**item, 'children': []} for item in items}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent'])
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
+
+
+class CategoryTreeMixin:
+    """
+    ``?tree=true`` answers ``list`` with the whole nested tree rather than the
+    flat list, read in one query; pagination does not apply to it.
+    """
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(TREE_PARAM, '').lower() not in ('1', 'true', 'yes'):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if getattr(settings, 'CATALOGUE_FAST_LISTS', False):
+            serializer = ValuesSerializer(self.get_serializer_class(), context=self.get_serializer_context())
+            items = serializer.to_representation(serializer.values(queryset))
+        else:
+            items = self.get_serializer(queryset, many=True).data
+        return Response(build_tree(items))
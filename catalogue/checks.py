@@ -0,0 +1,15 @@
+from django.core.checks import Warning, register
+from catalogue.search.cursors import cursor_cache_is_shared, cursors_enabled
+
+
+@register()
+def search_cursor_cache_check(app_configs, **kwargs):
+    """Search cursors kept in a per-process cache return 410 once a page reaches another worker."""
+    if cursors_enabled() and not cursor_cache_is_shared():
+        return [Warning(
+            'Search cursors are stored in a per-process cache.',
+            hint='Set CACHE_REDIS_URL (or SEARCH_CURSOR_CACHE to a shared cache), or SEARCH_CURSOR_TTL=0 '
+                 'when more than one process serves the API.',
+            id='catalogue.W001',
+        )]
+    return []
@@ -0,0 +1,107 @@
+"""
+Facet counts for the product list.
+
+Category counts, a price histogram and in/out of stock counts all come
+from one grouped aggregate: the filtered products are grouped by
+(category, price bucket, in stock) and every facet is summed from those
+groups in Python. There are at most categories x buckets x 2 groups,
+however many products match.
+
+Results are cached per filter signature under the catalogue generation
+(see catalogue.caching), so a product or category change invalidates them.
+"""
+import hashlib
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from catalogue.caching import get_generation
+
+FACETS_KEY = 'catalogue:facets:{generation}:{digest}'
+
+
+def price_buckets():
+    """Upper bounds of the price histogram buckets, ascending; a last bucket has no bound."""
+    return sorted(getattr(settings, 'PRODUCT_FACET_PRICE_BUCKETS', (25, 50, 100, 250, 500, 1000)))
+
+
+def compute_facets(queryset, bounds=None):
+    """
+    Facet counts of a product queryset, with a single query.
+
+    Args:
+        queryset: the filtered products
+        bounds: ascending price bucket upper bounds, default price_buckets()
+
+    Returns:
+        dict: ``total``, ``categories`` (id, slug, name, count; most products
+        first), ``price`` (min, max, count per bucket, empty ones included)
+        and ``stock`` (in_stock, out_of_stock)
+    """
+    bounds = price_buckets() if bounds is None else bounds
+    bucket = Case(
+        *[When(price__lt=bound, then=Value(number)) for number, bound in enumerate(bounds)],
+        default=Value(len(bounds)), output_field=IntegerField(),
+    )
+    in_stock = Case(When(Q(stock_quantity__gt=0), then=Value(1)), default=Value(0), output_field=IntegerField())
+    groups = (
+        queryset.order_by()
+        .annotate(price_bucket=bucket, in_stock=in_stock)
+        .values('category_id', 'category__slug', 'category__name', 'price_bucket', 'in_stock')
+        .annotate(count=Count('id'))
+    )
+
+    total = 0
+    categories = {}
+    category_counts = defaultdict(int)
+    bucket_counts = defaultdict(int)
+    stock_counts = defaultdict(int)
+    for group in groups:
+        count = group['count']
+        total += count
+        if group['category_id'] is not None:
+            categories[group['category_id']] = (group['category__slug'], group['category__name'])
+            category_counts[group['category_id']] += count
+        bucket_counts[group['price_bucket']] += count
+        stock_counts[group['in_stock']] += count
+
+    lower_bounds = [0] + list(bounds)
+    upper_bounds = list(bounds) + [None]
+    return {
+        'total': total,
+        'categories': sorted(
+            ({'id': category_id, 'slug': slug, 'name': name, 'count': category_counts[category_id]}
+             for category_id, (slug, name) in categories.items()),
+            key=lambda facet: (-facet['count'], facet['name']),
+        ),
+        'price': [
+            {'min': low, 'max': high, 'count': bucket_counts[number]}
+            for number, (low, high) in enumerate(zip(lower_bounds, upper_bounds))
+        ],
+        'stock': {'in_stock': stock_counts[1], 'out_of_stock': stock_counts[0]},
+    }
+
+
+def filter_signature(filters):
+    """Digest of a filter combination, independent of parameter order."""
+    raw = '\n'.join(f'{name}={value}' for name, value in sorted(filters.items()))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_facets(queryset, filters):
+    """
+    compute_facets, cached for CATALOGUE_CACHE_TIMEOUT seconds (0 disables)
+    under the signature of the filters that produced ``queryset``.
+    """
+    timeout = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+    if not timeout:
+        return compute_facets(queryset)
+
+    bounds = ','.join(str(bound) for bound in price_buckets())
+    key = FACETS_KEY.format(generation=get_generation(),
+                            digest=filter_signature({**filters, 'price_buckets': bounds}))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, timeout)
+    return facets
@@ -0,0 +1,140 @@
+"""
+Lean serialization for the read-only catalogue lists.
+
+A ModelSerializer builds a model instance per row and then walks every
+field through ``get_attribute`` and ``to_representation``. For a flat,
+read-only serializer that is mostly overhead. ValuesSerializer reads the
+same columns with ``values()`` and only keeps the conversions that change
+a value (decimals, datetimes, file URLs). The per-row work DRF repeats for
+those, looking up the current time zone and joining media URLs, is done
+once per response.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import fields as drf_fields
+from rest_framework.settings import api_settings
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (drf_fields.CharField, drf_fields.IntegerField, drf_fields.BooleanField)
+
+
+class ValuesSerializer:
+    """
+    Serializes ``values()`` rows exactly as a flat ModelSerializer would.
+
+    Supported fields are the ones of a plain ``fields = '__all__'`` style
+    serializer: model columns, primary key relations and files, plus fields
+    with a ``values_converter(model_field)`` method returning the conversion
+    of their column's values. Anything
+    else (nested serializers, method fields, dotted sources) raises
+    ImproperlyConfigured, so a serializer change cannot silently diverge.
+
+    Args:
+        serializer_class: the ModelSerializer to mirror
+        context: its serializer context; the request makes file URLs absolute
+    """
+
+    def __init__(self, serializer_class, context=None):
+        serializer = serializer_class(context=context or {})
+        model = serializer.Meta.model
+        self.columns = []
+        self.converters = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} has no column to read')
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} has no column to read')
+
+            if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+                convert = None
+            elif hasattr(field, 'values_converter'):
+                # Fields converting their own column, e.g. ImageDerivativesField
+                convert = field.values_converter(model_field)
+            elif isinstance(field, drf_fields.FileField):
+                convert = self.file_converter(field, model_field.storage)
+            elif isinstance(field, drf_fields.DateTimeField):
+                convert = self.datetime_converter(field)
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                convert = None
+            elif isinstance(field, (drf_fields.DecimalField, drf_fields.DateField,
+                                    drf_fields.FloatField, drf_fields.UUIDField)):
+                convert = field.to_representation
+            else:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} is not supported')
+            self.columns.append((name, model_field.attname))
+            self.converters.append(convert)
+
+    @staticmethod
+    def file_converter(field, storage):
+        """FileField.to_representation of a stored name."""
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return lambda name: name or None
+        request = field.context.get('request')
+        base_url = storage.base_url if isinstance(storage, FileSystemStorage) else None
+
+        def convert(name):
+            if not name:
+                return None
+            path = filepath_to_uri(name).lstrip('/')
+            if base_url is None or not base_url.endswith('/') or '/.' in f'/{path}':
+                url = storage.url(name)
+                return request.build_absolute_uri(url) if request is not None else url
+            # What FileSystemStorage.url and build_absolute_uri return for a plain relative path
+            return prefix + path
+
+        if base_url is not None:
+            prefix = request.build_absolute_uri(base_url) if request is not None else base_url
+        return convert
+
+    @staticmethod
+    def datetime_converter(field):
+        """DateTimeField.to_representation, with the time zone resolved once rather than per value."""
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if not settings.USE_TZ or output_format is None or output_format.lower() != drf_fields.ISO_8601:
+            return field.to_representation
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+        def convert(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def values(self, queryset):
+        """The queryset as rows of the columns this serializer reads."""
+        return queryset.values(*[column for _, column in self.columns])
+
+    def to_representation(self, rows):
+        plan = [(name, column, convert) for (name, column), convert in zip(self.columns, self.converters)]
+        return [
+            {name: row[column] if convert is None or row[column] is None else convert(row[column])
+             for name, column, convert in plan}
+            for row in rows
+        ]
+
+
+class ValuesListMixin:
+    """
+    Serve ``list`` through ValuesSerializer, mirroring the view's serializer.
+
+    Only when CATALOGUE_FAST_LISTS is set; otherwise the ModelSerializer path serves the list.
+    """
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'CATALOGUE_FAST_LISTS', False):
+            return super().list(request, *args, **kwargs)
+
+        serializer = ValuesSerializer(self.get_serializer_class(), context=self.get_serializer_context())
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
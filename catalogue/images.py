@@ -0,0 +1,106 @@
+"""
+Resized copies of product images for listing pages.
+
+Lists show product images far smaller than the uploads, so every image is
+also stored at a few bounding-box sizes, in WebP and JPEG. The ingest task
+(catalogue.tasks.generate_embedding) makes them from the same decoded image
+as the embedding input, and the product keeps their storage names in
+``image_derivatives`` as ``{size: {format: name}}``. Serializers expose
+them as URLs (ProductSerializer ``images``).
+"""
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+# Format name -> (PIL format, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_sizes():
+    """Longest side of each derivative, in pixels, largest first."""
+    return sorted(getattr(settings, 'PRODUCT_IMAGE_SIZES', (640, 320, 160)), reverse=True)
+
+
+def derivative_formats():
+    formats = tuple(getattr(settings, 'PRODUCT_IMAGE_FORMATS', ('webp', 'jpeg')))
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown image format(s): {', '.join(unknown)}")
+    return formats
+
+
+def derivative_name(image_name, size, format_name):
+    """Storage name of a derivative: product_images/chair.jpg -> product_images/derivatives/chair_320.webp"""
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'derivatives', f'{stem}_{size}.{FORMATS[format_name][1]}')
+
+
+def make_derivatives(image, image_name, storage, sizes=None, formats=None):
+    """
+    Resize a decoded image to every derivative size and store each in every format.
+
+    Each size is scaled down from the previous, larger one rather than from
+    the original, and images are never scaled up.
+
+    Args:
+        image: the decoded RGB PIL image
+        image_name: storage name of the original image
+        storage: storage the derivatives are written to
+        sizes: longest sides, default derivative_sizes()
+        formats: format names, default derivative_formats()
+
+    Returns:
+        dict: {str(size): {format name: storage name}}
+    """
+    sizes = derivative_sizes() if sizes is None else sorted(sizes, reverse=True)
+    formats = derivative_formats() if formats is None else formats
+    quality = getattr(settings, 'PRODUCT_IMAGE_QUALITY', 80)
+
+    derivatives = {}
+    resized = image
+    for size in sizes:
+        if max(resized.size) > size:
+            resized = resized.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+        derivatives[str(size)] = {}
+        for format_name in formats:
+            pil_format, _, options = FORMATS[format_name]
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, quality=quality, **options)
+            name = derivative_name(image_name, size, format_name)
+            # Overwrite the derivatives of an earlier run instead of piling up renamed copies
+            if storage.exists(name):
+                storage.delete(name)
+            derivatives[str(size)][format_name] = storage.save(name, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def save_derivatives(product, image):
+    """
+    Make the derivatives of a product's image and record them on the product.
+
+    Saving bumps ``updated_at``, so cached cards and list responses pick up
+    the new URLs. Derivatives of sizes or formats no longer configured are deleted.
+    """
+    storage = product.image.storage
+    old_names = {name for formats in (product.image_derivatives or {}).values() for name in formats.values()}
+    product.image_derivatives = make_derivatives(image, product.image.name, storage)
+    product.save(update_fields=['image_derivatives', 'updated_at'])
+    new_names = {name for formats in product.image_derivatives.values() for name in formats.values()}
+    for name in old_names - new_names:
+        storage.delete(name)
+    return product.image_derivatives
+
+
+def derivative_urls(derivatives, url):
+    """``{size: {format: url}}`` of stored derivatives, with ``url`` mapping a storage name to its URL."""
+    return {
+        size: {format_name: url(name) for format_name, name in formats.items()}
+        for size, formats in (derivatives or {}).items()
+    }
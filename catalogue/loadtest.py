@@ -0,0 +1,377 @@
+"""
+End-to-end HTTP load generator for the API.
+
+Virtual users run concurrently on one asyncio event loop, each over its own
+keep-alive HTTP/1.1 connection, and pick scenarios from a weighted mix:
+
+    search    POST products/search/upload/ with a small JPEG
+    products  GET products/, then a few pages further by the next cursor
+    cart      POST cart/items/
+    checkout  POST cart/items/, then POST orders/
+
+Each scenario is run as the next of the seeded shoppers in turn, since a
+user may only hold three carts and every checkout freezes one.
+
+Every response is recorded per endpoint: latency, status and, when the
+server runs with QUERY_COUNT_HEADER, the number of SQL queries it made.
+"""
+import asyncio
+import io
+import itertools
+import json
+import random
+import time
+import uuid
+from urllib.parse import urlsplit
+import numpy as np
+
+SCENARIOS = ('search', 'products', 'cart', 'checkout')
+DEFAULT_MIX = {'search': 1, 'products': 6, 'cart': 2, 'checkout': 1}
+API_PREFIX = '/api/v1/'
+LOADTEST_PASSWORD = 'load-test-password'
+
+
+def parse_mix(value):
+    """Parse ``search=1,products=6`` into a dict of scenario weights."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r}, expected one of {SCENARIOS}')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('The scenario mix needs at least one positive weight')
+    return mix
+
+
+def make_search_image(size=224, seed=0):
+    """A small random JPEG to upload to the image search."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(size, size, 3), dtype='uint8')
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def multipart_body(fields, files):
+    """Encode form fields and (name, filename, content type, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content_type, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HTTPConnection:
+    """
+    Minimal keep-alive HTTP/1.1 client on asyncio streams.
+
+    The connection is reopened whenever the server closes it, so it also
+    works against servers that answer every request with Connection: close.
+    """
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Send one request. Returns (status, headers with lower-case names, body)."""
+        return await asyncio.wait_for(self._request(method, path, headers or {}, body), self.timeout)
+
+    async def _request(self, method, path, headers, body):
+        for attempt in range(2):
+            await self._connect()
+            lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                     f'Content-Length: {len(body)}']
+            lines += [f'{name}: {value}' for name, value in headers.items()]
+            try:
+                self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+                await self._writer.drain()
+                status_line = await self._reader.readline()
+                if not status_line:
+                    raise ConnectionResetError('Server closed the connection')
+                break
+            except ConnectionError:
+                # Stale keep-alive connection; retry once on a fresh one
+                await self.close()
+                if attempt:
+                    raise
+
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            content = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            content = await self._reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await self._reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, content
+
+
+class LoadStats:
+    """Per-endpoint latencies, statuses, errors and SQL query counts."""
+    def __init__(self):
+        self.endpoints = {}
+        self.started = None
+        self.finished = None
+
+    def _endpoint(self, name):
+        return self.endpoints.setdefault(name, {'latencies': [], 'statuses': {}, 'errors': 0, 'queries': []})
+
+    def record(self, name, seconds, status=None, queries=None, error=False):
+        endpoint = self._endpoint(name)
+        endpoint['latencies'].append(seconds)
+        key = str(status) if status is not None else 'exception'
+        endpoint['statuses'][key] = endpoint['statuses'].get(key, 0) + 1
+        if error:
+            endpoint['errors'] += 1
+        if queries is not None:
+            endpoint['queries'].append(queries)
+
+    def report(self):
+        """
+        Summarize the run.
+
+        Returns:
+            dict: duration, overall totals and, per endpoint, requests,
+            throughput, latency percentiles in ms, error rate, statuses and
+            mean/max SQL queries per request
+        """
+        now = time.perf_counter()
+        finished = self.finished if self.finished is not None else now
+        duration = finished - (self.started if self.started is not None else finished)
+        summary = {'duration_seconds': round(duration, 3), 'endpoints': {}}
+        total = errors = 0
+        for name, endpoint in sorted(self.endpoints.items()):
+            latencies = np.array(endpoint['latencies']) * 1000
+            count = len(latencies)
+            total += count
+            errors += endpoint['errors']
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if count else (0, 0, 0)
+            queries = endpoint['queries']
+            summary['endpoints'][name] = {
+                'requests': count,
+                'rps': round(count / duration, 2) if duration else None,
+                'p50_ms': round(float(p50), 2),
+                'p90_ms': round(float(p90), 2),
+                'p99_ms': round(float(p99), 2),
+                'max_ms': round(float(latencies.max()), 2) if count else 0,
+                'error_rate': round(endpoint['errors'] / count, 4) if count else 0,
+                'statuses': endpoint['statuses'],
+                'sql_queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'sql_queries_max': max(queries) if queries else None,
+            }
+        summary['requests'] = total
+        summary['rps'] = round(total / duration, 2) if duration else None
+        summary['error_rate'] = round(errors / total, 4) if total else 0
+        return summary
+
+
+class VirtualUser:
+    """
+    One simulated client: a keep-alive connection that runs scenarios.
+
+    Attributes:
+        connection (HTTPConnection): The client's keep-alive connection
+        tokens (iterator): Shared cycle of JWT access tokens; each scenario
+            runs as the next shopper
+        product_ids (list): Products the user can browse and buy
+        stats (LoadStats): Where every response is recorded
+    """
+    def __init__(self, connection, tokens, product_ids, stats, search_image, rng):
+        self.connection = connection
+        self.tokens = tokens
+        self.token = None
+        self.product_ids = product_ids
+        self.stats = stats
+        self.search_image = search_image
+        self.rng = rng
+
+    async def call(self, name, method, path, body=b'', content_type=None, auth=True):
+        """Send one request to ``path`` (under /api/v1/ unless absolute). Returns (status, body)."""
+        if not path.startswith('/'):
+            path = API_PREFIX + path
+        headers = {'Accept': 'application/json'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        if auth and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        started = time.perf_counter()
+        try:
+            status, headers, content = await self.connection.request(method, path, headers, body)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self.stats.record(name, time.perf_counter() - started, error=True)
+            await self.connection.close()
+            return None, None
+        queries = headers.get('x-query-count')
+        self.stats.record(name, time.perf_counter() - started, status,
+                          int(queries) if queries is not None else None, error=status >= 400)
+        return status, content
+
+    async def search(self):
+        body, content_type = multipart_body(
+            {'limit': 10}, [('image', 'query.jpg', 'image/jpeg', self.search_image)])
+        await self.call('POST products/search/upload/', 'POST', 'products/search/upload/', body,
+                        content_type, auth=False)
+
+    async def products(self):
+        path = 'products/'
+        for _ in range(self.rng.randint(1, 5)):
+            status, content = await self.call('GET products/', 'GET', path, auth=False)
+            if status != 200:
+                return
+            next_url = json.loads(content).get('next')
+            if not next_url:
+                return
+            parts = urlsplit(next_url)
+            path = f'{parts.path}?{parts.query}'
+
+    async def cart(self):
+        body = f'{{"product": {self.rng.choice(self.product_ids)}, "quantity": 1}}'.encode()
+        return await self.call('POST cart/items/', 'POST', 'cart/items/', body, 'application/json')
+
+    async def checkout(self):
+        status, _ = await self.cart()
+        if status == 201:
+            await self.call('POST orders/', 'POST', 'orders/', b'{}', 'application/json')
+
+
+async def _run(base_url, tokens, product_ids, mix, concurrency, duration, max_requests, seed, timeout):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    stats = LoadStats()
+    names = [name for name in SCENARIOS if mix.get(name)]
+    weights = [mix[name] for name in names]
+    search_image = make_search_image(seed=seed)
+    tokens = itertools.cycle(tokens)
+    issued = 0
+    stats.started = time.perf_counter()
+    deadline = stats.started + duration if duration else None
+
+    async def worker(number):
+        nonlocal issued
+        rng = random.Random(seed * 100_003 + number)
+        user = VirtualUser(HTTPConnection(host, port, timeout), tokens, product_ids, stats, search_image, rng)
+        try:
+            while True:
+                if deadline and time.perf_counter() >= deadline:
+                    break
+                if max_requests and issued >= max_requests:
+                    break
+                issued += 1
+                user.token = next(tokens)
+                await getattr(user, rng.choices(names, weights)[0])()
+        finally:
+            await user.connection.close()
+
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def run_load_test(base_url, tokens, product_ids, mix=None, concurrency=10, duration=30.0,
+                  max_requests=None, seed=0, timeout=30.0):
+    """
+    Drive the API at ``base_url`` and return the LoadStats of the run.
+
+    The run stops after ``duration`` seconds or ``max_requests`` scenarios,
+    whichever comes first (either may be None).
+    """
+    if not tokens or not product_ids:
+        raise ValueError('A load test needs at least one user and one product')
+    return asyncio.run(_run(base_url, tokens, product_ids, mix or DEFAULT_MIX, concurrency,
+                            duration, max_requests, seed, timeout))
+
+
+def seed_load_test_data(users=1000, products=200):
+    """
+    Make sure the load test has users and products to work with.
+
+    Users ``loadtest-<n>@example.com`` are created if missing and their
+    carts from earlier runs are dropped, and placeholder
+    products (sharing one image) are bulk created until there are at least
+    ``products`` active products.
+
+    Returns:
+        tuple: (JWT access tokens, one per user, active product ids)
+    """
+    from decimal import Decimal
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from rest_framework_simplejwt.tokens import AccessToken
+    from catalogue.caching import bump_generation
+    from catalogue.models import Cart, Category, Product
+
+    User = get_user_model()
+    emails = [f'loadtest-{number}@example.com' for number in range(users)]
+    existing = set(User.objects.filter(username__in=emails).values_list('username', flat=True))
+    password = make_password(LOADTEST_PASSWORD)
+    User.objects.bulk_create([
+        User(username=email, email=email, name=f'Load test {email.split("@")[0]}', password=password)
+        for email in emails if email not in existing
+    ], batch_size=1000)
+    load_test_users = User.objects.filter(username__in=emails)
+    tokens = [str(AccessToken.for_user(user)) for user in load_test_users.order_by('id')]
+    Cart.objects.filter(user__in=load_test_users).delete()
+
+    missing = products - Product.objects.filter(is_active=True).count()
+    if missing > 0:
+        category, _ = Category.objects.get_or_create(
+            slug='load-test', defaults={'name': 'Load test', 'description': 'Products created by load_test'})
+        image = default_storage.save('product_images/load_test.jpg', ContentFile(make_search_image(size=64)))
+        rng = random.Random(0)
+        Product.objects.bulk_create([
+            Product(name=f'Load test product {number}', sku=f'LOADTEST-{uuid.uuid4().hex[:12]}',
+                    description='Placeholder product for load testing',
+                    price=Decimal(rng.randint(100, 100_000)) / 100, stock_quantity=1_000_000,
+                    category=category, image=image)
+            for number in range(missing)
+        ], batch_size=1000)
+        bump_generation()
+
+    product_ids = list(Product.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)[:products])
+    return tokens, product_ids
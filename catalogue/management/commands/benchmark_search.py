@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalogue.search.benchmark_suite import (
+    INDEX_CONFIGS, SCALES, compare_reports, run_suite, write_report,
+)
+import json
+
+
+class Command(BaseCommand):
+    help = 'Measure recall, latency and throughput of each index configuration on synthetic embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', nargs='+', choices=SCALES, default=['10k', '100k'],
+                            help='Catalogue sizes to benchmark')
+        parser.add_argument('--configs', nargs='+', choices=INDEX_CONFIGS, default=list(INDEX_CONFIGS),
+                            help='Index configurations to benchmark')
+        parser.add_argument('--dim', type=int, default=2048, help='Embedding dimension')
+        parser.add_argument('--queries', type=int, default=1000, help='Queries per configuration')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per query, and k of recall@k')
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 4, 8],
+                            help='Concurrent client threads to measure QPS at')
+        parser.add_argument('--max-memory-gb', type=float, default=8.0,
+                            help='Skip configurations estimated to need more memory')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+        parser.add_argument('--output', default='benchmark-report.json', help='Where to write the JSON report')
+        parser.add_argument('--baseline', help='Earlier report to check for regressions against')
+        parser.add_argument('--max-slowdown', type=float, default=0.2,
+                            help='Allowed relative drop in p99 latency or QPS')
+        parser.add_argument('--max-recall-drop', type=float, default=0.01, help='Allowed absolute drop in recall')
+
+    def handle(self, *args, **options):
+        report = run_suite(
+            {scale: SCALES[scale] for scale in options['scales']},
+            options['configs'],
+            dim=options['dim'],
+            num_queries=options['queries'],
+            k=options['k'],
+            threads=options['threads'],
+            max_memory_bytes=int(options['max_memory_gb'] * 1024 ** 3),
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        write_report(report, options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare_reports(
+                baseline, report, options['max_slowdown'], options['max_recall_drop'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
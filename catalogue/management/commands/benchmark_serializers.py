@@ -0,0 +1,75 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from catalogue.fastpath import ValuesSerializer
+from catalogue.models import Category, Product
+from catalogue.renderers import ORJSONRenderer
+from catalogue.serializers.category_serializers import CategorySerializer
+from catalogue.serializers.product_serializers import ProductSerializer
+
+MODELS = {
+    'product': (Product, ProductSerializer),
+    'category': (Category, CategorySerializer),
+}
+
+
+def best_of(repeat, func):
+    """Fastest of ``repeat`` runs of func, in seconds, and its last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of the ModelSerializer + JSON path with the values() + orjson fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=MODELS, default='product', help='List to serialize')
+        parser.add_argument('--rows', type=int, default=1000, help='Rows serialized per run, newest first')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Rows per query and response, as the list endpoint pages them')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest is kept')
+
+    def handle(self, *args, **options):
+        model, serializer_class = MODELS[options['model']]
+        ids = list(model.objects.order_by('-id').values_list('id', flat=True)[:options['rows']])
+        if not ids:
+            raise CommandError(f'No {model._meta.verbose_name_plural} to serialize, run seed_db first')
+        size = options['page_size']
+        pages = [model.objects.filter(id__in=ids[i:i + size]).order_by('-id') for i in range(0, len(ids), size)]
+        values = ValuesSerializer(serializer_class)
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+
+        def model_path():
+            return [serializer_class(list(page), many=True).data for page in pages]
+
+        def values_path():
+            return [values.to_representation(list(values.values(page))) for page in pages]
+
+        model_seconds, model_data = best_of(options['repeat'], model_path)
+        values_seconds, values_data = best_of(options['repeat'], values_path)
+        json_seconds, json_bytes = best_of(options['repeat'], lambda: [json_renderer.render(d) for d in model_data])
+        orjson_seconds, orjson_bytes = best_of(options['repeat'],
+                                               lambda: [orjson_renderer.render(d) for d in values_data])
+        if json_bytes != orjson_bytes:
+            raise CommandError('The fast path rendered different bytes than the ModelSerializer path')
+
+        rows = len(ids)
+        results = [
+            ('ModelSerializer', model_seconds),
+            ('values()', values_seconds),
+            ('JSONRenderer', json_seconds),
+            ('ORJSONRenderer', orjson_seconds),
+            ('current path', model_seconds + json_seconds),
+            ('fast path', values_seconds + orjson_seconds),
+        ]
+        self.stdout.write(f"{'stage':<16} {'ms':>10} {'rows/s':>12}")
+        for name, seconds in results:
+            self.stdout.write(f'{name:<16} {seconds * 1000:>10.2f} {rows / seconds:>12.0f}')
+        speedup = (model_seconds + json_seconds) / (values_seconds + orjson_seconds)
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} {model._meta.verbose_name_plural}, identical output, fast path {speedup:.1f}x'))
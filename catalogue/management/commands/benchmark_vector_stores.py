@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from catalogue.search.benchmark import benchmark_store, synthetic_vectors
+from catalogue.search.vector_store import BACKENDS, make_vector_store
+
+
+class Command(BaseCommand):
+    help = 'Compare add, latency and throughput of the vector store backends on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=10000, help='Vectors in the store')
+        parser.add_argument('--queries', type=int, default=200, help='Queries to run')
+        parser.add_argument('--dim', type=int, default=2048, help='Vector dimension')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per query')
+        parser.add_argument('--batch-size', type=int, default=32, help='Queries per batch in the throughput run')
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+
+    def handle(self, *args, **options):
+        vectors = synthetic_vectors(options['vectors'], options['dim'], seed=0)
+        queries = synthetic_vectors(options['queries'], options['dim'], seed=1)
+
+        self.stdout.write(f"{'backend':<8} {'add s':>8} {'p50 ms':>8} {'p99 ms':>8} {'qps':>10}")
+        for backend in options['backends']:
+            result = benchmark_store(
+                make_vector_store(backend, options['dim']), vectors, queries,
+                k=options['k'], batch_size=options['batch_size'],
+            )
+            self.stdout.write(
+                f"{backend:<8} {result['add_seconds']:>8} {result['p50_ms']:>8} "
+                f"{result['p99_ms']:>8} {result['qps']:>10}"
+            )
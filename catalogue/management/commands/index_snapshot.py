@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalogue.search.snapshots import get_snapshot_store, node_status, read_manifest
+from catalogue.tasks import publish_index_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Publish the FAISS index as a snapshot, or show which version each search node serves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['publish', 'status'])
+
+    def handle(self, *args, **options):
+        store = get_snapshot_store()
+        if store is None:
+            raise CommandError('SEARCH_SNAPSHOT_DIR is not set.')
+
+        if options['action'] == 'publish':
+            version = publish_index_snapshot()
+            if version is None:
+                raise CommandError('There is no index file to publish.')
+            self.stdout.write(self.style.SUCCESS(f'Published index snapshot v{version}'))
+            return
+
+        manifest = read_manifest(store)
+        if manifest is None:
+            self.stdout.write('No snapshot has been published yet.')
+            return
+        delta = f", delta of {manifest['delta']['count']} vectors" if manifest['delta'] else ''
+        self.stdout.write(f"Published: v{manifest['version']} ({manifest['ntotal']} vectors{delta})")
+        for status in node_status(store):
+            line = f"{status['node']}: v{status['version']} (lag {status['lag']})"
+            self.stdout.write(self.style.WARNING(line) if status['lag'] else line)
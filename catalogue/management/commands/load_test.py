@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalogue.loadtest import DEFAULT_MIX, parse_mix, run_load_test, seed_load_test_data
+import json
+
+
+class Command(BaseCommand):
+    help = 'Drive a running server with a mix of search, browse, cart and checkout traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Load test shoppers to create; each can check out twice per run')
+        parser.add_argument('--products', type=int, default=200, help='Active products to make sure exist')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users sending requests at once')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run for')
+        parser.add_argument('--requests', type=int, help='Stop after this many scenarios instead')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                            help='Scenario weights, e.g. search=1,products=6,cart=2,checkout=1')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per request timeout in seconds')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the scenario choices')
+        parser.add_argument('--output', help='Also write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Seeding load test users and products...')
+        tokens, product_ids = seed_load_test_data(options['users'], options['products'])
+        self.stdout.write(f"Running against {options['url']} with {options['concurrency']} virtual users...")
+        stats = run_load_test(
+            options['url'], tokens, product_ids, mix,
+            concurrency=options['concurrency'],
+            duration=None if options['requests'] else options['duration'],
+            max_requests=options['requests'],
+            seed=options['seed'],
+            timeout=options['timeout'],
+        )
+        report = stats.report()
+
+        self.stdout.write(f"{'endpoint':<32}{'reqs':>8}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}"
+                          f"{'errors':>9}{'sql':>7}")
+        for name, endpoint in report['endpoints'].items():
+            queries = endpoint['sql_queries_mean']
+            self.stdout.write(
+                f"{name:<32}{endpoint['requests']:>8}{endpoint['rps']:>9}{endpoint['p50_ms']:>9}"
+                f"{endpoint['p90_ms']:>9}{endpoint['p99_ms']:>9}{endpoint['error_rate']:>9.1%}"
+                f"{queries if queries is not None else '-':>7}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['requests']} requests in {report['duration_seconds']}s: "
+            f"{report['rps']} req/s, {report['error_rate']:.1%} errors"))
+        if all(endpoint['sql_queries_mean'] is None for endpoint in report['endpoints'].values()):
+            self.stdout.write('Start the server with QUERY_COUNT_HEADER=True to see SQL queries per endpoint.')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
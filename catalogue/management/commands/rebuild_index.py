@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from catalogue.models import Product, ProductEmbedding
-from catalogue.tasks import generate_image_embedding, update_faiss_index
+from catalogue.images import save_derivatives
+from catalogue.tasks import decode_image, generate_image_embedding, update_faiss_index
 import os
 import logging
 
@@ -15,6 +16,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Force regeneration of all embeddings even if they already exist',
         )
+        parser.add_argument(
+            '--derivatives',
+            action='store_true',
+            help='Also remake the resized image copies, from the same decoded image',
+        )
 
     def handle(self, *args, **options):
         force = options['force']
@@ -47,7 +53,11 @@ class Command(BaseCommand):
                     errors += 1
                     continue
                     
-                embedding = generate_image_embedding(image_path)
+                image = None
+                if options['derivatives']:
+                    image = decode_image(image_path)
+                    save_derivatives(product, image)
+                embedding = generate_image_embedding(image_path, image=image)
                 
                 # Save to database
                 ProductEmbedding.objects.update_or_create(
@@ -56,7 +66,7 @@ class Command(BaseCommand):
                 )
                 
                 # Update FAISS index
-                update_faiss_index(embedding.tolist(), product.id)
+                update_faiss_index(embedding.tolist(), product.id, product.category_id)
                 
                 count += 1
                 if count % 10 == 0:
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from catalogue.search.shards import PARTITIONS, shard_path, split_index
+from catalogue.search.sidecar_server import serve_shard
+from catalogue.tasks import INDEX_FILE, load_index
+import multiprocessing
+import os
+
+
+class Command(BaseCommand):
+    help = 'Run one search shard process per index shard on this machine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=max(getattr(settings, 'SEARCH_SHARDS', 1), 2),
+                            help='Number of shards')
+        parser.add_argument('--socket-dir', default='/tmp/eisa-shards',
+                            help='Directory for the shard sockets')
+        parser.add_argument('--partition', choices=PARTITIONS,
+                            default=getattr(settings, 'SEARCH_SHARD_PARTITION', 'hash'),
+                            help='How vectors are assigned to shards')
+        parser.add_argument('--split', action='store_true',
+                            help='First split the single index file into shard files')
+
+    def handle(self, *args, **options):
+        num_shards = options['shards']
+        if num_shards < 2:
+            raise CommandError('A sharded index needs at least 2 shards.')
+
+        if options['split']:
+            try:
+                counts = split_index(load_index(), num_shards, INDEX_FILE, options['partition'])
+            except FileExistsError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'Split {sum(counts)} vectors into shards of {counts}')
+
+        os.makedirs(options['socket_dir'], exist_ok=True)
+        sockets = [os.path.join(options['socket_dir'], f'shard-{i}.sock') for i in range(num_shards)]
+        # fork keeps the configured Django settings in every shard process
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=serve_shard, args=(sockets[i], shard_path(INDEX_FILE, i, num_shards)),
+                            name=f'search-shard-{i}', daemon=True)
+            for i in range(num_shards)
+        ]
+        for process in processes:
+            process.start()
+
+        self.stdout.write(self.style.SUCCESS(f'{num_shards} search shards running'))
+        self.stdout.write(f'SEARCH_SHARD_SOCKETS={",".join(sockets)}')
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                process.terminate()
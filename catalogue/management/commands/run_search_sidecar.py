@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from catalogue.search.sidecar_server import SearchSidecarServer
+import os
+
+
+class Command(BaseCommand):
+    help = 'Run the local search sidecar that owns the model and FAISS index for this node'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=getattr(settings, 'SEARCH_SIDECAR_SOCKET', '') or '/tmp/eisa-search.sock',
+            help='Path of the Unix domain socket to listen on',
+        )
+        parser.add_argument('--max-batch', type=int, default=16, help='Largest micro-batch')
+        parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                            help='How long a micro-batch waits for more requests')
+        parser.add_argument('--no-warmup', action='store_true',
+                            help='Load the model and index lazily instead of at startup')
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        server = SearchSidecarServer(path, options['max_batch'], options['max_wait_ms'] / 1000)
+        if not options['no_warmup']:
+            self.stdout.write('Loading model and index...')
+            server.warm_up()
+
+        self.stdout.write(self.style.SUCCESS(f'Search sidecar listening on {path}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(path):
+                os.unlink(path)
@@ -1,71 +1,158 @@
 from django.core.management.base import BaseCommand
-from catalogue.models import Category, Product
-from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.conf import settings
+from catalogue.caching import bump_generation
+from catalogue.models import Category, Product, ProductEmbedding
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw
 from io import BytesIO
 import random
 from faker import Faker
 
+CATEGORIES = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys', 'Sports', 'Beauty', 'Automotive']
+
+
+def render_image(seed, number):
+    """
+    Draw the dummy JPEG of product ``number``.
+
+    The image only depends on (seed, number), so the result is the same
+    whichever worker process draws it.
+    """
+    rng = random.Random(seed * 1_000_003 + number)
+    img_io = BytesIO()
+    color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+    img = Image.new('RGB', (600, 600), color=color)
+    draw = ImageDraw.Draw(img)
+    # Draw random usage of lines/shapes
+    for _ in range(5):
+        shape_color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        x1, x2 = sorted([rng.randint(0, 600) for _ in range(2)])
+        y1, y2 = sorted([rng.randint(0, 600) for _ in range(2)])
+        draw.rectangle([x1, y1, x2, y2], outline=shape_color, width=3)
+    img.save(img_io, format='JPEG')
+    return img_io.getvalue()
+
+
+def _render_batch(args):
+    seed, numbers = args
+    return [render_image(seed, number) for number in numbers]
+
+
 class Command(BaseCommand):
     help = 'Populate the database with dummy data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200, help='Number of products to create')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes drawing product images in parallel')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products inserted per bulk_create')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for names, prices, images and embeddings; the same seed gives the same data')
+        parser.add_argument('--embeddings', action='store_true',
+                            help='Insert synthetic ProductEmbedding vectors instead of drawing images')
+        parser.add_argument('--index', action='store_true',
+                            help='With --embeddings, also write the synthetic vectors to a new search index')
+
+    def handle(self, *args, **options):
         self.stdout.write('Seeding database...')
+        seed = options['seed']
+        total = options['products']
+        batch_size = options['batch_size']
         fake = Faker()
-        
+        fake.seed_instance(seed)
+        rng = random.Random(seed)
+
         # Clear existing data
         Product.objects.all().delete()
         Category.objects.all().delete()
-        
+
         # Create categories
-        categories = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys', 'Sports', 'Beauty', 'Automotive']
-        category_objects = []
-        for cat_name in categories:
-            cat = Category.objects.create(
+        category_objects = Category.objects.bulk_create([
+            Category(
                 name=cat_name,
                 slug=cat_name.lower().replace(' & ', '-').replace(' ', '-'),
                 description=fake.text()
             )
-            category_objects.append(cat)
-            self.stdout.write(f'Created category: {cat_name}')
-            
-        # Create products
-        for i in range(200):
-            category = random.choice(category_objects)
-            name = fake.sentence(nb_words=3).replace('.', '')
-            price = random.uniform(10.0, 1000.0)
-            stock = random.randint(0, 500)
-            
-            product = Product(
-                name=name,
-                sku=fake.ean13(),
-                description=fake.paragraph(),
-                price=round(price, 2),
-                stock_quantity=stock,
-                category=category,
-                is_active=True
-            )
-            
-            # Generate dummy image
-            img_io = BytesIO()
-            color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-            img = Image.new('RGB', (600, 600), color=color)
-            draw = ImageDraw.Draw(img)
-            # Draw random usage of lines/shapes
-            for _ in range(5):
-                shape_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-                x1, x2 = sorted([random.randint(0, 600) for _ in range(2)])
-                y1, y2 = sorted([random.randint(0, 600) for _ in range(2)])
-                draw.rectangle([x1, y1, x2, y2], outline=shape_color, width=3)
-            
-            img.save(img_io, format='JPEG')
-            
-            filename = f'product_{i+1}.jpg'
-            product.image.save(filename, ContentFile(img_io.getvalue()), save=False)
-            product.save()
-            
-            if (i + 1) % 10 == 0:
-                self.stdout.write(f'Created {i+1} products...')
-            
-        self.stdout.write(self.style.SUCCESS('Database seeded successfully with 200 products!'))
+            for cat_name in CATEGORIES
+        ])
+        # bulk_create skips Category.save(), which maintains the materialized paths
+        Category.rebuild_paths()
+        for cat in category_objects:
+            self.stdout.write(f'Created category: {cat.name}')
+
+        dataset = store = None
+        if options['embeddings']:
+            from catalogue.search.benchmark_suite import ClusteredDataset
+            from catalogue.tasks import EMBEDDING_DIM
+
+            dataset = ClusteredDataset(total, EMBEDDING_DIM, seed=seed)
+            if options['index']:
+                from catalogue.search.vector_store import make_vector_store
+                store = make_vector_store(settings.SEARCH_VECTOR_BACKEND, EMBEDDING_DIM, settings.SEARCH_METRIC)
+
+        self.workers = options['workers']
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 and dataset is None else None
+        try:
+            created = 0
+            batches = dataset.chunks(batch_size) if dataset is not None else (
+                (start, None) for start in range(0, total, batch_size))
+            for start, vectors in batches:
+                count = len(vectors) if vectors is not None else min(batch_size, total - start)
+                products = [
+                    Product(
+                        name=fake.sentence(nb_words=3).replace('.', ''),
+                        sku=fake.ean13(),
+                        description=fake.paragraph(),
+                        price=round(rng.uniform(10.0, 1000.0), 2),
+                        stock_quantity=rng.randint(0, 500),
+                        category=rng.choice(category_objects),
+                        is_active=True
+                    )
+                    for _ in range(count)
+                ]
+                if dataset is None:
+                    self.attach_images(products, start, seed, pool)
+                products = Product.objects.bulk_create(products)
+
+                if vectors is not None:
+                    ProductEmbedding.objects.bulk_create([
+                        ProductEmbedding(product=product, embedding_vector=vector.tolist())
+                        for product, vector in zip(products, vectors)
+                    ])
+                    if store is not None:
+                        store.add(vectors, [product.id for product in products])
+
+                created += count
+                self.stdout.write(f'Created {created} products...')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        # bulk_create sends no signals, so invalidate the cached catalogue lists here
+        bump_generation()
+
+        if store is not None:
+            from catalogue.search.vector_store import write_vector_store
+            from catalogue.tasks import INDEX_FILE
+
+            write_vector_store(store, INDEX_FILE)
+            self.stdout.write(f'Wrote {store.ntotal} vectors to {INDEX_FILE}')
+
+        self.stdout.write(self.style.SUCCESS(f'Database seeded successfully with {created} products!'))
+
+    def attach_images(self, products, start, seed, pool):
+        """Draw (in the pool, if any) and store the images of one batch of products."""
+        numbers = list(range(start + 1, start + len(products) + 1))
+        if pool is None:
+            images = [render_image(seed, number) for number in numbers]
+        else:
+            # Hand each worker a slice of the batch to keep the pickling overhead low
+            step = max(1, len(numbers) // (self.workers * 4))
+            slices = [(seed, numbers[i:i + step]) for i in range(0, len(numbers), step)]
+            images = [image for batch in pool.map(_render_batch, slices) for image in batch]
+
+        for product, number, image in zip(products, numbers, images):
+            # Stored directly, since bulk_create skips the model's save()
+            product.image.name = default_storage.save(f'product_images/product_{number}.jpg', ContentFile(image))
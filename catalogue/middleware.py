@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import connections
+
+
+class QueryCountMiddleware:
+    """
+    Count the SQL queries each request runs and return the count in an
+    ``X-Query-Count`` header, so load tests can spot N+1 regressions per
+    endpoint. Only active when QUERY_COUNT_HEADER is set.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_COUNT_HEADER', False):
+            return self.get_response(request)
+
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        wrapped = []
+        for alias in connections:
+            connection = connections[alias]
+            connection.execute_wrappers.append(counter)
+            wrapped.append(connection)
+        try:
+            response = self.get_response(request)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(counter)
+        response['X-Query-Count'] = str(count)
+        return response
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:46
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Keeps search_vector current on every write path, bulk_create and update() included.
+# Name matches weigh more than description matches ('A' > 'B' in ts_rank).
+CREATE_SEARCH_VECTOR = """
+CREATE FUNCTION catalogue_product_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalogue_product_search_vector
+BEFORE INSERT OR UPDATE OF name, description, search_vector ON catalogue_product
+FOR EACH ROW EXECUTE FUNCTION catalogue_product_search_vector();
+
+UPDATE catalogue_product SET search_vector =
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B');
+
+CREATE INDEX product_search_vector_idx ON catalogue_product USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS product_search_vector_idx;
+DROP TRIGGER IF EXISTS catalogue_product_search_vector ON catalogue_product;
+DROP FUNCTION IF EXISTS catalogue_product_search_vector();
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    # Other databases keep the column empty and search with icontains instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='product',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['search_vector'], name='product_search_vector_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_vector, drop_search_vector),
+            ],
+        ),
+    ]
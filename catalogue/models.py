@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 
 class Category(models.Model):
@@ -11,6 +15,8 @@ class Category(models.Model):
         slug (SlugField): The slug of the category
         description (TextField): The description of the category
         parent (ForeignKey): The parent category
+        path (CharField): Materialized path of ids from the root, e.g. "/1/5/12/",
+            maintained on save; a subtree is every category whose path starts with this one's
         created_at (DateTimeField): The date and time the category was created
         updated_at (DateTimeField): The date and time the category was updated
     """
@@ -18,12 +24,64 @@ class Category(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() \
+            if self.pk is not None else None
+        parent_path = (self.parent.path if self.parent_id is not None else '') or '/'
+        # A category can't be moved under itself or one of its descendants
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError("Category can't be moved into its own subtree")
+
+        with transaction.atomic():
+            if self.pk is not None:
+                self.path = f'{parent_path}{self.pk}/'
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'path'}
+            super().save(*args, **kwargs)
+            if old_path is None:
+                # New rows only get their id, and so their path, on insert
+                self.path = f'{parent_path}{self.pk}/'
+                Category.objects.filter(pk=self.pk).update(path=self.path)
+            elif old_path and old_path != self.path:
+                # Moved: re-root the whole subtree in one statement
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)))
+
+    def get_descendants(self, include_self=True):
+        """The subtree under this category, with one indexed prefix query."""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
+
+    @classmethod
+    def rebuild_paths(cls):
+        """Recompute every path, e.g. after bulk_create, which skips save()."""
+        parents = dict(cls.objects.values_list('id', 'parent_id'))
+        paths = {}
+
+        def path_of(category_id):
+            if category_id not in paths:
+                parent_id = parents[category_id]
+                paths[category_id] = f'{path_of(parent_id) if parent_id else "/"}{category_id}/'
+            return paths[category_id]
+
+        categories = list(cls.objects.only('id', 'path'))
+        for category in categories:
+            category.path = path_of(category.id)
+        cls.objects.bulk_update(categories, ['path'], batch_size=1000)
+
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        # The search vector is only read inside the database, so rows never carry it
+        return super().get_queryset().defer('search_vector')
+
+
 class Product(models.Model):
     """
     Product model
@@ -36,7 +94,11 @@ class Product(models.Model):
         stock_quantity (IntegerField): The stock quantity of the product
         is_active (BooleanField): Whether the product is active
         image (ImageField): The image of the product
+        image_derivatives (JSONField): Storage names of the resized copies of the image,
+            {size: {format: name}}, made at ingest (see catalogue.images)
         category (ForeignKey): The category of the product
+        search_vector (SearchVectorField): Weighted tsvector of the name and description,
+            maintained by a database trigger on PostgreSQL (see catalogue.search.text)
         created_at (DateTimeField): The date and time the product was created
         updated_at (DateTimeField): The date and time the product was updated
     """
@@ -47,10 +109,28 @@ class Product(models.Model):
     stock_quantity = models.IntegerField()
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to='product_images/')
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductManager()
+
+    class Meta:
+        # Product lists filter by category, price and stock ranges and page newest
+        # first by id (see ProductListAPIView), so each filter leads an index that
+        # ends in id.
+        indexes = [
+            models.Index(fields=['category', '-id'], name='product_category_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['stock_quantity', 'id'], name='product_stock_id_idx'),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'stock_quantity'], name='product_category_stock_idx'),
+            # Full-text search; created on PostgreSQL only (migration 0006)
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
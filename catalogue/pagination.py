@@ -0,0 +1,210 @@
+import json
+from django.core import signing
+from django.db import connections
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_SALT = 'catalogue.pagination.cursor'
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count of a queryset.
+
+    On PostgreSQL the planner's estimate is used: pg_class.reltuples for an
+    unfiltered table, otherwise the row estimate of EXPLAIN. Other databases
+    have no comparable statistics and get an exact COUNT(*).
+
+    Returns:
+        tuple: (count, True if the count is an estimate)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analyzed
+            if row and row[0] >= 0:
+                return int(row[0]), True
+            return queryset.count(), False
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows']), True
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on a unique, indexed column.
+
+    Each page is fetched with ``WHERE key < last key ORDER BY key LIMIT n``,
+    so page 5000 costs the same as page 1 and no COUNT(*) is run. The cursor
+    is signed and carries the position, the page size and the list filters,
+    so ``next`` and ``previous`` links are just ``?cursor=...`` and keep the
+    filter combination they were created with.
+
+    ``?include_count=true`` adds a ``count``, estimated where the database
+    can (see estimate_count), with ``count_is_estimate`` saying which.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'include_count'
+    # A unique, indexed field; prefix with '-' for descending order
+    ordering = '-id'
+    # Query parameters that filter the list and are carried in the cursor
+    filter_params = ()
+    # Query parameters kept beside the cursor in next and previous links
+    link_params = ()
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            dict or None: the cursor of the request ('k' position, 'r' reverse,
+            'l' page size, 'f' filters), None on the first page
+
+        Raises:
+            NotFound: If the cursor was tampered with or is malformed
+        """
+        if not hasattr(request, '_keyset_cursor'):
+            encoded = request.query_params.get(self.cursor_query_param)
+            cursor = None
+            if encoded:
+                try:
+                    data = signing.loads(encoded, salt=CURSOR_SALT)
+                    cursor = {'k': data['k'], 'r': bool(data['r']),
+                              'l': min(max(int(data['l']), 1), self.max_page_size), 'f': dict(data['f'])}
+                except (signing.BadSignature, KeyError, TypeError, ValueError):
+                    raise NotFound('Invalid cursor.')
+            request._keyset_cursor = cursor
+        return request._keyset_cursor
+
+    def encode_cursor(self, key, reverse, page_size, filters):
+        return signing.dumps({'k': key, 'r': int(reverse), 'l': page_size, 'f': filters},
+                             salt=CURSOR_SALT, compress=True)
+
+    def get_filters(self, request):
+        """The list filters of the request: those of its cursor, else its query parameters."""
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            return cursor['f']
+        return {name: request.query_params[name] for name in self.filter_params
+                if request.query_params.get(name) not in (None, '')}
+
+    def get_page_size(self, request):
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            return cursor['l']
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_page_queryset(self, queryset, request):
+        """
+        The requested page as an unevaluated queryset, in fetch order: page
+        size + 1 rows, so whether more follow can be told. Walking backwards
+        fetches in reverse order.
+        """
+        cursor = self.decode_cursor(request)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        reverse = cursor['r'] if cursor else False
+        ascending = descending == reverse
+        if cursor is not None:
+            lookup = 'gt' if ascending else 'lt'
+            queryset = queryset.filter(**{f'{field}__{lookup}': cursor['k']})
+        queryset = queryset.order_by(field if ascending else f'-{field}')
+        return queryset[:self.get_page_size(request) + 1]
+
+    @staticmethod
+    def get_key(row, field):
+        # Pages hold model instances, or dicts when paginating values()
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.filters = self.get_filters(request)
+        self.page_size_value = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = estimate_count(queryset)
+
+        field = self.ordering.lstrip('-')
+        reverse = cursor['r'] if cursor else False
+        rows = list(self.get_page_queryset(queryset, request))
+        has_more = len(rows) > self.page_size_value
+        page = rows[:self.page_size_value]
+        if reverse:
+            # Walking backwards fetched the page in reverse order
+            page.reverse()
+
+        first_key = self.get_key(page[0], field) if page else None
+        last_key = self.get_key(page[-1], field) if page else None
+        has_next = has_more if not reverse else cursor is not None
+        has_previous = has_more if reverse else cursor is not None
+        if not page and cursor is not None:
+            # Nothing left in this direction; offer the way back from the same position
+            first_key = last_key = cursor['k']
+            has_next, has_previous = reverse, not reverse
+        self.next_cursor = self.encode_cursor(last_key, False, self.page_size_value, self.filters) \
+            if has_next else None
+        self.previous_cursor = self.encode_cursor(first_key, True, self.page_size_value, self.filters) \
+            if has_previous else None
+        return page
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri(self.request.path)
+        for name in self.link_params:
+            value = self.request.query_params.get(name)
+            if value:
+                url = replace_query_param(url, name, value)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.get_link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            response['count'], response['count_is_estimate'] = self.count
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': f'Only with ?{self.count_query_param}=true'},
+                'count_is_estimate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'Cursor from a next or previous link', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results per page', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': 'Add an (estimated) total count', 'schema': {'type': 'boolean'}},
+        ]
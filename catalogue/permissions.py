@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from catalogue.authentication import MetricsTokenAuthentication
 
 
 class IsAdminUser(permissions.BasePermission):
@@ -17,3 +18,11 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         return request.user and request.user.is_authenticated and request.user.is_staff
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """
+    Custom permission to allow requests authenticated with the metrics scrape token.
+    """
+    def has_permission(self, request, view):
+        return isinstance(request.successful_authenticator, MetricsTokenAuthentication)
@@ -0,0 +1,53 @@
+"""
+Query plan checks, used to keep list queries off full table scans.
+
+``full_table_scans`` runs EXPLAIN on a queryset and returns the plan lines
+that read a whole table:
+
+- PostgreSQL: every ``Seq Scan`` node on the table.
+- SQLite: every ``SCAN`` of the table without an index, except a limited
+  walk in primary key order. A SQLite table is stored in rowid order, so
+  that walk is the same plan as PostgreSQL's index scan on the primary key
+  and stops after LIMIT rows.
+"""
+from django.db import connections
+
+
+def explain_lines(queryset):
+    """Return the EXPLAIN output of a queryset as a list of lines."""
+    return [line.strip() for line in queryset.explain().splitlines() if line.strip()]
+
+
+def _ordered_by_pk(queryset):
+    pk_names = {'pk', 'id', queryset.model._meta.pk.name}
+    order_by = [field.lstrip('-') for field in queryset.query.order_by]
+    return len(order_by) == 1 and order_by[0] in pk_names and queryset.query.high_mark is not None
+
+
+def full_table_scans(queryset, table=None):
+    """
+    Plan lines of a queryset that scan the whole of ``table``.
+
+    Args:
+        queryset: the QuerySet to check, with its ordering and slicing applied
+        table: table name to look for; defaults to the queryset model's table
+
+    Returns:
+        list of str: offending plan lines, empty when every access uses an index
+    """
+    table = table or queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    lines = explain_lines(queryset)
+
+    if vendor == 'postgresql':
+        return [line for line in lines if 'Seq Scan on' in line and (f' {table} ' in f'{line} ' or f'"{table}"' in line)]
+
+    if vendor == 'sqlite':
+        scans = [line for line in lines
+                 if f'SCAN {table}' in line and 'USING' not in line.split(f'SCAN {table}')[1]]
+        sorts = any('USE TEMP B-TREE FOR ORDER BY' in line for line in lines)
+        if scans and not sorts and _ordered_by_pk(queryset):
+            return []
+        return scans
+
+    raise NotImplementedError(f'No query plan check for {vendor}')
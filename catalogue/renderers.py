@@ -0,0 +1,37 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same JSON values several times faster with orjson.
+
+    Compact UTF-8 output is what DRF renders by default, and values orjson
+    has no native encoding for (Decimal, datetime, lazy strings...) go
+    through DRF's own encoder. Requests asking for an indented response,
+    and data orjson cannot encode, fall back to the stdlib renderer.
+
+    The bytes are the same except for floats and non-finite numbers. Floats
+    such as search similarity scores are written in orjson's shortest form:
+    ``1e-05`` becomes ``0.00001`` and ``1e+20`` becomes ``1e20``. Both forms
+    parse to the same number. NaN and infinity are rendered as null rather
+    than rejected. Decimals, the catalogue's prices, are strings either way.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None or not self.compact \
+                or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (orjson.JSONEncodeError, TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by DRF too, since they are not valid in JavaScript string literals
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,6 @@
+"""
+Serving infrastructure for the image search pipeline.
+
+The model and index helpers live in ``catalogue.tasks``; the modules in this
+package sit around them and decide how (and whether) a search request runs.
+"""
@@ -0,0 +1,258 @@
+import ipaddress
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from django.conf import settings
+from catalogue.search.metrics import Counter, Gauge, Histogram
+
+QUEUE_WAIT_SECONDS = Histogram(
+    'search_queue_wait_seconds',
+    'Time admitted searches spent waiting for a slot.',
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a search request cannot be admitted.
+
+    Attributes:
+        status_code (int): 429 when the client has too many requests queued,
+            503 when the server as a whole is saturated
+        retry_after (int): Seconds the client should wait before retrying
+        reason (str): Human readable reason for the rejection
+    """
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded, per-client fair wait queue.
+
+    At most ``max_concurrency`` requests run at once. Everything else waits in
+    a queue of at most ``max_queue`` entries, split per client so that one
+    noisy client cannot starve the others: when a slot frees up it is handed
+    to the next client in round-robin order, not to the oldest waiter overall.
+
+    Attributes:
+        max_concurrency (int): Number of requests allowed to run at once
+        max_queue (int): Total number of requests allowed to wait
+        max_queue_per_client (int): Number of requests one client may have waiting
+        queue_timeout (float): Seconds a request may wait before it is shed
+    """
+    def __init__(self, max_concurrency, max_queue, max_queue_per_client, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # client key -> deque of waiting tickets, in round-robin order
+        self._waiting = OrderedDict()
+        self._queued = 0
+        # Exponentially weighted average of how long an admitted request holds its slot
+        self._service_time = 1.0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _retry_after(self):
+        # Rough time until the current backlog drains
+        backlog = self._queued + self._in_flight
+        estimate = self._service_time * backlog / max(self.max_concurrency, 1)
+        return max(1, math.ceil(estimate))
+
+    def _reject(self, status_code, reason):
+        self.rejected += 1
+        return AdmissionRejected(status_code, self._retry_after(), reason)
+
+    def acquire(self, client):
+        """
+        Wait for a free slot.
+
+        Args:
+            client: Hashable key identifying the caller (user id or address)
+
+        Returns:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        with self._lock:
+            if self._in_flight < self.max_concurrency and self._queued == 0:
+                self._in_flight += 1
+                self._record_admission(0.0)
+                return 0.0
+            if self._queued >= self.max_queue:
+                raise self._reject(503, 'Search is overloaded, please retry later.')
+            client_queue = self._waiting.get(client, ())
+            if len(client_queue) >= self.max_queue_per_client:
+                raise self._reject(429, 'Too many concurrent searches from this client.')
+            if not client_queue:
+                client_queue = self._waiting[client] = deque()
+            ticket = threading.Event()
+            client_queue.append(ticket)
+            self._queued += 1
+
+        start = time.monotonic()
+        granted = ticket.wait(self.queue_timeout)
+        waited = time.monotonic() - start
+
+        with self._lock:
+            # The slot may have been handed over between the timeout and taking the lock
+            if granted or ticket.is_set():
+                self._record_admission(waited)
+                return waited
+            client_queue = self._waiting.get(client)
+            if client_queue is not None:
+                client_queue.remove(ticket)
+                if not client_queue:
+                    del self._waiting[client]
+            self._queued -= 1
+            self.timed_out += 1
+            raise self._reject(503, 'Timed out waiting for a search slot.')
+
+    def release(self, service_time=None):
+        """
+        Give the slot back, handing it straight to the next waiting client if any.
+
+        Args:
+            service_time (float): How long the slot was held, used to estimate Retry-After
+        """
+        with self._lock:
+            if service_time is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            if not self._waiting:
+                self._in_flight -= 1
+                return
+            client, client_queue = self._waiting.popitem(last=False)
+            ticket = client_queue.popleft()
+            if client_queue:
+                # Client goes to the back of the round-robin
+                self._waiting[client] = client_queue
+            self._queued -= 1
+            ticket.set()
+
+    def _record_admission(self, waited):
+        QUEUE_WAIT_SECONDS.observe(waited)
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    @contextmanager
+    def admit(self, client):
+        """Context manager that holds a slot for the duration of the block, yielding the wait."""
+        waited = self.acquire(client)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def stats(self):
+        """Return a snapshot of the controller's counters."""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queue_depth': self._queued,
+                'queued_clients': len(self._waiting),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait_seconds': self.total_wait / self.admitted if self.admitted else 0.0,
+                'max_wait_seconds': self.max_wait,
+                'avg_service_seconds': self._service_time,
+            }
+
+
+_CONTROLLER = None
+
+
+def get_admission_controller():
+    global _CONTROLLER
+    if _CONTROLLER is not None:
+        return _CONTROLLER
+
+    _CONTROLLER = AdmissionController(
+        max_concurrency=getattr(settings, 'SEARCH_MAX_CONCURRENCY', 2),
+        max_queue=getattr(settings, 'SEARCH_MAX_QUEUE', 16),
+        max_queue_per_client=getattr(settings, 'SEARCH_MAX_QUEUE_PER_CLIENT', 2),
+        queue_timeout=getattr(settings, 'SEARCH_QUEUE_TIMEOUT', 5.0),
+    )
+    return _CONTROLLER
+
+
+def reset_admission_controller():
+    """Drop the cached controller so it is rebuilt from settings on next use."""
+    global _CONTROLLER
+    _CONTROLLER = None
+
+
+def _controller_stat(key):
+    return lambda: get_admission_controller().stats()[key]
+
+
+Gauge('search_in_flight', 'Searches currently running.', _controller_stat('in_flight'))
+Gauge('search_queue_depth', 'Searches waiting for a slot.', _controller_stat('queue_depth'))
+Counter('search_admitted_total', 'Searches admitted since start.', _controller_stat('admitted'))
+Counter('search_rejected_total', 'Searches shed with 429/503 since start.', _controller_stat('rejected'))
+
+
+@lru_cache(maxsize=8)
+def _proxy_networks(proxies):
+    return tuple(ipaddress.ip_network(proxy.strip(), strict=False) for proxy in proxies if proxy.strip())
+
+
+def _is_trusted(address, networks):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_address(request):
+    """
+    The caller's IP address.
+
+    X-Forwarded-For is only honoured when the request comes from one of
+    SEARCH_TRUSTED_PROXIES (addresses or CIDR ranges), and then the right-most
+    hop not added by a trusted proxy is used: anything left of it was written
+    by the client and can be forged.
+    """
+    remote = request.META.get('REMOTE_ADDR', '')
+    networks = _proxy_networks(tuple(getattr(settings, 'SEARCH_TRUSTED_PROXIES', ())))
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if not forwarded or not _is_trusted(remote, networks):
+        return remote
+    hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks):
+            return hop
+    return hops[0] if hops else remote
+
+
+def get_client_key(request):
+    """Identify the caller for fair queuing: the user if logged in, else the client address."""
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{client_address(request)}'
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark for VectorStore backends.
+
+Runs the same synthetic workload against each backend: bulk add, one query
+at a time (latency) and batched queries (throughput).
+"""
+import time
+import numpy as np
+
+
+def synthetic_vectors(count, dim, seed=0):
+    """Random float32 vectors; deterministic for a given seed."""
+    return np.random.default_rng(seed).random((count, dim), dtype='float32')
+
+
+def benchmark_store(store, vectors, queries, k=10, batch_size=32):
+    """
+    Measure one backend.
+
+    Args:
+        store: empty VectorStore to fill with ``vectors``
+        vectors: array of shape (n, dim) added with ids 0..n-1
+        queries: array of shape (q, dim)
+        k: neighbours per query
+        batch_size: queries per batch_search call in the throughput run
+
+    Returns:
+        dict: add_seconds, p50_ms, p99_ms (single query latency) and qps
+        (batched throughput)
+    """
+    started = time.perf_counter()
+    store.add(vectors, np.arange(len(vectors)))
+    add_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        store.search(query, k)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        store.batch_search(queries[start:start + batch_size], k)
+    batch_seconds = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'backend': store.backend,
+        'vectors': len(vectors),
+        'add_seconds': round(add_seconds, 4),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'qps': round(len(queries) / batch_seconds, 1) if batch_seconds else None,
+    }
@@ -0,0 +1,318 @@
+"""
+Recall and latency benchmark for vector search at catalogue scale.
+
+Synthetic embeddings are drawn around random cluster centres in a
+low-dimensional latent space, projected up to the embedding dimension and
+clipped at zero, like the post-ReLU ResNet features the catalogue indexes.
+Clusters overlap and their number does not follow the IVF nlist, so the
+coarse quantizer cannot simply learn them back. The vectors are generated
+chunk by chunk from a seed, so even the 5M scale never has to be held in
+memory just to compute exact ground truth.
+
+For every index configuration and scale the suite records build time,
+memory, single query p50/p99 latency, QPS at several client thread counts
+and recall@k against exact search, and writes everything to a JSON report.
+``compare_reports`` flags regressions against an earlier report.
+"""
+import json
+import math
+import platform
+import threading
+import time
+import numpy as np
+from catalogue.search.vector_store import FaissVectorStore, make_vector_store, normalize
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '5m': 5_000_000}
+CHUNK_SIZE = 20_000
+
+# Index configurations the search layer supports. IVF variants are measured
+# at each nprobe; '{nlist}' and '{m}' are filled in from the scale and dimension.
+INDEX_CONFIGS = {
+    'flat': {'factory': 'Flat'},
+    'numpy': {'backend': 'numpy'},
+    'ivf_flat': {'factory': 'IVF{nlist},Flat', 'nprobe': (4, 16, 64)},
+    'ivf_sq8': {'factory': 'IVF{nlist},SQ8', 'nprobe': (4, 16, 64)},
+    'ivf_pq': {'factory': 'IVF{nlist},PQ{m}', 'nprobe': (4, 16, 64)},
+    'hnsw': {'factory': 'HNSW32,Flat'},
+}
+
+
+def bytes_per_vector(config, dim):
+    """Rough index memory per vector, used to skip configurations that cannot fit."""
+    factory = INDEX_CONFIGS[config].get('factory', 'Flat')
+    if 'SQ8' in factory:
+        code = dim
+    elif 'PQ' in factory:
+        code = max(dim // 32, 1)
+    else:
+        code = dim * 4
+    if factory.startswith('HNSW'):
+        # About 2 * M int32 neighbours per vector, plus its level and offset
+        code += 32 * 2 * 4 + 12
+    return code + 8
+
+
+class ClusteredDataset:
+    """
+    Deterministic clustered embeddings, produced in chunks.
+
+    Attributes:
+        count (int): Number of vectors
+        dim (int): Dimension
+        clusters (int): Number of cluster centres, the same at every scale
+        seed (int): Seed; the same seed always gives the same vectors
+        spread (float): Spread of a cluster relative to the spread of the
+            centres; at 1 neighbouring clusters overlap
+        latent_dim (int): Dimension of the space the clusters are drawn in
+    """
+    # Random streams of the seed: centres, queries, then one per block of
+    # BLOCK vectors, so the vectors do not depend on the chunk size used
+    CENTRES, QUERIES, FIRST_BLOCK = 0, 1, 2
+    BLOCK = 1000
+
+    # Isotropic noise in the full dimension averages out, leaving every
+    # cluster trivially separable at 2048 dims; real embeddings vary along far
+    # fewer directions, so the clusters are drawn in a latent space instead
+    def __init__(self, count, dim=2048, clusters=100, seed=0, spread=1.0, latent_dim=32):
+        self.count = count
+        self.dim = dim
+        self.clusters = clusters
+        self.seed = seed
+        self.spread = spread
+        self.latent_dim = latent_dim
+        rng = np.random.default_rng((seed, self.CENTRES))
+        self.centres = rng.standard_normal((clusters, latent_dim), dtype='float32')
+        self.projection = rng.standard_normal((latent_dim, dim), dtype='float32') / math.sqrt(latent_dim)
+
+    def _draw(self, size, stream):
+        rng = np.random.default_rng((self.seed, stream))
+        labels = rng.integers(self.clusters, size=size)
+        latent = self.centres[labels] + rng.standard_normal((size, self.latent_dim), dtype='float32') * self.spread
+        return normalize(np.maximum(latent @ self.projection, 0))
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Yield (first id, vectors) for consecutive chunks of about ``chunk_size`` vectors."""
+        blocks_per_chunk = max(1, chunk_size // self.BLOCK)
+        for start in range(0, self.count, blocks_per_chunk * self.BLOCK):
+            end = min(start + blocks_per_chunk * self.BLOCK, self.count)
+            blocks = [
+                self._draw(min(self.BLOCK, end - offset), self.FIRST_BLOCK + offset // self.BLOCK)
+                for offset in range(start, end, self.BLOCK)
+            ]
+            yield start, np.concatenate(blocks)
+
+    def sample(self, size):
+        """The first ``size`` vectors, e.g. for training IVF quantizers."""
+        parts = []
+        for _, vectors in self.chunks():
+            parts.append(vectors)
+            if sum(len(part) for part in parts) >= size:
+                break
+        return np.concatenate(parts)[:size]
+
+    def queries(self, size):
+        """Held-out queries from the same distribution."""
+        return self._draw(size, self.QUERIES)
+
+
+def exact_neighbours(dataset, queries, k):
+    """Ground-truth top-k ids by cosine similarity, scanning the dataset chunk by chunk."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype='float32')
+    best_ids = np.full((len(queries), k), -1, dtype='int64')
+    for start, vectors in dataset.chunks():
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        ids = np.concatenate(
+            [best_ids, np.broadcast_to(np.arange(start, start + len(vectors)), (len(queries), len(vectors)))], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def recall_at_k(found_ids, true_ids):
+    """Mean fraction of the true top-k present in the returned top-k."""
+    hits = [len(set(found[found != -1]) & set(true)) for found, true in zip(found_ids, true_ids)]
+    return float(np.mean(hits)) / true_ids.shape[1]
+
+
+def build_store(config, dataset):
+    """
+    Build and fill one index configuration.
+
+    Returns:
+        tuple: (VectorStore, build seconds)
+    """
+    import faiss
+
+    spec = INDEX_CONFIGS[config]
+    started = time.perf_counter()
+    if spec.get('backend') == 'numpy':
+        store = make_vector_store('numpy', dataset.dim, 'cosine')
+    else:
+        nlist = max(16, int(math.sqrt(dataset.count)))
+        factory = spec['factory'].format(nlist=nlist, m=max(dataset.dim // 32, 1))
+        index = faiss.index_factory(dataset.dim, factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            # Enough points for the coarse quantizer and for 256 PQ/SQ centroids
+            index.train(dataset.sample(min(dataset.count, max(50 * nlist, 10_000))))
+        store = FaissVectorStore(faiss.IndexIDMap(index))
+    for start, vectors in dataset.chunks():
+        store.add(vectors, np.arange(start, start + len(vectors)))
+    return store, time.perf_counter() - started
+
+
+def _single_thread_faiss():
+    """Pin FAISS to one OpenMP thread, as one search request would use; returns the old setting."""
+    try:
+        import faiss
+    except ImportError:
+        return None
+    previous = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)
+    return previous
+
+
+def _restore_faiss_threads(previous):
+    if previous is not None:
+        import faiss
+        faiss.omp_set_num_threads(previous)
+
+
+def measure_latency(store, queries, k, nprobe=None):
+    """Single query p50/p99 latency in milliseconds."""
+    previous = _single_thread_faiss()
+    try:
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            store.search(query, k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        _restore_faiss_threads(previous)
+    return round(float(np.percentile(latencies, 50)), 3), round(float(np.percentile(latencies, 99)), 3)
+
+
+def measure_qps(store, queries, k, threads, nprobe=None):
+    """Queries per second with ``threads`` clients each sending one query at a time."""
+    previous = _single_thread_faiss()
+    try:
+        parts = np.array_split(queries, threads)
+
+        def client(part):
+            for query in part:
+                store.search(query, k, nprobe=nprobe)
+
+        workers = [threading.Thread(target=client, args=(part,)) for part in parts]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        _restore_faiss_threads(previous)
+    return round(len(queries) / elapsed, 1) if elapsed else None
+
+
+def run_suite(scales, configs, dim=2048, num_queries=1000, k=10, threads=(1, 4, 8),
+              max_memory_bytes=8 * 1024 ** 3, seed=0, log=None):
+    """
+    Benchmark every configuration at every scale.
+
+    Args:
+        scales: dict of name to number of vectors
+        configs: names from INDEX_CONFIGS
+        max_memory_bytes: configurations estimated to need more are skipped
+        log: optional callable receiving one progress line at a time
+
+    Returns:
+        dict: the JSON-serializable report
+    """
+    import faiss
+
+    log = log or (lambda line: None)
+    report = {
+        'created_at': time.time(),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'numpy': np.__version__,
+            'faiss': faiss.__version__,
+            'faiss_threads': faiss.omp_get_max_threads(),
+        },
+        'parameters': {'dim': dim, 'queries': num_queries, 'k': k, 'threads': list(threads), 'seed': seed},
+        'results': [],
+    }
+
+    for scale, count in scales.items():
+        dataset = ClusteredDataset(count, dim, seed=seed)
+        queries = dataset.queries(num_queries)
+        log(f'{scale}: computing exact neighbours')
+        truth = exact_neighbours(dataset, queries, k)
+
+        for config in configs:
+            estimate = bytes_per_vector(config, dim) * count
+            if estimate > max_memory_bytes:
+                report['results'].append({'scale': scale, 'config': config, 'skipped': 'memory',
+                                          'estimated_memory_bytes': estimate})
+                log(f'{scale} {config}: skipped, needs about {estimate / 1024 ** 3:.1f} GB')
+                continue
+
+            store, build_seconds = build_store(config, dataset)
+            for nprobe in INDEX_CONFIGS[config].get('nprobe', (None,)):
+                found = store.batch_search(queries, k, nprobe=nprobe)[1]
+                p50, p99 = measure_latency(store, queries[:200], k, nprobe)
+                row = {
+                    'scale': scale,
+                    'vectors': count,
+                    'config': config,
+                    'nprobe': nprobe,
+                    'build_seconds': round(build_seconds, 3),
+                    'memory_bytes': store.stats()['memory_bytes'],
+                    'p50_ms': p50,
+                    'p99_ms': p99,
+                    'qps': {str(t): measure_qps(store, queries, k, t, nprobe) for t in threads},
+                    'recall_at_k': round(recall_at_k(found, truth), 4),
+                }
+                report['results'].append(row)
+                log(f"{scale} {config} nprobe={nprobe}: recall@{k}={row['recall_at_k']} "
+                    f"p99={p99}ms qps={row['qps']}")
+            del store
+    return report
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def compare_reports(baseline, current, max_slowdown=0.2, max_recall_drop=0.01):
+    """
+    List regressions of ``current`` against ``baseline``.
+
+    Rows are matched by scale, configuration and nprobe. A regression is a
+    recall drop above ``max_recall_drop``, or p99 latency or QPS (at any
+    thread count both reports measured) worse by more than ``max_slowdown``.
+
+    Returns:
+        list of str: one description per regression
+    """
+    def key(row):
+        return row['scale'], row['config'], row.get('nprobe')
+
+    previous = {key(row): row for row in baseline['results'] if 'skipped' not in row}
+    regressions = []
+    for row in current['results']:
+        old = previous.get(key(row))
+        if old is None or 'skipped' in row:
+            continue
+        name = '{} {} nprobe={}'.format(*key(row))
+        if row['recall_at_k'] < old['recall_at_k'] - max_recall_drop:
+            regressions.append(f"{name}: recall {old['recall_at_k']} -> {row['recall_at_k']}")
+        if row['p99_ms'] > old['p99_ms'] * (1 + max_slowdown):
+            regressions.append(f"{name}: p99 {old['p99_ms']}ms -> {row['p99_ms']}ms")
+        for threads, qps in row['qps'].items():
+            old_qps = old['qps'].get(threads)
+            if old_qps and qps is not None and qps < old_qps * (1 - max_slowdown):
+                regressions.append(f"{name}: qps at {threads} threads {old_qps} -> {qps}")
+    return regressions
@@ -0,0 +1,100 @@
+import secrets
+import numpy as np
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+CURSOR_SALT = 'catalogue.search.cursor'
+CACHE_KEY = 'search:candidates:{}'
+
+
+class CursorError(Exception):
+    """
+    Raised when a search cursor cannot be used.
+
+    Attributes:
+        expired (bool): True when the cursor is valid but its candidate list is gone
+    """
+    def __init__(self, message, expired=False):
+        super().__init__(message)
+        self.expired = expired
+
+
+def cursor_cache():
+    """The cache holding candidate lists, SEARCH_CURSOR_CACHE (an alias of CACHES)."""
+    return caches[getattr(settings, 'SEARCH_CURSOR_CACHE', 'default')]
+
+
+def cursors_enabled():
+    """Whether searches hand out cursors; SEARCH_CURSOR_TTL = 0 turns them off."""
+    return getattr(settings, 'SEARCH_CURSOR_TTL', 600) > 0
+
+
+def cursor_cache_is_shared():
+    """False for per-process caches, whose cursors break as soon as a page lands on another worker."""
+    return not isinstance(cursor_cache(), (LocMemCache, DummyCache))
+
+
+def store_candidates(candidates, tier, scored=False):
+    """
+    Keep a ranked candidate list so later pages need no inference or index search.
+
+    Args:
+        candidates: list of (product_id, distance) tuples, best first
+        tier: name of the quality tier that produced the list
+        scored: True when the candidates carry final scores (text and hybrid
+            search) rather than index distances
+
+    Returns:
+        str: token identifying the stored list, or None when cursors are off
+    """
+    if not cursors_enabled():
+        return None
+    token = secrets.token_urlsafe(12)
+    ids = np.array([pid for pid, _ in candidates], dtype='int64')
+    distances = np.array([distance for _, distance in candidates], dtype='float32')
+    # Packed arrays keep a 1000 candidate list at 12 KB in the cache
+    cursor_cache().set(
+        CACHE_KEY.format(token),
+        {'ids': ids.tobytes(), 'distances': distances.tobytes(), 'tier': tier, 'scored': scored},
+        getattr(settings, 'SEARCH_CURSOR_TTL', 600),
+    )
+    return token
+
+
+def load_candidates(token):
+    """
+    Returns:
+        tuple: (list of (product_id, distance) tuples, tier name, scored)
+
+    Raises:
+        CursorError: If the list has expired from the cache
+    """
+    stored = cursor_cache().get(CACHE_KEY.format(token))
+    if stored is None:
+        raise CursorError('Search results have expired, please search again.', expired=True)
+    ids = np.frombuffer(stored['ids'], dtype='int64').tolist()
+    distances = np.frombuffer(stored['distances'], dtype='float32').tolist()
+    return list(zip(ids, distances)), stored['tier'], stored.get('scored', False)
+
+
+def encode_cursor(token, offset, limit):
+    """Build the opaque, signed cursor for the page starting at ``offset``."""
+    return signing.dumps({'t': token, 'o': offset, 'l': limit}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (token, offset, limit)
+
+    Raises:
+        CursorError: If the cursor was tampered with or is malformed
+    """
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+        return data['t'], int(data['o']), int(data['l'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise CursorError('Invalid cursor.')
@@ -0,0 +1,113 @@
+import math
+from django.conf import settings
+from catalogue.models import Product
+from catalogue.search.metrics import timed
+from catalogue.search.vector_store import similarity_from_distance
+
+# Columns a search result card needs; the long description is left in the table.
+# updated_at keys the card cache (catalogue.cards).
+CARD_FIELDS = ('id', 'name', 'sku', 'price', 'stock_quantity', 'image', 'image_derivatives', 'category',
+               'updated_at')
+
+
+def hydrate(candidates, limit, score=None):
+    """
+    Load the products behind ranked search candidates in a single query.
+
+    Inactive and deleted products are skipped. The returned products keep
+    the candidates' rank order and carry a ``similarity_score`` attribute.
+
+    Args:
+        candidates: list of (product_id, distance) tuples, best first
+        limit: maximum number of products to return
+        score: turns a candidate's second value into its similarity_score;
+            by default it is an index distance, converted for SEARCH_METRIC
+
+    Returns:
+        tuple: (list of Product, number of candidates consumed)
+    """
+    if not candidates or limit <= 0:
+        return [], 0
+    if score is None:
+        metric = getattr(settings, 'SEARCH_METRIC', 'cosine')
+        score = lambda distance: similarity_from_distance(distance, metric)
+
+    with timed('hydrate'):
+        products = (
+            Product.objects.filter(is_active=True)
+            .only(*CARD_FIELDS)
+            .in_bulk([pid for pid, _ in candidates])
+        )
+
+    results = []
+    consumed = 0
+    for pid, distance in candidates:
+        consumed += 1
+        product = products.get(pid)
+        if product is None:
+            continue
+        product.similarity_score = score(distance)
+        results.append(product)
+        if len(results) == limit:
+            break
+    return results, consumed
+
+
+def hydrate_from(candidates, start, limit, overfetch=1.0, score=None):
+    """
+    Hydrate candidates from position ``start`` until ``limit`` products are found.
+
+    Candidates are loaded in windows of the missing count times ``overfetch``,
+    so a long candidate list is never loaded from the database in one go.
+
+    Returns:
+        tuple: (list of Product, position of the first unconsumed candidate)
+    """
+    results = []
+    position = start
+    while len(results) < limit and position < len(candidates):
+        needed = limit - len(results)
+        window = candidates[position:position + max(needed, math.ceil(needed * overfetch))]
+        found, consumed = hydrate(window, needed, score)
+        results.extend(found)
+        position += consumed
+    return results, position
+
+
+def fetch_ranked(search, limit, overfetch=1.0, min_candidates=0, max_candidates=None, score=None):
+    """
+    Run a k-NN search and hydrate it, widening the search until ``limit`` products are found.
+
+    The first search asks for ``limit * overfetch`` candidates (or
+    ``min_candidates`` if larger) to absorb inactive or deleted products. If
+    that is still not enough, k is doubled and hydration carries on from the
+    first unconsumed candidate, until the index is exhausted or
+    ``max_candidates`` is reached.
+
+    Args:
+        search: callable taking k and returning [(product_id, distance), ...]
+        limit: number of products wanted
+        overfetch: multiplier applied to limit when sizing the search and hydration windows
+        min_candidates: minimum k, used to keep a ranked list for later pages
+        max_candidates: upper bound on k
+        score: see hydrate
+
+    Returns:
+        tuple: (list of Product, candidates returned by the last search,
+        position of the first unconsumed candidate)
+    """
+    if max_candidates is None:
+        max_candidates = getattr(settings, 'SEARCH_MAX_CANDIDATES', 1000)
+    k = min(max(limit, math.ceil(limit * overfetch), min_candidates), max_candidates)
+
+    results = []
+    position = 0
+    while True:
+        candidates = search(k)
+        found, position = hydrate_from(candidates, position, limit - len(results), overfetch, score)
+        results.extend(found)
+
+        index_exhausted = len(candidates) < k
+        if len(results) >= limit or index_exhausted or k >= max_candidates:
+            return results, candidates, position
+        k = min(k * 2, max_candidates)
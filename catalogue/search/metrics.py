@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, tuned for a CPU inference pipeline
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{value}"' for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    Prometheus style cumulative histogram, optionally split by one set of labels.
+
+    Attributes:
+        name (str): Metric name
+        documentation (str): Help text
+        labelnames (tuple): Names of the labels observations are split by
+        buckets (tuple): Upper bounds of the buckets, in seconds
+    """
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series = {}
+        _REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for one label combination."""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key, ([0], 0.0))
+            return sum(counts), total
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, (counts, total) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    Gauge whose value is read from a callback at scrape time.
+
+    The callback returns either a number, or a list of (labels dict, number)
+    pairs for labelled series. Returning None skips the metric.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        _REGISTRY.append(self)
+
+    def collect(self):
+        value = self.callback()
+        if value is None:
+            return []
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        if isinstance(value, list):
+            for labels, sample in value:
+                lines.append(f'{self.name}{_format_labels(sorted(labels.items()))} {_format_value(sample)}')
+        else:
+            lines.append(f'{self.name} {_format_value(value)}')
+        return lines
+
+
+class Counter(Gauge):
+    """
+    Counter read from a callback at scrape time, like Gauge.
+
+    The callback must return a value that only grows while the process
+    lives, so rate() and increase() work on the series.
+    """
+    type = 'counter'
+
+
+def render_prometheus():
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _REGISTRY:
+        try:
+            lines.extend(metric.collect())
+        except Exception:
+            # A broken callback must not take the whole scrape down
+            continue
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram(
+    'search_stage_seconds',
+    'Time spent in each stage of the image search pipeline.',
+    labelnames=('stage',),
+)
+
+
+class RequestTimings:
+    """
+    Per-request record of stage durations, rendered as a Server-Timing header.
+    """
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def header(self):
+        return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in self.stages)
+
+
+_current_timings = ContextVar('search_timings', default=None)
+
+
+@contextmanager
+def track_request():
+    """Collect the timings of every stage run inside the block for one request."""
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record(stage, seconds):
+    """Record a stage duration in the histogram and the current request, if any."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Time the block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
@@ -0,0 +1,259 @@
+"""
+Sharded FAISS index with scatter-gather search.
+
+Vectors are partitioned across ``SEARCH_SHARDS`` shards, by product id hash
+or by category. A query fans out to every shard in parallel and the
+per-shard top-k lists, each already sorted by distance, are heap merged into
+the global top-k.
+
+Shards are either local index files searched by threads of this process
+(FAISS releases the GIL during search), or separate shard processes, each a
+search sidecar serving its own index file over a Unix socket
+(``SEARCH_SHARD_SOCKETS``).
+"""
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
+from catalogue.models import Product
+from catalogue.search.metrics import timed
+from catalogue.search.sidecar import SidecarClient
+from catalogue.search.vector_store import make_vector_store, read_vector_store, write_vector_store
+
+PARTITIONS = ('hash', 'category')
+
+
+def shard_path(index_file, shard, num_shards):
+    """Return the index file of one shard, e.g. ``faiss_index.shard-1-of-4.bin``."""
+    root, ext = os.path.splitext(index_file)
+    return f'{root}.shard-{shard}-of-{num_shards}{ext or ".bin"}'
+
+
+def merge_topk(shard_results, k):
+    """
+    Merge per-shard result lists into the global top-k.
+
+    A product found on several shards (e.g. while it moves between category
+    shards) is returned once, at its best distance.
+
+    Args:
+        shard_results: one list of (product_id, distance) tuples per shard,
+            each sorted by ascending distance
+        k: number of results wanted
+
+    Returns:
+        list of tuples: [(product_id, distance), ...], best first
+    """
+    merged = heapq.merge(*shard_results, key=lambda result: result[1])
+    seen = set()
+    unique = (result for result in merged if result[0] not in seen and not seen.add(result[0]))
+    return list(itertools.islice(unique, k))
+
+
+class LocalShard:
+    """
+    One shard held in this process, backed by its own index file.
+
+    Adds and removes change a copy of the store and swap it in, so searches
+    run without the lock and concurrent searches of one shard run in parallel.
+
+    Attributes:
+        path (str): Index file of the shard
+        dim (int): Embedding dimension
+        backend (str): Vector backend used when the shard file does not exist yet
+        metric (str): Metric the shard is searched with
+    """
+    def __init__(self, path, dim=2048, backend=None, metric=None):
+        self.path = path
+        self.dim = dim
+        self.backend = backend or getattr(settings, 'SEARCH_VECTOR_BACKEND', 'faiss')
+        self.metric = metric or getattr(settings, 'SEARCH_METRIC', 'cosine')
+        self.store = None
+        # Serializes loads and mutations; reentrant because they load first
+        self.lock = threading.RLock()
+
+    def _read(self):
+        if os.path.exists(self.path):
+            return read_vector_store(self.path, self.metric)
+        return make_vector_store(self.backend, self.dim, self.metric)
+
+    def load(self):
+        store = self.store
+        if store is None:
+            with self.lock:
+                if self.store is None:
+                    self.store = self._read()
+                store = self.store
+        return store
+
+    def reload(self):
+        with self.lock:
+            self.store = self._read()
+        return int(os.path.getmtime(self.path) * 1000) if os.path.exists(self.path) else 0
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        return self.load().batch_search(queries, k, nprobe=nprobe, min_similarity=min_similarity)
+
+    def add(self, vectors, ids):
+        """Add vectors, replacing any already stored under the same ids. Returns the shard size."""
+        with self.lock:
+            store = self.load().copy()
+            store.remove(ids)
+            store.add(vectors, ids)
+            write_vector_store(store, self.path)
+            self.store = store
+            return store.ntotal
+
+    def remove(self, ids):
+        """Remove the vectors stored under ``ids``. Returns how many were removed."""
+        with self.lock:
+            store = self.load().copy()
+            removed = store.remove(ids)
+            if removed:
+                write_vector_store(store, self.path)
+                self.store = store
+            return removed
+
+    @property
+    def ntotal(self):
+        return self.load().ntotal
+
+
+class ShardedIndex:
+    """
+    Routes vectors to shards and searches all shards in parallel.
+
+    Attributes:
+        shards (list): LocalShard or SidecarClient instances; both expose
+            batch_search(queries, k, nprobe, min_similarity), add(vectors, ids),
+            remove(ids) and reload()
+        partition (str): 'hash' to place vectors by product id, 'category'
+            to keep each category's products on one shard
+    """
+    def __init__(self, shards, partition='hash'):
+        if partition not in PARTITIONS:
+            raise ValueError(f'Unknown shard partition {partition!r}, expected one of {PARTITIONS}')
+        self.shards = list(shards)
+        self.partition = partition
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='shard')
+
+    def shard_for(self, product_id, category_id=None):
+        """Return the index of the shard that owns a product."""
+        if self.partition == 'category':
+            if category_id is None:
+                category_id = Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+            # Products without a category are spread by id like the hash partition
+            key = category_id if category_id is not None else product_id
+        else:
+            key = product_id
+        # Multiplicative hashing spreads sequential keys evenly across shards
+        return ((int(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) % len(self.shards)
+
+    def add(self, vectors, product_ids, category_ids=None):
+        """
+        Add vectors to the shards that own them. Returns the number added.
+
+        With the category partition a product whose category changed is
+        removed from the other shards, so its old shard cannot return it.
+        """
+        vectors = np.asarray(vectors, dtype='float32').reshape(len(product_ids), -1)
+        if category_ids is None:
+            category_ids = [None] * len(product_ids)
+
+        by_shard = {}
+        for row, (product_id, category_id) in enumerate(zip(product_ids, category_ids)):
+            by_shard.setdefault(self.shard_for(product_id, category_id), []).append(row)
+        for shard, rows in by_shard.items():
+            self.shards[shard].add(vectors[rows], [product_ids[row] for row in rows])
+        if self.partition == 'category':
+            for shard, shard_obj in enumerate(self.shards):
+                owned = set(by_shard.get(shard, ()))
+                elsewhere = [product_id for row, product_id in enumerate(product_ids) if row not in owned]
+                if elsewhere:
+                    shard_obj.remove(elsewhere)
+        return len(product_ids)
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        """
+        Scatter the queries to every shard and gather the merged top-k.
+
+        Returns:
+            list: for each query, a list of (product_id, distance) tuples, best first
+        """
+        queries = np.asarray(queries, dtype='float32')
+        with timed('shard_scatter'):
+            futures = [
+                self._executor.submit(shard.batch_search, queries, k, nprobe, min_similarity)
+                for shard in self.shards
+            ]
+            shard_outputs = [future.result() for future in futures]
+
+        with timed('shard_merge'):
+            results = []
+            for q in range(len(queries)):
+                per_shard = [
+                    [(int(i), float(d)) for i, d in zip(ids[q], distances[q]) if i != -1]
+                    for distances, ids in shard_outputs
+                ]
+                results.append(merge_topk(per_shard, k))
+        return results
+
+    def reload(self):
+        for shard in self.shards:
+            shard.reload()
+
+
+_SHARDED_INDEX = None
+_SHARDED_CONFIG = None
+
+
+def get_sharded_index(index_file):
+    """
+    Return the sharded index described by the settings, or None when the
+    catalogue lives in the single ``index_file`` (SEARCH_SHARDS = 1).
+    """
+    global _SHARDED_INDEX, _SHARDED_CONFIG
+    num_shards = getattr(settings, 'SEARCH_SHARDS', 1)
+    sockets = tuple(getattr(settings, 'SEARCH_SHARD_SOCKETS', ()) or ())
+    partition = getattr(settings, 'SEARCH_SHARD_PARTITION', 'hash')
+    if sockets:
+        num_shards = len(sockets)
+    if num_shards <= 1:
+        return None
+
+    config = (index_file, num_shards, sockets, partition)
+    if _SHARDED_INDEX is None or _SHARDED_CONFIG != config:
+        if sockets:
+            timeout = getattr(settings, 'SEARCH_SIDECAR_TIMEOUT', 30.0)
+            shards = [SidecarClient(path, timeout=timeout) for path in sockets]
+        else:
+            shards = [LocalShard(shard_path(index_file, i, num_shards)) for i in range(num_shards)]
+        _SHARDED_INDEX = ShardedIndex(shards, partition)
+        _SHARDED_CONFIG = config
+    return _SHARDED_INDEX
+
+
+def split_index(index, num_shards, index_file, partition='hash'):
+    """
+    Write the vectors of a single VectorStore into ``num_shards`` shard files.
+
+    Returns:
+        list: number of vectors written to each shard
+    """
+    if os.path.exists(shard_path(index_file, 0, num_shards)):
+        raise FileExistsError(f'Shard files for {num_shards} shards already exist next to {index_file}')
+    ids = index.ids()
+    vectors = index.vectors_from(0)
+    category_ids = None
+    if partition == 'category':
+        categories = dict(Product.objects.filter(pk__in=ids.tolist()).values_list('id', 'category_id'))
+        category_ids = [categories.get(int(pid)) for pid in ids]
+
+    shards = [LocalShard(shard_path(index_file, i, num_shards), index.dim, index.backend, index.metric)
+              for i in range(num_shards)]
+    sharded = ShardedIndex(shards, partition)
+    sharded.add(vectors, ids.tolist(), category_ids)
+    return [shard.ntotal for shard in shards]
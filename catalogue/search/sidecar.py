@@ -0,0 +1,216 @@
+"""
+Client side of the local search sidecar.
+
+The sidecar (``manage.py run_search_sidecar``) is one process per node that
+owns the model, the FAISS index and the micro-batching. Web workers and Celery
+workers talk to it over a Unix domain socket with a small binary protocol:
+
+    request:  opcode (u8) | payload length (u32) | payload
+    response: status (u8) | payload length (u32) | payload
+
+All integers are big-endian, vectors are little-endian float32 and ids are
+little-endian int64. A non-zero status carries a UTF-8 error message.
+"""
+import os
+import socket
+import struct
+import threading
+import numpy as np
+from django.conf import settings
+from catalogue.search.metrics import timed
+
+OP_EMBED = 1
+OP_SEARCH = 2
+OP_BATCH_SEARCH = 3
+OP_RELOAD = 4
+OP_ADD = 5
+OP_REMOVE = 6
+OP_EMBED_TENSOR = 7
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+HEADER = struct.Struct('!BI')
+# resize and crop, followed by the encoded image
+EMBED_HEADER = struct.Struct('!HH')
+# crop, followed by the 3 x crop x crop preprocessed input tensor
+EMBED_TENSOR_HEADER = struct.Struct('!H')
+# k, nprobe (0 = index default), number of queries, min_similarity (NaN = none),
+# followed by the query vectors
+SEARCH_HEADER = struct.Struct('!IHIf')
+# number of vectors, followed by the ids and then the vectors (remove: the ids only)
+ADD_HEADER = struct.Struct('!I')
+# number of queries and k, followed by the ids and then the distances
+RESULT_HEADER = struct.Struct('!II')
+COUNT = struct.Struct('!q')
+
+# Requests that can be sent again when the response was lost: repeating them changes nothing
+IDEMPOTENT_OPS = frozenset({OP_EMBED, OP_EMBED_TENSOR, OP_SEARCH, OP_BATCH_SEARCH, OP_RELOAD})
+
+OP_NAMES = {OP_EMBED: 'embed', OP_EMBED_TENSOR: 'embed_tensor', OP_SEARCH: 'search', OP_BATCH_SEARCH: 'batch_search',
+            OP_RELOAD: 'reload', OP_ADD: 'add', OP_REMOVE: 'remove'}
+
+
+class SidecarError(Exception):
+    """Raised when the sidecar reports an error or cannot be reached."""
+
+
+def recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError('Sidecar connection closed.')
+        received += count
+    return bytes(buffer)
+
+
+def send_frame(sock, code, payload=b''):
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    code, length = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    return code, recv_exactly(sock, length)
+
+
+def pack_vectors(vectors, dim):
+    return np.ascontiguousarray(np.asarray(vectors, dtype='<f4').reshape(-1, dim)).tobytes()
+
+
+def pack_results(distances, ids):
+    nq, k = ids.shape
+    return (
+        RESULT_HEADER.pack(nq, k)
+        + np.ascontiguousarray(ids, dtype='<i8').tobytes()
+        + np.ascontiguousarray(distances, dtype='<f4').tobytes()
+    )
+
+
+def unpack_results(payload):
+    nq, k = RESULT_HEADER.unpack_from(payload)
+    offset = RESULT_HEADER.size
+    ids = np.frombuffer(payload, dtype='<i8', count=nq * k, offset=offset).reshape(nq, k)
+    offset += nq * k * 8
+    distances = np.frombuffer(payload, dtype='<f4', count=nq * k, offset=offset).reshape(nq, k)
+    return distances, ids
+
+
+class SidecarClient:
+    """
+    Thin client for the search sidecar.
+
+    Each thread keeps its own persistent connection, reopened after a fork
+    or a broken pipe.
+
+    Attributes:
+        path (str): Path of the sidecar's Unix domain socket
+        dim (int): Embedding dimension
+        timeout (float): Socket timeout in seconds
+    """
+    def __init__(self, path, dim=2048, timeout=30.0):
+        self.path = path
+        self.dim = dim
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None and self._local.pid == os.getpid():
+            return sock
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._local.sock = sock
+        self._local.pid = os.getpid()
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, opcode, payload=b''):
+        """Send one request and return the response payload."""
+        with timed(f'sidecar_{OP_NAMES.get(opcode, opcode)}'):
+            for attempt in range(2):
+                sent = False
+                try:
+                    sock = self._connection()
+                    send_frame(sock, opcode, payload)
+                    sent = True
+                    code, body = recv_frame(sock)
+                    break
+                except OSError as e:
+                    # Stale connection (sidecar restarted); retry once on a fresh one. A
+                    # partly sent frame is never applied, but once the whole request went
+                    # out the sidecar may have applied it (an add), so only requests that
+                    # are safe to repeat are sent again after that.
+                    self.close()
+                    if attempt or (sent and opcode not in IDEMPOTENT_OPS):
+                        raise SidecarError(f'Search sidecar unavailable at {self.path}: {e}')
+        if code != STATUS_OK:
+            raise SidecarError(body.decode('utf-8', 'replace'))
+        return body
+
+    def embed(self, image_bytes, resize=256, crop=224):
+        """Return the 2048-dimensional embedding of an encoded image."""
+        header = EMBED_HEADER.pack(resize, crop)
+        body = self.call(OP_EMBED, header + bytes(image_bytes))
+        return np.frombuffer(body, dtype='<f4').astype('float32')
+
+    def embed_tensor(self, input_tensor):
+        """Return the embedding of an image the caller already decoded and preprocessed."""
+        crop = input_tensor.shape[-1]
+        pixels = np.ascontiguousarray(input_tensor.numpy(), dtype='<f4')
+        body = self.call(OP_EMBED_TENSOR, EMBED_TENSOR_HEADER.pack(crop) + pixels.tobytes())
+        return np.frombuffer(body, dtype='<f4').astype('float32')
+
+    def search(self, query, k, nprobe=None, min_similarity=None):
+        """Search with one query. Returns (distances, ids) arrays of shape (k,)."""
+        payload = self._search_header(k, nprobe, 1, min_similarity) + pack_vectors(query, self.dim)
+        distances, ids = unpack_results(self.call(OP_SEARCH, payload))
+        return distances[0], ids[0]
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        """Search with several queries. Returns (distances, ids) arrays of shape (n, k)."""
+        vectors = pack_vectors(queries, self.dim)
+        header = self._search_header(k, nprobe, len(vectors) // (self.dim * 4), min_similarity)
+        return unpack_results(self.call(OP_BATCH_SEARCH, header + vectors))
+
+    @staticmethod
+    def _search_header(k, nprobe, count, min_similarity):
+        threshold = float('nan') if min_similarity is None else min_similarity
+        return SEARCH_HEADER.pack(k, nprobe or 0, count, threshold)
+
+    def add(self, vectors, ids):
+        """Add vectors to the sidecar's index. Returns the new index size."""
+        ids = np.asarray(ids, dtype='<i8')
+        payload = ADD_HEADER.pack(len(ids)) + ids.tobytes() + pack_vectors(vectors, self.dim)
+        return COUNT.unpack(self.call(OP_ADD, payload))[0]
+
+    def remove(self, ids):
+        """Remove ids from the sidecar's shard index. Returns how many were removed."""
+        ids = np.asarray(ids, dtype='<i8')
+        return COUNT.unpack(self.call(OP_REMOVE, ADD_HEADER.pack(len(ids)) + ids.tobytes()))[0]
+
+    def reload(self):
+        """Make the sidecar re-read its index from disk. Returns the index version."""
+        return COUNT.unpack(self.call(OP_RELOAD))[0]
+
+
+_CLIENT = None
+
+
+def get_sidecar_client():
+    """Return the client for SEARCH_SIDECAR_SOCKET, or None when search runs in-process."""
+    global _CLIENT
+    path = getattr(settings, 'SEARCH_SIDECAR_SOCKET', '')
+    if not path:
+        return None
+    if _CLIENT is None or _CLIENT.path != path:
+        _CLIENT = SidecarClient(path, timeout=getattr(settings, 'SEARCH_SIDECAR_TIMEOUT', 30.0))
+    return _CLIENT
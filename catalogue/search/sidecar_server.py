@@ -0,0 +1,209 @@
+import logging
+import math
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from catalogue import tasks
+from catalogue.search.shards import LocalShard
+from catalogue.search.sidecar import (
+    ADD_HEADER, COUNT, EMBED_HEADER, EMBED_TENSOR_HEADER, OP_ADD, OP_BATCH_SEARCH, OP_EMBED, OP_EMBED_TENSOR,
+    OP_RELOAD, OP_REMOVE, OP_SEARCH,
+    SEARCH_HEADER, STATUS_ERROR, STATUS_OK, pack_results, recv_frame, send_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Runs requests from many connections together.
+
+    The first request to arrive opens a batch; everything that arrives within
+    ``max_wait`` seconds (up to ``max_batch`` items) joins it. Items are grouped
+    by key, since only compatible requests can share a model or index call.
+
+    Attributes:
+        run_batch (callable): Called with (key, items), returns one result per item
+        max_batch (int): Largest number of items run together
+        max_wait (float): Seconds to hold a batch open for more items
+    """
+    def __init__(self, run_batch, max_batch=16, max_wait=0.005):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, item):
+        """Queue one item and block until its result is ready."""
+        future = Future()
+        self._queue.put((key, item, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            key, item, future = self._queue.get()
+            batches = {key: [(item, future)]}
+            count = 1
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    key, item, future = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batches.setdefault(key, []).append((item, future))
+                count += 1
+
+            for key, entries in batches.items():
+                try:
+                    results = self.run_batch(key, [item for item, _ in entries])
+                except Exception as e:
+                    for _, future in entries:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(entries, results):
+                    future.set_result(result)
+
+
+class SidecarRequestHandler(socketserver.BaseRequestHandler):
+    """Serves frames from one client connection until it closes."""
+
+    def handle(self):
+        while True:
+            try:
+                opcode, payload = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                body = self.server.dispatch(opcode, payload)
+            except Exception as e:
+                logger.exception('Search sidecar request failed')
+                send_frame(self.request, STATUS_ERROR, str(e).encode('utf-8'))
+                continue
+            send_frame(self.request, STATUS_OK, body)
+
+
+class SearchSidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Local search daemon owning the model and the FAISS index.
+
+    Embeddings are micro-batched through one model call, searches are
+    micro-batched through one index call, and index mutations are serialized
+    with searches by a lock. A shard (LocalShard) swaps in a new store on
+    every mutation, so its searches need no lock.
+
+    With ``index_path`` the server serves that index file instead of the
+    process-wide index, which is how one shard of a sharded index runs as
+    its own process.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, max_batch=16, max_wait=0.005, index_path=None):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, SidecarRequestHandler)
+        self.dim = tasks.EMBEDDING_DIM
+        self.shard = LocalShard(index_path, self.dim) if index_path else None
+        self.index_lock = threading.Lock()
+        self.embedder = MicroBatcher(self._embed_batch, max_batch, max_wait)
+        self.searcher = MicroBatcher(self._search_batch, max_batch, max_wait)
+
+    def warm_up(self):
+        """Load the model and index before taking traffic."""
+        if self.shard is not None:
+            # Shard processes only search; the model is loaded if an embed ever arrives
+            self.shard.load()
+            return
+        tasks.get_model()
+        with self.index_lock:
+            tasks.load_index()
+
+    def _embed_batch(self, crop, input_tensors):
+        return list(tasks.embed_tensors(input_tensors))
+
+    def _search_batch(self, key, query_blocks):
+        k, nprobe, min_similarity = key
+        queries = np.concatenate(query_blocks)
+        if self.shard is not None:
+            distances, ids = self.shard.batch_search(queries, k, nprobe, min_similarity)
+        else:
+            with self.index_lock:
+                distances, ids = tasks.search_index(queries, k, nprobe=nprobe, min_similarity=min_similarity)
+        # Split the combined result back into one block per request
+        results = []
+        start = 0
+        for block in query_blocks:
+            end = start + len(block)
+            results.append((distances[start:end], ids[start:end]))
+            start = end
+        return results
+
+    def dispatch(self, opcode, payload):
+        if opcode == OP_EMBED:
+            resize, crop = EMBED_HEADER.unpack_from(payload)
+            input_tensor = tasks.preprocess_image(payload[EMBED_HEADER.size:], resize, crop)
+            embedding = self.embedder.submit(crop, input_tensor)
+            return np.asarray(embedding, dtype='<f4').tobytes()
+
+        if opcode == OP_EMBED_TENSOR:
+            import torch
+
+            (crop,) = EMBED_TENSOR_HEADER.unpack_from(payload)
+            pixels = np.frombuffer(payload, dtype='<f4', offset=EMBED_TENSOR_HEADER.size)
+            input_tensor = torch.from_numpy(pixels.reshape(3, crop, crop).copy())
+            embedding = self.embedder.submit(crop, input_tensor)
+            return np.asarray(embedding, dtype='<f4').tobytes()
+
+        if opcode in (OP_SEARCH, OP_BATCH_SEARCH):
+            k, nprobe, count, min_similarity = SEARCH_HEADER.unpack_from(payload)
+            queries = np.frombuffer(payload, dtype='<f4', offset=SEARCH_HEADER.size).reshape(count, self.dim)
+            # Only searches with the same k, nprobe and cut-off can share an index call
+            min_similarity = None if math.isnan(min_similarity) else round(min_similarity, 6)
+            distances, ids = self.searcher.submit((k, nprobe or None, min_similarity), queries)
+            return pack_results(distances, ids)
+
+        if opcode == OP_ADD:
+            (count,) = ADD_HEADER.unpack_from(payload)
+            ids = np.frombuffer(payload, dtype='<i8', count=count, offset=ADD_HEADER.size)
+            vectors = np.frombuffer(payload, dtype='<f4', offset=ADD_HEADER.size + count * 8)
+            vectors = vectors.reshape(count, self.dim)
+            with self.index_lock:
+                if self.shard is not None:
+                    ntotal = self.shard.add(vectors, ids)
+                else:
+                    ntotal = tasks.add_to_index(vectors, ids)
+            return COUNT.pack(ntotal)
+
+        if opcode == OP_REMOVE:
+            if self.shard is None:
+                raise ValueError('remove is only served by shard processes')
+            (count,) = ADD_HEADER.unpack_from(payload)
+            ids = np.frombuffer(payload, dtype='<i8', count=count, offset=ADD_HEADER.size)
+            return COUNT.pack(self.shard.remove(ids))
+
+        if opcode == OP_RELOAD:
+            with self.index_lock:
+                version = self.shard.reload() if self.shard is not None else tasks.reload_index()
+            return COUNT.pack(version or 0)
+
+        raise ValueError(f'Unknown opcode {opcode}')
+
+
+def serve_shard(socket_path, index_path, max_batch=16, max_wait=0.005):
+    """Entry point of one shard process: serve ``index_path`` on ``socket_path`` until killed."""
+    server = SearchSidecarServer(socket_path, max_batch, max_wait, index_path=index_path)
+    server.warm_up()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
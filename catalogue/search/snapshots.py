@@ -0,0 +1,351 @@
+"""
+Versioned vector index snapshots shared between search nodes.
+
+The builder publishes the index to a snapshot store: a full snapshot, an
+optional zlib-compressed delta holding the vectors added since the previous
+snapshot, and finally a manifest naming the new version. Every object
+carries a SHA-256 checksum in the manifest. The manifest is written last, so
+a node never sees a version whose objects are incomplete.
+
+Nodes poll the manifest. A node one version behind applies the delta to a
+copy of its index; any other node downloads the full snapshot. Either way
+the result is verified before it is hot-swapped in, and each node records
+the version it serves so lag can be watched per node.
+
+Store layout::
+
+    manifest.json
+    snapshots/<version>.index
+    deltas/<from version>-<version>.delta
+    nodes/<node>.json
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+import numpy as np
+from django.conf import settings
+from catalogue.search.metrics import Counter, Gauge, timed
+from catalogue.search.vector_store import load_vector_store, with_metric
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, corrupt or cannot be applied."""
+
+
+def checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class DirectoryStore:
+    """
+    Snapshot store on a shared directory (NFS, a mounted bucket, a volume).
+
+    It stands in for an object store: whole objects are put and got by name,
+    and every put is atomic.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f'{prefix}/{name}' for name in os.listdir(directory) if '.tmp-' not in name)
+
+
+def read_manifest(store):
+    data = store.get(MANIFEST)
+    return json.loads(data) if data else None
+
+
+def _delta_ids(store):
+    """Return the store's ids if it can hand back the vectors added since a snapshot, else None."""
+    try:
+        ids = store.ids()
+        store.vectors_from(store.ntotal)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        # Compressed indexes cannot give back their vectors
+        return None
+    return ids
+
+
+def encode_delta(ids, vectors):
+    buffer = io.BytesIO()
+    np.savez(buffer, ids=ids, vectors=vectors)
+    return zlib.compress(buffer.getvalue(), 6)
+
+
+def decode_delta(data):
+    arrays = np.load(io.BytesIO(zlib.decompress(data)))
+    return arrays['ids'], arrays['vectors']
+
+
+def publish_snapshot(index, store, deltas=True, keep=3):
+    """
+    Publish the VectorStore ``index`` as the next snapshot version.
+
+    A delta against the previous version is written as well when the index
+    only grew since then (the previous ids are an unchanged prefix). An index
+    identical to the previous version is not published again.
+
+    Returns:
+        dict: the new manifest, or the previous one when nothing changed
+    """
+    previous = read_manifest(store)
+    version = (previous['version'] if previous else 0) + 1
+
+    with timed('snapshot_serialize'):
+        data = index.snapshot()
+    if previous and checksum(data) == previous['snapshot']['sha256']:
+        logger.info(f"Index unchanged since snapshot v{previous['version']}, nothing to publish")
+        return previous
+    ids = _delta_ids(index)
+
+    manifest = {
+        'version': version,
+        'created_at': time.time(),
+        'ntotal': int(index.ntotal),
+        'snapshot': {'name': f'snapshots/{version:012d}.index', 'sha256': checksum(data), 'size': len(data)},
+        'ids_sha256': checksum(ids.tobytes()) if ids is not None else None,
+        'delta': None,
+    }
+    store.put(manifest['snapshot']['name'], data)
+
+    if deltas and ids is not None and previous and previous.get('ids_sha256'):
+        base = previous['ntotal']
+        if base <= len(ids) and checksum(ids[:base].tobytes()) == previous['ids_sha256']:
+            delta = encode_delta(ids[base:], index.vectors_from(base))
+            manifest['delta'] = {
+                'name': f'deltas/{previous["version"]:012d}-{version:012d}.delta',
+                'from_version': previous['version'],
+                'sha256': checksum(delta),
+                'size': len(delta),
+                'count': len(ids) - base,
+            }
+            store.put(manifest['delta']['name'], delta)
+
+    store.put(MANIFEST, json.dumps(manifest).encode())
+    _prune(store, version, keep)
+    logger.info(f"Published index snapshot v{version} ({manifest['ntotal']} vectors)")
+    return manifest
+
+
+def _prune(store, version, keep):
+    oldest = version - keep
+    for prefix in ('snapshots', 'deltas'):
+        for name in store.list(prefix):
+            stem = os.path.basename(name).split('.')[0]
+            if int(stem.split('-')[-1]) <= oldest:
+                store.delete(name)
+
+
+def _fetch(store, entry):
+    data = store.get(entry['name'])
+    if data is None:
+        raise SnapshotError(f"Snapshot object {entry['name']} is missing")
+    if len(data) != entry['size'] or checksum(data) != entry['sha256']:
+        raise SnapshotError(f"Checksum mismatch for {entry['name']}")
+    return data
+
+
+class SnapshotSubscriber:
+    """
+    Keeps one process's index in step with the published snapshots.
+
+    Attributes:
+        store: DirectoryStore (or any object with the same put/get/list/delete)
+        install (callable): called with (VectorStore, version) to hot-swap the index
+        current (callable): returns the VectorStore currently served, or None
+        node (str): name this node reports its version under
+        metric (str): metric the served index must use; snapshots written
+            with another are rebuilt before they are installed
+    """
+    def __init__(self, store, install, current, node=None, metric=None):
+        self.store = store
+        self.install = install
+        self.current = current
+        self.node = node or f'{socket.gethostname()}-{os.getpid()}'
+        self.metric = metric
+        self.version = None
+        self.published_version = None
+        self.last_poll = None
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def poll(self):
+        """
+        Install the latest snapshot if this node is behind.
+
+        Returns:
+            bool: True when a new version was installed
+        """
+        with self._lock:
+            manifest = read_manifest(self.store)
+            self.last_poll = time.time()
+            if manifest is None:
+                return False
+            self.published_version = manifest['version']
+            if manifest['version'] == self.version:
+                self._report()
+                return False
+
+            try:
+                index = self._build(manifest)
+            except SnapshotError:
+                self.failures += 1
+                self._report()
+                raise
+            self.install(index, manifest['version'])
+            self.version = manifest['version']
+            self._report()
+            logger.info(f"Installed index snapshot v{self.version} on {self.node}")
+            return True
+
+    def _build(self, manifest):
+        delta = manifest.get('delta')
+        current = self.current()
+        if delta and current is not None and self.version == delta['from_version']:
+            with timed('snapshot_delta'):
+                ids, vectors = decode_delta(_fetch(self.store, delta))
+                # Apply to a copy so searches keep using the served index until the swap
+                index = current.copy()
+                index.add(vectors, ids)
+            if index.ntotal == manifest['ntotal'] and checksum(index.ids().tobytes()) == manifest['ids_sha256']:
+                return index
+            logger.warning(f"Delta to v{manifest['version']} did not verify, downloading the full snapshot")
+
+        with timed('snapshot_download'):
+            data = _fetch(self.store, manifest['snapshot'])
+            index = load_vector_store(data)
+        # Scores and min_similarity cuts assume the configured metric, whatever the builder wrote
+        return with_metric(index, self.metric) if self.metric else index
+
+    def _report(self):
+        status = {
+            'node': self.node,
+            'version': self.version,
+            'published_version': self.published_version,
+            'updated_at': self.last_poll,
+            'failures': self.failures,
+        }
+        try:
+            self.store.put(f'nodes/{self.node}.json', json.dumps(status).encode())
+        except OSError as e:
+            logger.warning(f"Could not report index version for {self.node}: {e}")
+
+    @property
+    def lag(self):
+        """Published versions this node has not installed yet."""
+        if self.published_version is None:
+            return None
+        return self.published_version - (self.version or 0)
+
+    def start(self, interval):
+        """Poll in a daemon thread every ``interval`` seconds."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Index snapshot poll failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='index-snapshots', daemon=True)
+        self._thread.start()
+
+
+def node_status(store):
+    """
+    Version lag of every node that has reported to the store.
+
+    Returns:
+        list of dict: node, version, published_version, lag and updated_at
+    """
+    manifest = read_manifest(store)
+    published = manifest['version'] if manifest else None
+    nodes = []
+    for name in store.list('nodes'):
+        status = json.loads(store.get(name) or b'{}')
+        if not status:
+            continue
+        status['published_version'] = published
+        status['lag'] = published - (status['version'] or 0) if published is not None else None
+        nodes.append(status)
+    return nodes
+
+
+def get_snapshot_store():
+    """Return the store at SEARCH_SNAPSHOT_DIR, or None when snapshots are not used."""
+    root = getattr(settings, 'SEARCH_SNAPSHOT_DIR', '')
+    return DirectoryStore(root) if root else None
+
+
+_SUBSCRIBER = None
+
+
+def get_snapshot_subscriber(install, current):
+    """
+    Return this process's subscriber, or None when snapshots are not used or
+    SEARCH_SNAPSHOT_SUBSCRIBE is off (processes writing INDEX_FILE).
+    """
+    global _SUBSCRIBER
+    store = get_snapshot_store()
+    if store is None or not getattr(settings, 'SEARCH_SNAPSHOT_SUBSCRIBE', True):
+        return None
+    if _SUBSCRIBER is None:
+        _SUBSCRIBER = SnapshotSubscriber(
+            store, install, current, metric=getattr(settings, 'SEARCH_METRIC', 'cosine'),
+        )
+    return _SUBSCRIBER
+
+
+def _subscriber_stat(key):
+    def read():
+        return getattr(_SUBSCRIBER, key) if _SUBSCRIBER is not None else None
+    return read
+
+
+Gauge('search_index_snapshot_version', 'Snapshot version installed on this node.', _subscriber_stat('version'))
+Gauge('search_index_snapshot_published_version', 'Latest published snapshot version seen by this node.',
+      _subscriber_stat('published_version'))
+Gauge('search_index_snapshot_lag', 'Published snapshot versions this node is behind.', _subscriber_stat('lag'))
+Counter('search_index_snapshot_failures_total', 'Snapshots that failed verification on this node.',
+        _subscriber_stat('failures'))
@@ -0,0 +1,87 @@
+"""
+Full-text product search and its fusion with image similarity.
+
+On PostgreSQL, products carry a weighted tsvector of their name and
+description, kept current by a trigger and indexed with GIN (migration
+0006), so a text query is one index lookup ranked with ts_rank. Other
+databases fall back to icontains matching, ranked by how many terms hit
+the name and the description.
+
+Hybrid search runs the text and the image search separately, each for a
+bounded number of candidates, and merges the two ranked lists with
+reciprocal rank fusion: no score normalization between the two
+rankings is needed and the cost does not grow with the catalogue.
+"""
+from collections import defaultdict
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, Q, Value, When
+from catalogue.models import Product
+from catalogue.search.metrics import timed
+
+# Must match the configuration of the search_vector trigger (migration 0006)
+SEARCH_CONFIG = 'english'
+# Terms of a fallback (non PostgreSQL) query beyond this are ignored
+MAX_FALLBACK_TERMS = 8
+# Reported as the tier of text search results, which have no quality tiers
+TEXT_TIER = 'text'
+# Damping constant of reciprocal rank fusion, the usual value from the literature
+RRF_K = 60
+
+
+def text_search(query, k):
+    """
+    Rank active products against a text query.
+
+    Args:
+        query: the user's query, in web search syntax on PostgreSQL
+            ("quoted phrases", -excluded, or)
+        k: maximum number of products to return
+
+    Returns:
+        list of tuples: [(product_id, rank), ...], best first
+    """
+    products = Product.objects.filter(is_active=True)
+    with timed('text_search'):
+        if connections[products.db].vendor == 'postgresql':
+            search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+            products = (
+                products.filter(search_vector=search_query)
+                .annotate(rank=SearchRank(F('search_vector'), search_query))
+            )
+        else:
+            terms = query.split()[:MAX_FALLBACK_TERMS]
+            if not terms:
+                return []
+            rank = Value(0.0)
+            for term in terms:
+                products = products.filter(Q(name__icontains=term) | Q(description__icontains=term))
+                # Weighted like the tsvector: a name hit counts more than a description hit
+                rank = rank + Case(When(name__icontains=term, then=Value(1.0)), default=Value(0.0)) \
+                    + Case(When(description__icontains=term, then=Value(0.4)), default=Value(0.0))
+            products = products.annotate(rank=rank)
+        ranked = products.order_by('-rank', '-id').values_list('id', 'rank')[:k]
+        return [(product_id, float(rank)) for product_id, rank in ranked]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked candidate lists with reciprocal rank fusion.
+
+    Each product scores the sum of 1 / (k + rank) over the lists it appears
+    in, so products ranked well by several lists come first. Only the ranks
+    are used; the scores or distances of the input lists are ignored.
+
+    Args:
+        rankings: lists of (product_id, score or distance) tuples, best first
+        k: damping constant; larger values flatten the advantage of top ranks
+
+    Returns:
+        list of tuples: [(product_id, fused score), ...], best first; ties
+        keep the order in which the products were first seen
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, (product_id, _) in enumerate(ranking, start=1):
+            scores[product_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
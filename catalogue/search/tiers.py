@@ -0,0 +1,120 @@
+import threading
+import time
+from django.conf import settings
+
+
+class QualityTier:
+    """
+    One level of search quality.
+
+    Attributes:
+        name (str): Name reported to clients
+        resize (int): Shorter side the query image is resized to
+        crop (int): Side of the center crop fed to the model
+        nprobe (int): Inverted lists probed on IVF indexes, None for the index default
+        overfetch (float): Multiplier on the requested limit for the first k-NN search
+        candidates (float): Share of the ranked candidate pool (SEARCH_CURSOR_CANDIDATES,
+            SEARCH_HYBRID_CANDIDATES) searched for and kept; a flat index scans every
+            vector whatever nprobe is, so this is what the cheaper tiers save on the index side
+        enter_fraction (float): Queue fill ratio at which this tier is switched on
+        exit_fraction (float): Queue fill ratio below which we step back down from it
+    """
+    def __init__(self, name, resize, crop, nprobe, overfetch, candidates, enter_fraction, exit_fraction):
+        self.name = name
+        self.resize = resize
+        self.crop = crop
+        self.nprobe = nprobe
+        self.overfetch = overfetch
+        self.candidates = candidates
+        self.enter_fraction = enter_fraction
+        self.exit_fraction = exit_fraction
+
+    def embedding_kwargs(self):
+        return {'resize': self.resize, 'crop': self.crop}
+
+    def candidate_pool(self, size):
+        """This tier's share of a candidate pool of ``size``."""
+        return max(1, round(size * self.candidates))
+
+    def __repr__(self):
+        return f'<QualityTier {self.name}>'
+
+
+# Ordered best to cheapest. The gap between enter and exit ratios is the hysteresis band.
+TIERS = [
+    QualityTier('full', resize=256, crop=224, nprobe=None, overfetch=2.0, candidates=1.0,
+                enter_fraction=0.0, exit_fraction=0.0),
+    QualityTier('reduced', resize=192, crop=160, nprobe=16, overfetch=1.5, candidates=0.5,
+                enter_fraction=0.25, exit_fraction=0.1),
+    QualityTier('economy', resize=160, crop=128, nprobe=4, overfetch=1.25, candidates=0.25,
+                enter_fraction=0.6, exit_fraction=0.3),
+]
+
+
+class QualityGovernor:
+    """
+    Picks the quality tier for the next search from the current queue depth.
+
+    Stepping down in quality happens as soon as the queue crosses a tier's
+    enter threshold. Stepping back up only happens once the queue has dropped
+    below the current tier's exit threshold and the tier has been held for at
+    least ``min_dwell`` seconds, so the served quality does not flap.
+
+    Attributes:
+        tiers (list): QualityTier objects, best first
+        max_queue (int): Queue size the tier thresholds are relative to
+        min_dwell (float): Minimum seconds to stay in a degraded tier
+    """
+    def __init__(self, tiers, max_queue, min_dwell=10.0, enabled=True):
+        self.tiers = tiers
+        self.max_queue = max(max_queue, 1)
+        self.min_dwell = min_dwell
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._level = 0
+        self._changed_at = time.monotonic()
+        self.switches = 0
+
+    @property
+    def current(self):
+        return self.tiers[self._level]
+
+    def select(self, queue_depth):
+        """
+        Return the tier to serve a search with, given the number of queued searches.
+        """
+        if not self.enabled:
+            return self.tiers[0]
+
+        fill = queue_depth / self.max_queue
+        with self._lock:
+            level = self._level
+            # Degrade straight to the deepest tier whose enter threshold is reached
+            while level + 1 < len(self.tiers) and fill >= self.tiers[level + 1].enter_fraction:
+                level += 1
+            if level == self._level:
+                held = time.monotonic() - self._changed_at
+                while level > 0 and fill <= self.tiers[level].exit_fraction and held >= self.min_dwell:
+                    level -= 1
+            if level != self._level:
+                self._level = level
+                self._changed_at = time.monotonic()
+                self.switches += 1
+            return self.tiers[self._level]
+
+
+_GOVERNOR = None
+
+
+def get_quality_governor():
+    global _GOVERNOR
+    if _GOVERNOR is not None:
+        return _GOVERNOR
+
+    _GOVERNOR = QualityGovernor(
+        TIERS,
+        max_queue=getattr(settings, 'SEARCH_MAX_QUEUE', 16),
+        min_dwell=getattr(settings, 'SEARCH_TIER_MIN_DWELL', 10.0),
+        enabled=getattr(settings, 'SEARCH_ADAPTIVE_QUALITY', True),
+    )
+    return _GOVERNOR
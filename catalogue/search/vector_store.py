@@ -0,0 +1,448 @@
+"""
+Vector stores behind image search.
+
+``VectorStore`` is the interface the rest of the app searches through:
+add, remove, search, batch_search, snapshot, load and stats. Two backends
+implement it:
+
+- ``FaissVectorStore`` wraps a FAISS index (flat, IVF, ...) with an ID map.
+- ``NumpyVectorStore`` is exact brute force: one BLAS matrix product per
+  batch of queries and ``argpartition`` for the top k. It needs nothing
+  beyond NumPy and suits small catalogues and CI.
+
+Each store has a metric. ``cosine`` stores normalize vectors once as they
+are added (and queries as they arrive) and rank by inner product; ``l2``
+stores rank by squared L2 distance. Either way searches return distances,
+lower being closer: ``1 - cosine similarity`` or the squared L2 distance.
+Missing results are padded with id -1 and the largest float32 distance, as
+FAISS does.
+
+A ``min_similarity`` cut-off drops weak matches from the top k inside the
+store, so they never reach hydration.
+"""
+import io
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MISSING_DISTANCE = np.finfo('float32').max
+BACKENDS = ('faiss', 'numpy')
+METRICS = ('cosine', 'l2')
+
+
+def normalize(vectors):
+    """Scale each row to unit L2 norm; zero rows stay zero."""
+    vectors = np.array(vectors, dtype='float32', copy=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def cosine_distance(similarities):
+    """``1 - similarity``, clipped to [0, 2] against float rounding."""
+    return np.clip(1.0 - similarities, 0.0, 2.0)
+
+
+def similarity_from_distance(distance, metric):
+    """
+    Turn a search distance into a similarity score.
+
+    Cosine scores are the cosine similarity itself, so they are comparable
+    across queries and can be thresholded. L2 scores use the older
+    ``1 / (1 + distance)`` mapping, which is only good for ranking.
+    """
+    if metric == 'cosine':
+        return 1.0 - distance
+    return 1.0 / (1.0 + distance)
+
+
+def max_distance(min_similarity, metric):
+    """The largest distance whose similarity is still at least ``min_similarity``, or None for no limit."""
+    if min_similarity is None:
+        return None
+    if metric == 'cosine':
+        return 1.0 - min_similarity
+    if min_similarity <= 0:
+        return None
+    return 1.0 / min_similarity - 1.0
+
+
+def hnsw_graph_bytes(index):
+    """Memory held by the neighbour lists of an HNSW index (unwrapping ID maps), 0 for other indexes."""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    while not hasattr(index, 'hnsw') and isinstance(getattr(index, 'index', None), faiss.Index):
+        index = faiss.downcast_index(index.index)
+    if not hasattr(index, 'hnsw'):
+        return 0
+    # int32 neighbour ids and levels, size_t offsets into the neighbour table
+    hnsw = index.hnsw
+    return hnsw.neighbors.size() * 4 + hnsw.levels.size() * 4 + hnsw.offsets.size() * 8
+
+
+class VectorStore:
+    """
+    Interface of a vector store keyed by int64 product ids.
+
+    Attributes:
+        dim (int): Vector dimension
+        metric (str): 'cosine' or 'l2'
+    """
+    backend = None
+    metric = 'l2'
+
+    def add(self, vectors, ids):
+        """Add vectors of shape (n, dim) under the given ids."""
+        raise NotImplementedError
+
+    def remove(self, ids):
+        """Remove the vectors stored under ``ids``. Returns how many were removed."""
+        raise NotImplementedError
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        """
+        Find the k nearest neighbours of each query.
+
+        Args:
+            queries: array of shape (n, dim)
+            k: neighbours per query
+            nprobe: inverted lists to probe, for backends that have them
+            min_similarity: leave out neighbours less similar than this
+
+        Returns:
+            tuple: (distances, ids) arrays of shape (n, k), nearest first
+        """
+        raise NotImplementedError
+
+    def search(self, query, k, nprobe=None, min_similarity=None):
+        """Search with one query. Returns (distances, ids) arrays of shape (k,)."""
+        queries = np.asarray(query, dtype='float32').reshape(1, self.dim)
+        distances, ids = self.batch_search(queries, k, nprobe, min_similarity)
+        return distances[0], ids[0]
+
+    def snapshot(self):
+        """Serialize the store to bytes that ``load_vector_store`` reads back."""
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, data):
+        """Build a store from the bytes of ``snapshot()``."""
+        raise NotImplementedError
+
+    def ids(self):
+        """Return the stored ids as an int64 array, in insertion order."""
+        raise NotImplementedError
+
+    def vectors_from(self, start):
+        """Return the vectors added from insertion position ``start`` on."""
+        raise NotImplementedError
+
+    def copy(self):
+        return type(self).load(self.snapshot())
+
+    @property
+    def ntotal(self):
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Returns:
+            dict: backend, index_type, metric, ntotal, dimension and estimated memory_bytes
+        """
+        raise NotImplementedError
+
+
+class FaissVectorStore(VectorStore):
+    """
+    VectorStore over a FAISS index.
+
+    An inner product index is treated as a cosine index.
+
+    Attributes:
+        index: the wrapped faiss index; an IndexIDMap over IndexFlatIP
+            (cosine) or IndexFlatL2 by default
+    """
+    backend = 'faiss'
+
+    def __init__(self, index=None, dim=2048, metric='l2'):
+        import faiss
+
+        if index is None:
+            flat = faiss.IndexFlatIP(dim) if metric == 'cosine' else faiss.IndexFlatL2(dim)
+            index = faiss.IndexIDMap(flat)
+        self.index = index
+        self.dim = index.d
+        self.metric = 'cosine' if index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2'
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, self.dim)
+        return normalize(vectors) if self.metric == 'cosine' else np.ascontiguousarray(vectors)
+
+    def add(self, vectors, ids):
+        self.index.add_with_ids(self._prepare(vectors), np.asarray(ids, dtype='int64'))
+
+    def remove(self, ids):
+        import faiss
+
+        return int(self.index.remove_ids(faiss.IDSelectorBatch(np.asarray(ids, dtype='int64'))))
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        import faiss
+
+        queries = self._prepare(queries)
+        params = None
+        if nprobe is not None and faiss.try_extract_index_ivf(self.index) is not None:
+            params = faiss.SearchParametersIVF(nprobe=nprobe)
+
+        distances, ids = self.index.search(queries, k, params=params)
+        if self.metric == 'cosine':
+            distances = np.where(ids == -1, MISSING_DISTANCE, cosine_distance(distances)).astype('float32')
+
+        # Cut the top k rather than range search, whose result count has no
+        # bound when the threshold is low or many vectors are near duplicates
+        limit = max_distance(min_similarity, self.metric)
+        if limit is not None:
+            too_far = distances > limit
+            distances[too_far] = MISSING_DISTANCE
+            ids[too_far] = -1
+        return distances, ids
+
+    def snapshot(self):
+        import faiss
+
+        return faiss.serialize_index(self.index).tobytes()
+
+    @classmethod
+    def load(cls, data):
+        import faiss
+
+        return cls(faiss.deserialize_index(np.frombuffer(data, dtype='uint8')))
+
+    def ids(self):
+        import faiss
+
+        return faiss.vector_to_array(self.index.id_map).astype('int64')
+
+    def vectors_from(self, start):
+        import faiss
+
+        # Only flat indexes can give their exact vectors back
+        inner = faiss.downcast_index(getattr(self.index, 'index', self.index))
+        if not isinstance(inner, faiss.IndexFlat):
+            raise NotImplementedError(f'{type(inner).__name__} does not store its vectors')
+        return inner.reconstruct_n(start, self.ntotal - start)
+
+    def copy(self):
+        import faiss
+
+        return type(self)(faiss.clone_index(self.index))
+
+    @property
+    def ntotal(self):
+        return int(self.index.ntotal)
+
+    def stats(self):
+        try:
+            code_size = self.index.sa_code_size()
+        except Exception:
+            code_size = self.dim * 4
+        # Stored codes plus the int64 id of every vector in the ID map, plus any graph
+        memory_bytes = self.ntotal * (code_size + 8) + hnsw_graph_bytes(self.index)
+        return {
+            'backend': self.backend,
+            'index_type': type(self.index).__name__,
+            'metric': self.metric,
+            'ntotal': self.ntotal,
+            'dimension': int(self.dim),
+            'memory_bytes': memory_bytes,
+        }
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact brute-force VectorStore in NumPy.
+
+    Vectors live in one float32 matrix that grows by doubling. A cosine
+    search is ``1 - q.X^T`` over unit vectors; an L2 search uses the cached
+    squared norms, ``|q|^2 - 2 q.X^T + |x|^2``. Either way it is a single
+    matrix product per block of queries.
+    """
+    backend = 'numpy'
+    # Queries per matrix product, bounding the (queries x vectors) distance matrix
+    QUERY_BLOCK = 64
+
+    def __init__(self, dim=2048, metric='l2'):
+        if metric not in METRICS:
+            raise ValueError(f'Unknown metric {metric!r}, expected one of {METRICS}')
+        self.dim = dim
+        self.metric = metric
+        self._size = 0
+        self._vectors = np.empty((0, dim), dtype='float32')
+        self._norms = np.empty(0, dtype='float32')
+        self._ids = np.empty(0, dtype='int64')
+
+    def _reserve(self, size):
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 64)
+        for name in ('_vectors', '_norms', '_ids'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, self.dim)
+        if self.metric == 'cosine':
+            vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype='int64').reshape(-1)
+        if len(vectors) != len(ids):
+            raise ValueError('Expected one id per vector')
+        start, end = self._size, self._size + len(ids)
+        self._reserve(end)
+        self._vectors[start:end] = vectors
+        self._norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self._ids[start:end] = ids
+        self._size = end
+
+    def remove(self, ids):
+        keep = ~np.isin(self._ids[:self._size], np.asarray(ids, dtype='int64'))
+        removed = self._size - int(keep.sum())
+        if removed:
+            size = self._size - removed
+            self._vectors[:size] = self._vectors[:self._size][keep]
+            self._norms[:size] = self._norms[:self._size][keep]
+            self._ids[:size] = self._ids[:self._size][keep]
+            self._size = size
+        return removed
+
+    def batch_search(self, queries, k, nprobe=None, min_similarity=None):
+        queries = np.asarray(queries, dtype='float32').reshape(-1, self.dim)
+        if self.metric == 'cosine':
+            queries = normalize(queries)
+        limit = max_distance(min_similarity, self.metric)
+        distances = np.full((len(queries), k), MISSING_DISTANCE, dtype='float32')
+        labels = np.full((len(queries), k), -1, dtype='int64')
+        n = self._size
+        found = min(k, n)
+        if found == 0:
+            return distances, labels
+
+        vectors, norms, ids = self._vectors[:n], self._norms[:n], self._ids[:n]
+        for start in range(0, len(queries), self.QUERY_BLOCK):
+            block = queries[start:start + self.QUERY_BLOCK]
+            scores = block @ vectors.T
+            if self.metric == 'cosine':
+                scores = cosine_distance(scores)
+            else:
+                scores *= -2
+                scores += norms
+                scores += np.einsum('ij,ij->i', block, block)[:, None]
+                np.maximum(scores, 0, out=scores)
+
+            if found < n:
+                top = np.argpartition(scores, found - 1, axis=1)[:, :found]
+            else:
+                top = np.broadcast_to(np.arange(n), (len(block), n))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(top_scores, axis=1, kind='stable')
+            distances[start:start + len(block), :found] = np.take_along_axis(top_scores, order, axis=1)
+            labels[start:start + len(block), :found] = ids[np.take_along_axis(top, order, axis=1)]
+
+        if limit is not None:
+            too_far = distances > limit
+            distances[too_far] = MISSING_DISTANCE
+            labels[too_far] = -1
+        return distances, labels
+
+    def snapshot(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, ids=self.ids(), vectors=self._vectors[:self._size], metric=np.array(self.metric))
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, data):
+        arrays = np.load(io.BytesIO(data))
+        metric = str(arrays['metric']) if 'metric' in arrays.files else 'l2'
+        store = cls(arrays['vectors'].shape[1], metric)
+        store.add(arrays['vectors'], arrays['ids'])
+        return store
+
+    def ids(self):
+        return self._ids[:self._size].copy()
+
+    def vectors_from(self, start):
+        return self._vectors[start:self._size].copy()
+
+    @property
+    def ntotal(self):
+        return self._size
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'index_type': type(self).__name__,
+            'metric': self.metric,
+            'ntotal': self._size,
+            'dimension': self.dim,
+            'memory_bytes': self._vectors.nbytes + self._norms.nbytes + self._ids.nbytes,
+        }
+
+
+def make_vector_store(backend='faiss', dim=2048, metric='l2'):
+    """Return an empty store of the given backend and metric."""
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric {metric!r}, expected one of {METRICS}')
+    if backend == 'faiss':
+        return FaissVectorStore(dim=dim, metric=metric)
+    if backend == 'numpy':
+        return NumpyVectorStore(dim, metric)
+    raise ValueError(f'Unknown vector backend {backend!r}, expected one of {BACKENDS}')
+
+
+def load_vector_store(data):
+    """Read a store from snapshot bytes of either backend."""
+    # np.savez writes a zip archive; anything else is a serialized faiss index
+    if data[:2] == b'PK':
+        return NumpyVectorStore.load(data)
+    return FaissVectorStore.load(data)
+
+
+def with_metric(store, metric):
+    """
+    Return ``store`` rebuilt for ``metric``, e.g. to move an L2 index to cosine.
+
+    Only stores that keep their exact vectors can be rebuilt; others are
+    returned as they are, with a warning.
+    """
+    if store.metric == metric:
+        return store
+    try:
+        vectors = store.vectors_from(0)
+    except NotImplementedError:
+        logger.warning(f'Cannot rebuild a {store.metric} index as {metric}; run rebuild_index')
+        return store
+    rebuilt = make_vector_store(store.backend, store.dim, metric)
+    rebuilt.add(vectors, store.ids())
+    logger.info(f'Rebuilt a {store.metric} index of {store.ntotal} vectors as {metric}')
+    return rebuilt
+
+
+def read_vector_store(path, metric=None):
+    """Read a store from ``path``, rebuilding it for ``metric`` if it was written with another."""
+    with open(path, 'rb') as f:
+        store = load_vector_store(f.read())
+    return with_metric(store, metric) if metric else store
+
+
+def write_vector_store(store, path):
+    """Write a store to ``path`` atomically, so readers never see half a file."""
+    tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(store.snapshot())
+    os.replace(tmp_path, path)
@@ -0,0 +1,44 @@
+from django.db import models
+from rest_framework import serializers
+from catalogue.cards import get_card_cache, render_card
+from catalogue.serializers.product_serializers import ProductSerializer
+
+
+class ProductCardListSerializer(serializers.ListSerializer):
+    """
+    Loads the product cards of every item in one batch before the items are
+    serialized, so a list costs one card lookup instead of one per item.
+    """
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.product_cards = self.child.load_product_cards(items)
+        return super().to_representation(items)
+
+
+class ProductCardSerializerMixin:
+    """
+    For serializers of objects that show a product card (see catalogue.cards).
+
+    Set ``list_serializer_class = ProductCardListSerializer`` in Meta to batch
+    the lookups of a list; a single object looks up its own card.
+    """
+    product_cards = None
+
+    def load_product_cards(self, instances):
+        return get_card_cache().cards_for_ids([instance.product_id for instance in instances])
+
+    def product_card(self, product_id):
+        """The card of a product for this response, or None if the product is gone."""
+        if self.product_cards is None or product_id not in self.product_cards:
+            self.product_cards = {**(self.product_cards or {}), **get_card_cache().cards_for_ids([product_id])}
+        card = self.product_cards.get(product_id)
+        return render_card(card, self.context.get('request')) if card is not None else None
+
+
+class ProductCardSerializer(ProductSerializer):
+    """
+    ProductSerializer's output read from the card cache. Nest it with
+    ``source='product_id'`` in a ProductCardSerializerMixin serializer.
+    """
+    def to_representation(self, product_id):
+        return self.parent.product_card(product_id)
@@ -1,12 +1,15 @@
 from rest_framework import serializers
 from catalogue.models import Cart, CartItem
-from catalogue.serializers.product_serializers import ProductSerializer
+from catalogue.serializers.card_serializers import (
+    ProductCardListSerializer, ProductCardSerializer, ProductCardSerializerMixin
+)
 
-class CartItemSerializer(serializers.ModelSerializer):
-    product_details = ProductSerializer(source='product', read_only=True)
+class CartItemSerializer(ProductCardSerializerMixin, serializers.ModelSerializer):
+    product_details = ProductCardSerializer(source='product_id', read_only=True)
     
     class Meta:
         model = CartItem
+        list_serializer_class = ProductCardListSerializer
         fields = ['id', 'cart', 'product', 'product_details', 'quantity', 'created_at', 'updated_at']
         read_only_fields = ['cart']
 
@@ -19,4 +22,4 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'status', 'items', 'total_price', 'created_at', 'updated_at']
     
     def get_total_price(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.cartitem_set.all())
+        return sum(item.product.price * item.quantity for item in obj.cartitem_set.select_related('product'))
@@ -1,13 +1,16 @@
 from decimal import Decimal
 from rest_framework import serializers
 from catalogue.models import Order, OrderItem, Cart, CartItem
-from catalogue.serializers.product_serializers import ProductSerializer
+from catalogue.serializers.card_serializers import (
+    ProductCardListSerializer, ProductCardSerializer, ProductCardSerializerMixin
+)
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product_details = ProductSerializer(source='product', read_only=True)
+class OrderItemSerializer(ProductCardSerializerMixin, serializers.ModelSerializer):
+    product_details = ProductCardSerializer(source='product_id', read_only=True)
     
     class Meta:
         model = OrderItem
+        list_serializer_class = ProductCardListSerializer
         fields = ['id', 'order', 'product', 'product_details', 'quantity', 'unit_price', 'line_total', 'created_at']
         read_only_fields = ['order', 'unit_price', 'line_total']
 
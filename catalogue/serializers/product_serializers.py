@@ -1,11 +1,38 @@
 from rest_framework import serializers
+from catalogue.fastpath import ValuesSerializer
+from catalogue.images import derivative_urls
 from catalogue.models import Product
+from catalogue.sparse_fields import SparseFieldsSerializerMixin
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ImageDerivativesField(serializers.Field):
+    """
+    URLs of the resized copies of the product image, ``{size: {format: url}}``
+    (see catalogue.images); empty until the ingest task has made them.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def url_converter(self):
+        # Same URLs as the image field, from the same storage
+        return ValuesSerializer.file_converter(self, Product._meta.get_field('image').storage)
+
+    def to_representation(self, value):
+        return derivative_urls(value, self.url_converter())
+
+    def values_converter(self, model_field):
+        url = self.url_converter()
+        return lambda value: derivative_urls(value, url)
+
+
+class ProductSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    images = ImageDerivativesField(source='image_derivatives')
+
     class Meta:
         model = Product
-        fields = '__all__'
+        # The search vector is internal to full-text search
+        exclude = ['search_vector', 'image_derivatives']
 
 
 class ProductCreateSerializer(serializers.ModelSerializer):
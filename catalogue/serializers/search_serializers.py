@@ -1,18 +1,101 @@
+import base64
+import binascii
+import numpy as np
 from rest_framework import serializers
+from catalogue.cards import get_card_cache
 from catalogue.models import Product
+from catalogue.serializers.card_serializers import ProductCardListSerializer, ProductCardSerializerMixin
+from catalogue.serializers.product_serializers import ImageDerivativesField
+from catalogue.sparse_fields import SparseFieldsSerializerMixin
+from catalogue.tasks import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
 
 
 class ImageSearchSerializer(serializers.Serializer):
     """Serializer for image search input"""
     image = serializers.ImageField(required=True)
     limit = serializers.IntegerField(default=10, min_value=1, max_value=100, required=False)
+    min_similarity = serializers.FloatField(min_value=-1.0, max_value=1.0, required=False)
 
 
-class ProductSearchResultSerializer(serializers.ModelSerializer):
-    """Serializer for product search results with similarity score"""
+class TextSearchSerializer(serializers.Serializer):
+    """Serializer for full-text search input"""
+    q = serializers.CharField(required=True, max_length=200)
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=100, required=False)
+
+
+class HybridSearchSerializer(ImageSearchSerializer):
+    """Serializer for hybrid text and image search input"""
+    q = serializers.CharField(required=True, max_length=200)
+
+
+class EmbeddingField(serializers.Field):
+    """
+    A float32 vector given as raw little-endian bytes or as a base64 string of those bytes.
+    """
+    default_error_messages = {
+        'invalid': 'Embedding must be base64 encoded little-endian float32 bytes.',
+        'dimension': 'Embedding must have {expected} dimensions, got {actual}.',
+        'not_finite': 'Embedding contains NaN or infinite values.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                data = base64.b64decode(data, validate=True)
+            except (binascii.Error, ValueError):
+                self.fail('invalid')
+        if not isinstance(data, (bytes, bytearray)) or len(data) % 4:
+            self.fail('invalid')
+        vector = np.frombuffer(data, dtype='<f4')
+        if vector.shape[0] != EMBEDDING_DIM:
+            self.fail('dimension', expected=EMBEDDING_DIM, actual=vector.shape[0])
+        if not np.isfinite(vector).all():
+            self.fail('not_finite')
+        return vector.astype('float32')
+
+
+class EmbeddingSearchSerializer(serializers.Serializer):
+    """Serializer for searching with a precomputed embedding"""
+    embedding = EmbeddingField(required=True)
+    model_version = serializers.CharField(required=True)
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=100, required=False)
+    min_similarity = serializers.FloatField(min_value=-1.0, max_value=1.0, required=False)
+
+    def validate_model_version(self, value):
+        if value != EMBEDDING_MODEL_VERSION:
+            raise serializers.ValidationError(
+                f'Unsupported model version, this index serves {EMBEDDING_MODEL_VERSION}.')
+        return value
+
+
+class SearchPageSerializer(serializers.Serializer):
+    """Serializer for fetching a further page of image search results"""
+    cursor = serializers.CharField(required=True)
+    limit = serializers.IntegerField(min_value=1, max_value=100, required=False)
+
+
+class ProductSearchResultSerializer(SparseFieldsSerializerMixin, ProductCardSerializerMixin, serializers.ModelSerializer):
+    """Serializer for product search result cards with similarity score, read from the card cache"""
     similarity_score = serializers.FloatField(read_only=True)
+    images = ImageDerivativesField(source='image_derivatives')
+    always_included = ('id', 'similarity_score')
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'sku', 'description', 'price', 'stock_quantity', 
-                  'image', 'category', 'similarity_score']
+        list_serializer_class = ProductCardListSerializer
+        # Must stay within hydration.CARD_FIELDS, the columns search results load
+        fields = ['id', 'name', 'sku', 'price', 'stock_quantity', 
+                  'image', 'images', 'category', 'similarity_score']
+
+    def load_product_cards(self, products):
+        # Hydration loaded updated_at, so the versions are known without a query
+        return get_card_cache().cards_for_products(products)
+
+    def to_representation(self, instance):
+        card = self.product_card(instance.id)
+        if card is None:
+            # Deleted since hydration: fall back to the loaded columns
+            return super().to_representation(instance)
+        data = {name: card[name] for name in self.fields if name != 'similarity_score'}
+        data['similarity_score'] = self.fields['similarity_score'].to_representation(instance.similarity_score)
+        return data
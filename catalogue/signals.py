@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from catalogue.caching import bump_generation
+from catalogue.models import Category, Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalogue_cache(sender, **kwargs):
+    """Any product or category change invalidates the cached catalogue lists."""
+    bump_generation()
@@ -0,0 +1,81 @@
+"""
+Sparse fieldsets for the product endpoints.
+
+``?fields=name,price,image`` narrows a response to those fields, and the
+query behind it to their columns, so listing clients do not pay for
+descriptions they never show. ``id`` is always included. Unknown names
+are a 400, so a typo does not silently return less than expected.
+"""
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+
+
+def parse_fields(request, allowed):
+    """
+    The fields a request asks for.
+
+    Args:
+        request: the DRF request
+        allowed: field names the endpoint can return
+
+    Returns:
+        tuple or None: the requested names in request order, None for all fields
+
+    Raises:
+        ValidationError: If a name is not one of ``allowed``
+    """
+    raw = request.query_params.get(FIELDS_PARAM, '')
+    names = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    if not names:
+        return None
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({FIELDS_PARAM: [f"Unknown field(s): {', '.join(unknown)}."]})
+    return names
+
+
+class SparseFieldsSerializerMixin:
+    """Drops the fields not named in ``context['fields']``, except ``always_included``."""
+    always_included = ('id',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        if requested:
+            keep = set(requested) | set(self.always_included)
+            for name in [name for name in self.fields if name not in keep]:
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """
+    Applies ``?fields=`` to a generic view: the serializer context gets the
+    requested fields and the queryset is narrowed with ``only()``. Other
+    methods than ``sparse_methods`` (writes) always get every field.
+    """
+    sparse_methods = ('GET', 'HEAD')
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            fields = None
+            if self.request.method in self.sparse_methods:
+                serializer_class = self.get_serializer_class()
+                fields = parse_fields(self.request, serializer_class().fields)
+                if fields is not None:
+                    fields = tuple(dict.fromkeys(serializer_class.always_included + fields))
+            self._requested_fields = fields
+        return self._requested_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_requested_fields()
+        if fields is not None:
+            serializer_fields = self.get_serializer_class()().fields
+            queryset = queryset.only(*[serializer_fields[name].source for name in fields])
+        return queryset
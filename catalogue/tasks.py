@@ -1,27 +1,41 @@
+import io
 import logging
 import time
 import numpy as np
-import torch
-import torchvision.models as models
-import torchvision.transforms as transforms
 from PIL import Image
 from django.conf import settings
 from celery import shared_task
+from .images import save_derivatives
 from .models import Product, ProductEmbedding
-import faiss
+from .search.metrics import Gauge, timed
+from .search.shards import get_sharded_index
+from .search.sidecar import get_sidecar_client
+from .search.snapshots import get_snapshot_store, get_snapshot_subscriber, publish_snapshot
+from .search.vector_store import make_vector_store, read_vector_store, write_vector_store
 import os
 
+# torch and torchvision are imported inside the functions that need them, so
+# processes that hand inference to the search sidecar never load them.
+
 logger = logging.getLogger(__name__)
 
 # Constants
 INDEX_FILE = getattr(settings, 'FAISS_INDEX_PATH', os.path.join(settings.BASE_DIR, 'faiss_index.bin'))
 EMBEDDING_DIM = 2048
+# Identifies the embedding space of the index; client supplied vectors must match it
+EMBEDDING_MODEL_VERSION = 'resnet50-imagenet1k-v2-avgpool'
 
 # Global cache to prevent redundant loading
 _MODEL = None
-_FAISS_INDEX = None
+_VECTOR_STORE = None
+# Version (index file mtime in ms) and wall clock time of the index held in memory
+_INDEX_VERSION = None
+_INDEX_LOADED_AT = None
 
 def get_model():
+    import torch
+    import torchvision.models as models
+
     global _MODEL
     if _MODEL is not None:
         return _MODEL
@@ -34,86 +48,264 @@ def get_model():
     _MODEL.eval()
     return _MODEL
 
-def get_transform():
+def get_transform(resize=256, crop=224):
+    import torchvision.transforms as transforms
+
     return transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
+        transforms.Resize(resize),
+        transforms.CenterCrop(crop),
         transforms.ToTensor(),
         transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
     ])
 
-def update_faiss_index(embedding, product_id):
-    # This is a naive implementation. In production, consider using a dedicated vector DB or handling concurrency limits.
-    global _FAISS_INDEX
+def load_index():
+    """
+    Return the in-memory VectorStore.
+
+    With SEARCH_SNAPSHOT_DIR set the index comes from the latest published
+    snapshot and is kept current by a background poller; otherwise it is
+    read from INDEX_FILE, or created empty with the SEARCH_VECTOR_BACKEND
+    backend.
+    """
+    global _VECTOR_STORE
     
-    if _FAISS_INDEX is None:
+    if _VECTOR_STORE is None:
+        subscriber = get_snapshot_subscriber(install_index, lambda: _VECTOR_STORE)
+        if subscriber is not None:
+            _pull_snapshot(subscriber)
+
+    if _VECTOR_STORE is None:
+        if os.path.exists(INDEX_FILE):
+            with timed('index_load'):
+                _VECTOR_STORE = read_vector_store(INDEX_FILE, _search_metric())
+            _mark_index_loaded()
+        else:
+            _VECTOR_STORE = make_vector_store(
+                getattr(settings, 'SEARCH_VECTOR_BACKEND', 'faiss'), EMBEDDING_DIM, _search_metric())
+    return _VECTOR_STORE
+
+def _search_metric():
+    return getattr(settings, 'SEARCH_METRIC', 'cosine')
+
+def _pull_snapshot(subscriber):
+    try:
+        subscriber.poll()
+    except Exception as e:
+        logger.error(f"Could not install index snapshot: {e}")
+    subscriber.start(getattr(settings, 'SEARCH_SNAPSHOT_POLL_INTERVAL', 30))
+
+def install_index(store, version):
+    """Hot-swap the in-memory index; searches already running finish on the old one."""
+    global _VECTOR_STORE, _INDEX_VERSION, _INDEX_LOADED_AT
+    _VECTOR_STORE = store
+    _INDEX_VERSION = version
+    _INDEX_LOADED_AT = time.time()
+
+def reload_index():
+    """Drop the in-memory index and read INDEX_FILE (or the latest snapshot) again. Returns the new version."""
+    global _VECTOR_STORE
+    subscriber = get_snapshot_subscriber(install_index, lambda: _VECTOR_STORE)
+    if subscriber is not None and _VECTOR_STORE is not None:
+        # Swap in the latest snapshot without dropping the index being served
+        _pull_snapshot(subscriber)
+        return _INDEX_VERSION
+    _VECTOR_STORE = None
+    load_index()
+    return _INDEX_VERSION
+
+def add_to_index(embeddings, product_ids):
+    """Add vectors to the index held by this process and persist it."""
+    if get_snapshot_subscriber(install_index, lambda: _VECTOR_STORE) is not None:
+        # The in-memory index is the last published snapshot, which lacks the vectors
+        # added since: build on INDEX_FILE instead and leave the served index alone
         if os.path.exists(INDEX_FILE):
-            _FAISS_INDEX = faiss.read_index(INDEX_FILE)
+            store = read_vector_store(INDEX_FILE, _search_metric())
         else:
-            base_index = faiss.IndexFlatL2(EMBEDDING_DIM)
-            # Using ID map to store product IDs
-            _FAISS_INDEX = faiss.IndexIDMap(base_index)
+            store = make_vector_store(
+                getattr(settings, 'SEARCH_VECTOR_BACKEND', 'faiss'), EMBEDDING_DIM, _search_metric())
+        store.add(embeddings, product_ids)
+        write_vector_store(store, INDEX_FILE)
+        return store.ntotal
+
+    store = load_index()
+    store.add(embeddings, product_ids)
+    write_vector_store(store, INDEX_FILE)
+    _mark_index_loaded()
+    return store.ntotal
 
-    # Faiss expects numpy array of float32
-    embedding_np = np.array([embedding], dtype='float32')
-    ids_np = np.array([product_id], dtype='int64')
+def update_faiss_index(embedding, product_id, category_id=None):
+    # This is a naive implementation. In production, consider using a dedicated vector DB or handling concurrency limits.
+    sharded = get_sharded_index(INDEX_FILE)
+    if sharded is not None:
+        sharded.add([embedding], [product_id], [category_id])
+        return
+    sidecar = get_sidecar_client()
+    if sidecar is not None:
+        # The sidecar owns the index; it adds and persists on our behalf
+        sidecar.add([embedding], [product_id])
+        return
+    add_to_index([embedding], [product_id])
 
-    _FAISS_INDEX.add_with_ids(embedding_np, ids_np)
-    faiss.write_index(_FAISS_INDEX, INDEX_FILE)
+def _mark_index_loaded():
+    global _INDEX_VERSION, _INDEX_LOADED_AT
+    _INDEX_LOADED_AT = time.time()
+    if os.path.exists(INDEX_FILE):
+        _INDEX_VERSION = int(os.path.getmtime(INDEX_FILE) * 1000)
 
-def generate_image_embedding(image_path):
+def get_index_stats():
     """
-    Generate embedding for an image file.
-    
+    Describe the index held by this process.
+
+    Returns:
+        dict: backend, ntotal, index type, dimension, estimated memory,
+        version and last reload time, or None if no index has been loaded yet
+    """
+    store = _VECTOR_STORE
+    if store is None:
+        return None
+    return dict(store.stats(), version=_INDEX_VERSION, loaded_at=_INDEX_LOADED_AT)
+
+def _index_stat(key):
+    def read():
+        stats = get_index_stats()
+        return stats[key] if stats and stats[key] is not None else None
+    return read
+
+def _index_info():
+    stats = get_index_stats()
+    if stats is None:
+        return None
+    return [({'type': stats['index_type'], 'dimension': stats['dimension']}, 1)]
+
+Gauge('search_index_vectors', 'Vectors in the in-memory FAISS index.', _index_stat('ntotal'))
+Gauge('search_index_memory_bytes', 'Estimated memory held by the FAISS index.', _index_stat('memory_bytes'))
+Gauge('search_index_version', 'Version of the loaded FAISS index.', _index_stat('version'))
+Gauge('search_index_last_reload_timestamp_seconds', 'When the FAISS index was last loaded or written.',
+      _index_stat('loaded_at'))
+Gauge('search_index_info', 'Type and dimension of the loaded FAISS index.', _index_info)
+
+def decode_image(source):
+    """
+    Decode an image to RGB.
+
     Args:
-        image_path: Path to the image file
-        
+        source: Path, file-like object or raw encoded bytes of the image
+
     Returns:
-        numpy array: 2048-dimensional embedding vector
+        PIL.Image.Image: the decoded image
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with timed('decode'):
+        return Image.open(source).convert('RGB')
+
+def preprocess_image(source, resize=256, crop=224):
     """
+    Decode and preprocess an image into a model input tensor.
+
+    Args:
+        source: Path, file-like object or raw encoded bytes of the image,
+            or an image decode_image already decoded
+        resize: Shorter side the image is resized to before cropping
+        crop: Side of the center crop fed to the model
+
+    Returns:
+        torch.Tensor: 3 x crop x crop input tensor
+    """
+    image = source if isinstance(source, Image.Image) else decode_image(source)
+    with timed('preprocess'):
+        return get_transform(resize, crop)(image)
+
+def embed_tensors(input_tensors):
+    """
+    Run a batch of preprocessed images through the model.
+
+    Returns:
+        numpy array: one 2048-dimensional embedding per input, shape (n, 2048)
+    """
+    import torch
+
     model = get_model()
-    preprocess = get_transform()
-    
-    # Load and preprocess image
-    image = Image.open(image_path).convert('RGB')
-    input_tensor = preprocess(image)
-    input_batch = input_tensor.unsqueeze(0)
+    input_batch = torch.stack(list(input_tensors))
     
     # Generate embedding
-    with torch.no_grad():
+    with timed('forward'), torch.no_grad():
         output = model(input_batch)
     
     # Flatten and return as numpy array
-    embedding = output.squeeze().numpy()
-    return embedding
+    return output.reshape(output.shape[0], -1).float().numpy()
+
+def generate_image_embedding(image_path, resize=256, crop=224, image=None):
+    """
+    Generate embedding for an image file.
+    
+    Args:
+        image_path: Path to the image file
+        resize: Shorter side the image is resized to before cropping
+        crop: Side of the center crop fed to the model
+        image: the file already decoded by decode_image, so it is not decoded
+            again; it is preprocessed here and only the input tensor goes to
+            the sidecar
+        
+    Returns:
+        numpy array: 2048-dimensional embedding vector
+    """
+    sidecar = get_sidecar_client()
+    if sidecar is not None and image is None:
+        with open(image_path, 'rb') as image_file:
+            return sidecar.embed(image_file.read(), resize=resize, crop=crop)
+
+    input_tensor = preprocess_image(image if image is not None else image_path, resize, crop)
+    if sidecar is not None:
+        return sidecar.embed_tensor(input_tensor)
+    return embed_tensors([input_tensor])[0]
+
+def search_index(queries, k, nprobe=None, min_similarity=None):
+    """
+    Search the index held by this process with a batch of queries.
+
+    Returns:
+        tuple: (distances, ids) arrays of shape (n, k); missing results, and
+        results below min_similarity, have id -1
+    """
+    store = load_index()
+    
+    # distances are cosine or squared L2 distances (lower is more similar)
+    with timed('faiss_search'):
+        return store.batch_search(queries, k, nprobe=nprobe, min_similarity=min_similarity)
 
-def search_similar_products(query_embedding, k=10):
+def search_similar_products(query_embedding, k=10, nprobe=None, min_similarity=None):
     """
     Search for similar products using FAISS.
     
     Args:
         query_embedding: numpy array of the query image embedding
         k: number of similar products to return
+        nprobe: inverted lists to probe when the index is IVF based, ignored otherwise
+        min_similarity: leave out products less similar than this
         
     Returns:
         list of tuples: [(product_id, distance), ...]
     """
-    global _FAISS_INDEX
-    
-    if not os.path.exists(INDEX_FILE) and _FAISS_INDEX is None:
+    sharded = get_sharded_index(INDEX_FILE)
+    if sharded is not None:
+        try:
+            return sharded.batch_search([query_embedding], k, nprobe=nprobe, min_similarity=min_similarity)[0]
+        except Exception as e:
+            logger.error(f"Error searching sharded FAISS index: {e}")
+            return []
+
+    sidecar = get_sidecar_client()
+    if sidecar is None and not os.path.exists(INDEX_FILE) and _VECTOR_STORE is None:
         logger.warning("FAISS index file not found and index not in memory. No products to search.")
         return []
     
     try:
-        if _FAISS_INDEX is None:
-            _FAISS_INDEX = faiss.read_index(INDEX_FILE)
-        
-        # Ensure query is 2D array of float32
-        query_np = np.array([query_embedding], dtype='float32')
-        
-        # Search for k nearest neighbors
-        # distances are L2 distances (lower is more similar)
-        distances, indices = _FAISS_INDEX.search(query_np, k)
+        if sidecar is not None:
+            distances, indices = sidecar.batch_search(
+                [query_embedding], k, nprobe=nprobe, min_similarity=min_similarity)
+        else:
+            distances, indices = search_index([query_embedding], k, nprobe=nprobe, min_similarity=min_similarity)
         
         # indices[0] contains the product IDs, distances[0] contains the distances
         results = []
@@ -126,6 +318,21 @@ def search_similar_products(query_embedding, k=10):
         logger.error(f"Error searching FAISS index: {e}")
         return []
 
+@shared_task
+def publish_index_snapshot():
+    """Publish INDEX_FILE as the next snapshot version for the search nodes."""
+    store = get_snapshot_store()
+    if store is None or not os.path.exists(INDEX_FILE):
+        return None
+    # Read the file rather than this worker's copy: it holds every worker's additions
+    manifest = publish_snapshot(
+        read_vector_store(INDEX_FILE, _search_metric()),
+        store,
+        deltas=getattr(settings, 'SEARCH_SNAPSHOT_DELTAS', True),
+        keep=getattr(settings, 'SEARCH_SNAPSHOT_KEEP', 3),
+    )
+    return manifest['version']
+
 @shared_task
 def generate_embedding(product_id):
     try:
@@ -134,9 +341,11 @@ def generate_embedding(product_id):
             logger.warning(f"Product {product_id} has no image.")
             return
 
-        # Generate embedding using helper function
+        # Decode once: the same image feeds the listing derivatives and the model
         image_path = product.image.path
-        embedding = generate_image_embedding(image_path)
+        image = decode_image(image_path)
+        save_derivatives(product, image)
+        embedding = generate_image_embedding(image_path, image=image)
 
         # Save to database
         ProductEmbedding.objects.update_or_create(
@@ -145,7 +354,7 @@ def generate_embedding(product_id):
         )
 
         # Update FAISS index
-        update_faiss_index(embedding.tolist(), product.id)
+        update_faiss_index(embedding.tolist(), product.id, product.category_id)
         
         logger.info(f"Successfully generated embedding for product {product_id}")
 
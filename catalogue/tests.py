@@ -65,7 +65,7 @@ class ProductAPITest(TestCase):
             
     def test_list_products_pagination(self):
         url = reverse('product-list')
-        response = self.client.get(url)
+        response = self.client.get(url, {'include_count': 'true'})
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Check pagination keys
@@ -81,21 +81,21 @@ class ProductAPITest(TestCase):
     def test_filter_by_price(self):
         url = reverse('product-list')
         # Filter price >= 20.0 (Product 10 to 14) -> 5 products
-        response = self.client.get(url, {'min_price': 20.0})
+        response = self.client.get(url, {'min_price': 20.0, 'include_count': 'true'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # 15 products. Prices: 10, 11, ..., 24.
         # >= 20: 20, 21, 22, 23, 24 -> 5 products.
         self.assertEqual(response.data['count'], 5)
         
         # Filter price <= 14.0 (Product 0 to 4) -> 5 products
-        response = self.client.get(url, {'max_price': 14.0})
+        response = self.client.get(url, {'max_price': 14.0, 'include_count': 'true'})
         self.assertEqual(response.data['count'], 5)
 
     def test_filter_by_stock(self):
         url = reverse('product-list')
          # Stock: 5, 6, ..., 19.
         # Filter stock >= 15 (Product 10 to 14) -> 5 products
-        response = self.client.get(url, {'min_stock': 15})
+        response = self.client.get(url, {'min_stock': 15, 'include_count': 'true'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 5)
 
@@ -113,7 +113,7 @@ class ProductAPITest(TestCase):
         )
 
         url = reverse('product-by-category', kwargs={'slug': 'electronics'})
-        response = self.client.get(url)
+        response = self.client.get(url, {'include_count': 'true'})
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Should return only electronics products (15 created in setUp)
@@ -121,11 +121,49 @@ class ProductAPITest(TestCase):
         
         # Test clothing category
         url = reverse('product-by-category', kwargs={'slug': 'clothing'})
-        response = self.client.get(url)
+        response = self.client.get(url, {'include_count': 'true'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
         self.assertEqual(response.data['results'][0]['name'], 'T-Shirt')
 
+    def test_cursor_pages_are_newest_first_and_keep_filters(self):
+        url = reverse('product-list')
+        response = self.client.get(url, {'min_stock': 8, 'page_size': 4})
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        names = [product['name'] for product in response.data['results']]
+        self.assertEqual(names, ['Product 14', 'Product 13', 'Product 12', 'Product 11'])
+
+        # The next link carries the filters and page size in its cursor only
+        seen = names
+        next_url = response.data['next']
+        self.assertNotIn('min_stock', next_url)
+        while next_url:
+            response = self.client.get(next_url)
+            seen += [product['name'] for product in response.data['results']]
+            previous_url, next_url = response.data['previous'], response.data['next']
+        self.assertEqual(seen, [f'Product {i}' for i in range(14, 2, -1)])
+
+        # Walking back from the last page returns the page before it
+        response = self.client.get(previous_url)
+        self.assertEqual([product['name'] for product in response.data['results']],
+                         ['Product 10', 'Product 9', 'Product 8', 'Product 7'])
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 5})
+        cursor = response.data['next'].split('cursor=')[1]
+        response = self.client.get(reverse('product-list'), {'cursor': cursor[:-3] + 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_count_query_runs_only_on_request(self):
+        url = reverse('product-list')
+        # The page only: no count, and no conditional GET validators without If-None-Match
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        response = self.client.get(url, {'include_count': 'true', 'min_price': 20.0})
+        self.assertEqual(response.data['count'], 5)
+        self.assertFalse(response.data['count_is_estimate'])
+
 
 from unittest.mock import patch
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -134,6 +172,13 @@ from PIL import Image
 import io
 
 
+def create_test_upload(name='search.jpg', size=32, color='red'):
+    """A small JPEG upload for the image search endpoints"""
+    image_file = io.BytesIO()
+    Image.new('RGB', (size, size), color=color).save(image_file, 'JPEG')
+    return SimpleUploadedFile(name, image_file.getvalue(), content_type='image/jpeg')
+
+
 class ProductCreateAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -286,8 +331,11 @@ class ProductCreateAPITest(TestCase):
 
 
 import os
+import shutil
 import tempfile
+import catalogue.tasks
 from catalogue.models import ProductEmbedding
+from catalogue.search.vector_store import NumpyVectorStore
 from catalogue.tasks import generate_embedding
 from django.core.files.base import ContentFile
 
@@ -302,6 +350,16 @@ class ProductEmbeddingTaskTest(TestCase):
             slug='electronics', 
             description='Electronic items'
         )
+        # Index into a NumPy vector store written to a temp file, not the real index
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = NumpyVectorStore()
+        for patcher in (
+            patch.object(catalogue.tasks, '_VECTOR_STORE', self.store),
+            patch.object(catalogue.tasks, 'INDEX_FILE', os.path.join(self.tmpdir, 'index.bin')),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
         
     def create_test_image(self):
         """Create a simple test image as ContentFile"""
@@ -311,8 +369,7 @@ class ProductEmbeddingTaskTest(TestCase):
         image_file.seek(0)
         return ContentFile(image_file.read(), name='test_embed.jpg')
     
-    @patch('catalogue.tasks.faiss')
-    def test_generate_embedding_creates_product_embedding(self, mock_faiss):
+    def test_generate_embedding_creates_product_embedding(self):
         """Test that generate_embedding task creates ProductEmbedding"""
         # Create product with image
         product = Product.objects.create(
@@ -325,11 +382,6 @@ class ProductEmbeddingTaskTest(TestCase):
         )
         product.image.save('test.jpg', self.create_test_image(), save=True)
         
-        # Mock FAISS index operations
-        mock_index = MagicMock()
-        mock_faiss.IndexFlatL2.return_value = mock_index
-        mock_faiss.IndexIDMap.return_value = mock_index
-        
         # Run the task
         generate_embedding(product.id)
         
@@ -343,8 +395,7 @@ class ProductEmbeddingTaskTest(TestCase):
         
         self.assertTrue(all(isinstance(x, float) for x in embedding.embedding_vector))
     
-    @patch('catalogue.tasks.faiss')
-    def test_generate_embedding_updates_faiss_index(self, mock_faiss):
+    def test_generate_embedding_updates_faiss_index(self):
         """Test that FAISS index is updated with new embedding"""
         product = Product.objects.create(
             name='Test Product 2',
@@ -356,24 +407,16 @@ class ProductEmbeddingTaskTest(TestCase):
         )
         product.image.save('test2.jpg', self.create_test_image(), save=True)
         
-        # Mock FAISS index operations
-        mock_index = MagicMock()
-        mock_faiss.IndexFlatL2.return_value = mock_index
-        mock_faiss.IndexIDMap.return_value = mock_index
-        mock_faiss.read_index.return_value = mock_index
-        
         # Run the task
         generate_embedding(product.id)
         
-        # Verify FAISS operations were called
-        # add_with_ids should be called with embedding and product ID
-        mock_index.add_with_ids.assert_called_once()
+        # Verify the embedding was added under the product ID
+        self.assertEqual(self.store.ids().tolist(), [product.id])
         
-        # Verify write_index was called to persist the index
-        mock_faiss.write_index.assert_called_once()
+        # Verify the index was persisted
+        self.assertTrue(os.path.exists(catalogue.tasks.INDEX_FILE))
     
-    @patch('catalogue.tasks.faiss')
-    def test_generate_embedding_with_existing_embedding(self, mock_faiss):
+    def test_generate_embedding_with_existing_embedding(self):
         """Test that existing embeddings are updated, not duplicated"""
         product = Product.objects.create(
             name='Test Product 3',
@@ -391,11 +434,6 @@ class ProductEmbeddingTaskTest(TestCase):
             embedding_vector=[0.0] * 2048
         )
         
-        # Mock FAISS
-        mock_index = MagicMock()
-        mock_faiss.IndexFlatL2.return_value = mock_index
-        mock_faiss.IndexIDMap.return_value = mock_index
-        
         # Run the task again
         generate_embedding(product.id)
         
@@ -586,10 +624,11 @@ class ProductImageSearchAPITest(TestCase):
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        # Verify search was called with limit=3
+        # Verify search fetched the cursor candidate pool and only 3 results came back
         mock_search.assert_called_once()
         call_args = mock_search.call_args
-        self.assertEqual(call_args[1]['k'], 3)
+        self.assertEqual(call_args[1]['k'], 1000)
+        self.assertEqual(response.data['count'], 3)
 
 
 class ProductDetailAPITest(TestCase):
@@ -825,3 +864,2026 @@ class OrderAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['product'], self.product.id)
+
+
+import threading
+import time
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, override_settings
+from rest_framework.request import Request
+from catalogue.search.admission import AdmissionController, AdmissionRejected, get_client_key
+
+
+class AdmissionControllerTest(TestCase):
+    """Tests for the search admission controller"""
+
+    def wait_for_queue(self, controller, depth):
+        deadline = time.monotonic() + 2
+        while controller.queue_depth < depth and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(controller.queue_depth, depth)
+
+    def test_rejects_with_503_when_queue_full(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, max_queue_per_client=1, queue_timeout=1)
+        controller.acquire('a')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('b')
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(controller.stats()['rejected'], 1)
+
+    def test_rejects_with_429_when_client_queue_full(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=10, max_queue_per_client=0, queue_timeout=1)
+        controller.acquire('a')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('a')
+        self.assertEqual(ctx.exception.status_code, 429)
+
+    def test_queued_request_times_out(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=5, max_queue_per_client=5, queue_timeout=0.05)
+        controller.acquire('a')
+        with self.assertRaises(AdmissionRejected) as ctx:
+            controller.acquire('b')
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(controller.queue_depth, 0)
+        self.assertEqual(controller.stats()['timed_out'], 1)
+
+    def test_slots_are_shared_round_robin_between_clients(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=10, max_queue_per_client=5, queue_timeout=5)
+        controller.acquire('holder')
+        order = []
+
+        def worker(client):
+            controller.acquire(client)
+            order.append(client)
+            controller.release()
+
+        threads = []
+        # Client "a" queues two requests before client "b" queues one
+        for client, depth in [('a', 1), ('a', 2), ('b', 3)]:
+            thread = threading.Thread(target=worker, args=(client,))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queue(controller, depth)
+
+        controller.release()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(order, ['a', 'b', 'a'])
+        stats = controller.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    @patch('catalogue.api_views.product_views.get_admission_controller')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_search_view_sheds_load_with_retry_after(self, mock_generate_embedding, mock_get_controller):
+        controller = AdmissionController(max_concurrency=0, max_queue=0, max_queue_per_client=0, queue_timeout=1)
+        mock_get_controller.return_value = controller
+
+        upload = create_test_upload()
+
+        response = APIClient().post(reverse('product-search-upload'), {'image': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        mock_generate_embedding.assert_not_called()
+
+    def test_client_key_only_trusts_forwarded_for_from_trusted_proxies(self):
+        def key(remote, forwarded=None):
+            request = Request(RequestFactory().get('/', REMOTE_ADDR=remote, HTTP_X_FORWARDED_FOR=forwarded or ''))
+            request.user = AnonymousUser()
+            return get_client_key(request)
+
+        # Without trusted proxies a client cannot pick its own queue with X-Forwarded-For
+        self.assertEqual(key('203.0.113.9', '1.2.3.4'), 'ip:203.0.113.9')
+        with override_settings(SEARCH_TRUSTED_PROXIES=['10.0.0.0/8', '192.0.2.1']):
+            self.assertEqual(key('203.0.113.9', '1.2.3.4'), 'ip:203.0.113.9')
+            # The right-most hop not added by a trusted proxy, whatever the client prepended
+            self.assertEqual(key('10.0.0.5', '1.2.3.4, 198.51.100.7, 192.0.2.1'), 'ip:198.51.100.7')
+            self.assertEqual(key('10.0.0.5', '198.51.100.7'), 'ip:198.51.100.7')
+            self.assertEqual(key('10.0.0.5'), 'ip:10.0.0.5')
+
+
+from catalogue.search.tiers import TIERS, QualityGovernor
+
+
+class QualityGovernorTest(TestCase):
+    """Tests for adaptive search quality tiers"""
+
+    def test_full_quality_at_normal_load(self):
+        governor = QualityGovernor(TIERS, max_queue=20)
+        self.assertEqual(governor.select(0).name, 'full')
+        self.assertEqual(governor.select(4).name, 'full')
+
+    def test_degrades_as_queue_grows(self):
+        governor = QualityGovernor(TIERS, max_queue=20)
+        self.assertEqual(governor.select(5).name, 'reduced')
+        self.assertEqual(governor.select(15).name, 'economy')
+
+    def test_hysteresis_holds_tier_until_queue_drains(self):
+        governor = QualityGovernor(TIERS, max_queue=20, min_dwell=0)
+        governor.select(15)
+        # Below the economy enter threshold but above its exit threshold
+        self.assertEqual(governor.select(8).name, 'economy')
+        self.assertEqual(governor.select(5).name, 'reduced')
+        self.assertEqual(governor.select(3).name, 'reduced')
+        self.assertEqual(governor.select(0).name, 'full')
+
+    def test_min_dwell_delays_recovery(self):
+        governor = QualityGovernor(TIERS, max_queue=20, min_dwell=60)
+        governor.select(15)
+        self.assertEqual(governor.select(0).name, 'economy')
+        self.assertEqual(governor.switches, 1)
+
+    def test_disabled_always_serves_full_quality(self):
+        governor = QualityGovernor(TIERS, max_queue=20, enabled=False)
+        self.assertEqual(governor.select(20).name, 'full')
+
+    @patch('catalogue.api_views.product_views.get_quality_governor')
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_search_reports_serving_tier(self, mock_generate_embedding, mock_search, mock_get_governor):
+        governor = QualityGovernor(TIERS, max_queue=20)
+        governor.select(20)
+        mock_get_governor.return_value = governor
+        mock_generate_embedding.return_value = np.zeros(2048)
+        mock_search.return_value = []
+
+        upload = create_test_upload()
+
+        response = APIClient().post(reverse('product-search-upload'), {'image': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tier'], 'economy')
+        self.assertEqual(mock_generate_embedding.call_args[1], {'resize': 160, 'crop': 128})
+        self.assertEqual(mock_search.call_args[1]['nprobe'], 4)
+        # A quarter of the SEARCH_CURSOR_CANDIDATES pool, which matters on a flat index too
+        self.assertEqual(mock_search.call_args[1]['k'], 250)
+
+
+import faiss
+import catalogue.tasks
+from django.test import override_settings
+from catalogue.search.metrics import Histogram, render_prometheus
+
+
+class SearchMetricsTest(TestCase):
+    """Tests for search pipeline instrumentation"""
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram('test_latency_seconds', 'Test latency.', labelnames=('stage',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage='a')
+        histogram.observe(0.5, stage='a')
+        histogram.observe(5.0, stage='a')
+
+        output = render_prometheus()
+
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="0.1"} 1', output)
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="1.0"} 2', output)
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="+Inf"} 3', output)
+        self.assertIn('test_latency_seconds_count{stage="a"} 3', output)
+        self.assertEqual(histogram.snapshot(stage='a'), (3, 5.55))
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_search_emits_server_timing(self, mock_generate_embedding, mock_search):
+        product = Product.objects.create(
+            name='Product 1', sku='SKU-001', description='Desc',
+            price=29.99, stock_quantity=100
+        )
+        mock_generate_embedding.return_value = np.zeros(2048)
+        mock_search.return_value = [(product.id, 0.5)]
+
+        response = APIClient().post(
+            reverse('product-search-upload'), {'image': create_test_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for stage in ['upload', 'queue', 'spool', 'hydrate', 'serialize', 'total']:
+            self.assertIn(stage, stages)
+
+    def test_metrics_endpoint_reports_stages_and_index_stats(self):
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(2048))
+        index.add_with_ids(np.zeros((3, 2048), dtype='float32'), np.array([1, 2, 3], dtype='int64'))
+
+        with patch.object(catalogue.tasks, '_VECTOR_STORE', FaissVectorStore(index)):
+            catalogue.tasks.search_similar_products(np.zeros(2048), k=2)
+            client = APIClient()
+            client.force_authenticate(User.objects.create_user(
+                email='staff@example.com', username='staff', password='testpass123', is_staff=True))
+            response = client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('search_stage_seconds_count{stage="faiss_search"}', body)
+        self.assertIn('search_index_vectors 3.0', body)
+        self.assertIn('search_index_info{dimension="2048",type="IndexIDMap"} 1.0', body)
+        self.assertIn('search_queue_depth', body)
+        self.assertIn('# TYPE search_admitted_total counter', body)
+        self.assertIn('# TYPE search_queue_depth gauge', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_requires_staff_or_scrape_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            email='user@example.com', username='user', password='testpass123'))
+        self.assertEqual(client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('search_stage_seconds', response.content.decode())
+
+
+from catalogue.search.hydration import fetch_ranked, hydrate
+from catalogue.search.vector_store import FaissVectorStore, write_vector_store
+
+
+class SearchHydrationTest(TestCase):
+    """Tests for loading search candidates into result cards"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Electronics', slug='electronics', description='Desc')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', sku=f'SKU-{i}', description='A long description',
+                price=10 + i, stock_quantity=5, category=self.category, is_active=(i % 2 == 0)
+            )
+            for i in range(8)
+        ]
+        # FAISS order deliberately differs from primary key order
+        self.candidates = [(p.id, float(d)) for d, p in enumerate(reversed(self.products))]
+
+    def test_hydrate_keeps_rank_order_and_skips_inactive(self):
+        with self.assertNumQueries(1):
+            results, consumed = hydrate(self.candidates, limit=10)
+
+        self.assertEqual([p.id for p in results], [p.id for p in reversed(self.products) if p.is_active])
+        self.assertEqual(consumed, len(self.candidates))
+        self.assertGreater(results[0].similarity_score, results[1].similarity_score)
+        # The description column is deferred, not loaded
+        self.assertIn('description', results[0].get_deferred_fields())
+
+    def test_fetch_ranked_widens_search_to_fill_limit(self):
+        searched = []
+
+        def search(k):
+            searched.append(k)
+            return self.candidates[:k]
+
+        results, _, _ = fetch_ranked(search, limit=3, overfetch=1.0)
+
+        # k=3 yields only one active product, k=6 yields the three needed
+        self.assertEqual(searched, [3, 6])
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(p.is_active for p in results))
+
+    def test_fetch_ranked_stops_when_index_exhausted(self):
+        searched = []
+
+        def search(k):
+            searched.append(k)
+            return self.candidates[:k]
+
+        results, _, _ = fetch_ranked(search, limit=10, overfetch=2.0)
+
+        self.assertEqual(searched, [20])
+        self.assertEqual(len(results), 4)
+
+
+from django.core.cache import cache
+from catalogue.checks import search_cursor_cache_check
+from catalogue.search.cursors import encode_cursor
+
+
+@override_settings(SEARCH_CURSOR_TTL=600)
+class ImageSearchPaginationTest(TestCase):
+    """Tests for paging through image search results with a cursor"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', sku=f'SKU-{i}', description='Desc',
+                price=10 + i, stock_quantity=5
+            )
+            for i in range(25)
+        ]
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_pages_are_served_from_cached_candidates(self, mock_generate_embedding, mock_search):
+        mock_generate_embedding.return_value = np.zeros(2048)
+        mock_search.side_effect = lambda query, k, **kwargs: [
+            (p.id, float(i)) for i, p in enumerate(self.products)][:k]
+
+        response = self.client.post(
+            reverse('product-search-upload'), {'image': create_test_upload(), 'limit': 10},
+            format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in response.data['results']], [p.id for p in self.products[:10]])
+        self.assertIsNotNone(response.data['cursor'])
+
+        seen = []
+        cursor = response.data['cursor']
+        while cursor:
+            page = self.client.get(reverse('product-search-page'), {'cursor': cursor})
+            self.assertEqual(page.status_code, status.HTTP_200_OK)
+            seen.extend(r['id'] for r in page.data['results'])
+            cursor = page.data['cursor']
+
+        self.assertEqual(seen, [p.id for p in self.products[10:]])
+        # Neither inference nor the index ran again
+        self.assertEqual(mock_generate_embedding.call_count, 1)
+        self.assertEqual(mock_search.call_count, 1)
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(reverse('product-search-page'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_cursor_returns_gone(self):
+        cursor = encode_cursor('missing-token', 10, 10)
+        response = self.client.get(reverse('product-search-page'), {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    @override_settings(SEARCH_CURSOR_TTL=0)
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_no_cursor_without_a_shared_cache(self, mock_generate_embedding, mock_search):
+        mock_generate_embedding.return_value = np.zeros(2048)
+        mock_search.side_effect = lambda query, k, **kwargs: [
+            (p.id, float(i)) for i, p in enumerate(self.products)][:k]
+
+        response = self.client.post(
+            reverse('product-search-upload'), {'image': create_test_upload(), 'limit': 10},
+            format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        # No cursor that another worker could not resolve
+        self.assertIsNone(response.data['cursor'])
+        self.assertIsNone(response.data['next'])
+
+    def test_cursors_in_a_per_process_cache_are_flagged(self):
+        # The test settings have no CACHE_REDIS_URL, so the default cache is LocMemCache
+        self.assertEqual([warning.id for warning in search_cursor_cache_check(None)], ['catalogue.W001'])
+        with override_settings(SEARCH_CURSOR_TTL=0):
+            self.assertEqual(search_cursor_cache_check(None), [])
+
+
+
+import base64
+from catalogue.tasks import EMBEDDING_MODEL_VERSION
+
+
+class EmbeddingSearchAPITest(TestCase):
+    """Tests for searching with a client supplied embedding"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('product-search-vector')
+        self.product = Product.objects.create(
+            name='Product 1', sku='SKU-001', description='Desc', price=29.99, stock_quantity=100
+        )
+        self.vector = np.arange(2048, dtype='<f4') / 2048
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_search_with_base64_embedding(self, mock_generate_embedding, mock_search):
+        mock_search.return_value = [(self.product.id, 0.1)]
+        data = {
+            'embedding': base64.b64encode(self.vector.tobytes()).decode(),
+            'model_version': EMBEDDING_MODEL_VERSION,
+            'limit': 5,
+        }
+
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], self.product.id)
+        np.testing.assert_array_equal(mock_search.call_args[0][0], self.vector)
+        mock_generate_embedding.assert_not_called()
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    def test_search_with_raw_bytes(self, mock_search):
+        mock_search.return_value = [(self.product.id, 0.1)]
+        url = f'{self.url}?model_version={EMBEDDING_MODEL_VERSION}&limit=5'
+
+        response = self.client.generic('POST', url, self.vector.tobytes(), content_type='application/octet-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        np.testing.assert_array_equal(mock_search.call_args[0][0], self.vector)
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    def test_rejects_wrong_dimension(self, mock_search):
+        data = {
+            'embedding': base64.b64encode(self.vector[:512].tobytes()).decode(),
+            'model_version': EMBEDDING_MODEL_VERSION,
+        }
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('embedding', response.data)
+        mock_search.assert_not_called()
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    def test_rejects_unknown_model_version(self, mock_search):
+        data = {
+            'embedding': base64.b64encode(self.vector.tobytes()).decode(),
+            'model_version': 'clip-vit-b32',
+        }
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('model_version', response.data)
+        mock_search.assert_not_called()
+
+
+import shutil
+import torch
+from django.test import override_settings
+import socket
+from catalogue.search import sidecar as sidecar_module
+from catalogue.search.sidecar import SidecarClient, SidecarError
+from catalogue.search.sidecar_server import MicroBatcher, SearchSidecarServer
+
+
+class SearchSidecarTest(TestCase):
+    """Tests for the search sidecar protocol, server and client"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'search.sock')
+        self.index = faiss.IndexIDMap(faiss.IndexFlatL2(2048))
+        self.vectors = np.eye(4, 2048, dtype='float32')
+        self.index.add_with_ids(self.vectors, np.array([10, 20, 30, 40], dtype='int64'))
+
+        # Stand-in for ResNet50: any image maps to a 2048-dim vector
+        self.model = torch.nn.Sequential(torch.nn.AdaptiveAvgPool2d(1), torch.nn.Conv2d(3, 2048, 1))
+        patchers = [
+            patch.object(catalogue.tasks, '_VECTOR_STORE', FaissVectorStore(self.index)),
+            patch.object(catalogue.tasks, 'INDEX_FILE', os.path.join(self.tmpdir, 'index.bin')),
+            patch.object(catalogue.tasks, 'get_model', lambda: self.model),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.server = SearchSidecarServer(self.socket_path, max_batch=8, max_wait=0.01)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.client = SidecarClient(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_search_and_batch_search(self):
+        distances, ids = self.client.search(self.vectors[1], k=2)
+        self.assertEqual(ids[0], 20)
+        self.assertAlmostEqual(float(distances[0]), 0.0)
+
+        distances, ids = self.client.batch_search(self.vectors[[2, 3]], k=1)
+        self.assertEqual(ids.tolist(), [[30], [40]])
+
+    def test_embed(self):
+        image = Image.new('RGB', (64, 64), color='blue')
+        image_file = io.BytesIO()
+        image.save(image_file, 'JPEG')
+
+        embedding = self.client.embed(image_file.getvalue(), resize=64, crop=64)
+
+        self.assertEqual(embedding.shape, (2048,))
+        self.assertEqual(embedding.dtype, np.float32)
+
+    def test_decoded_image_is_sent_as_a_tensor(self):
+        image = Image.new('RGB', (64, 64), color='blue')
+        image_file = io.BytesIO()
+        image.save(image_file, 'PNG')
+        expected = self.client.embed(image_file.getvalue(), resize=64, crop=64)
+
+        # The ingest path already decoded the upload: nothing is opened or decoded again
+        with patch.object(catalogue.tasks, 'get_sidecar_client', return_value=self.client), \
+                patch('catalogue.tasks.Image.open') as mock_open:
+            embedding = catalogue.tasks.generate_image_embedding('/missing.png', resize=64, crop=64, image=image)
+
+        mock_open.assert_not_called()
+        np.testing.assert_allclose(embedding, expected, rtol=1e-5, atol=1e-6)
+
+    def test_add_persists_and_reload_reads_back(self):
+        ntotal = self.client.add(np.full((1, 2048), 0.5, dtype='float32'), [50])
+        self.assertEqual(ntotal, 5)
+        self.assertTrue(os.path.exists(catalogue.tasks.INDEX_FILE))
+
+        self.client.reload()
+        self.assertEqual(catalogue.tasks._VECTOR_STORE.ntotal, 5)
+
+    def test_lost_responses_are_retried_only_for_idempotent_requests(self):
+        real_recv_frame = sidecar_module.recv_frame
+        lost = []
+
+        def recv_frame(sock):
+            # The first response is lost after the sidecar handled the request
+            if not lost:
+                lost.append(real_recv_frame(sock))
+                raise socket.timeout('timed out')
+            return real_recv_frame(sock)
+
+        with patch.object(sidecar_module, 'recv_frame', recv_frame):
+            _, ids = self.client.search(self.vectors[1], k=1)
+            self.assertEqual(ids[0], 20)
+
+            lost.clear()
+            with self.assertRaises(SidecarError):
+                self.client.add(np.full((1, 2048), 0.5, dtype='float32'), [50])
+        # Applied once, not a second time by a retry
+        self.assertEqual(catalogue.tasks._VECTOR_STORE.ids().tolist().count(50), 1)
+
+    def test_concurrent_searches_are_micro_batched(self):
+        calls = []
+
+        def run_batch(key, items):
+            calls.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(run_batch, max_batch=8, max_wait=0.2)
+        results = [None] * 4
+
+        def submit(i):
+            results[i] = batcher.submit('key', i)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(results, [0, 2, 4, 6])
+        self.assertLess(len(calls), 4)
+
+    def test_min_similarity_is_sent_over_the_socket(self):
+        _, ids = self.client.search(self.vectors[1], k=3, min_similarity=0.5)
+        self.assertEqual(ids.tolist(), [20, -1, -1])
+
+    def test_errors_are_reported_to_the_client(self):
+        from catalogue.search.sidecar import SidecarError
+        with self.assertRaises(SidecarError):
+            self.client.call(99)
+
+    def test_search_similar_products_uses_sidecar_when_configured(self):
+        with override_settings(SEARCH_SIDECAR_SOCKET=self.socket_path):
+            results = catalogue.tasks.search_similar_products(self.vectors[3], k=1)
+        self.assertEqual(results, [(40, 0.0)])
+
+
+import multiprocessing
+from catalogue.search import shards as shard_module
+from catalogue.search.shards import LocalShard, ShardedIndex, merge_topk, shard_path, split_index
+from catalogue.search.sidecar_server import serve_shard
+
+
+class ShardedIndexTest(TestCase):
+    """Tests for the sharded index and scatter-gather search"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.index_file = os.path.join(self.tmpdir, 'faiss_index.bin')
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((60, 2048), dtype='float32')
+        self.ids = list(range(1, 61))
+        self.queries = rng.random((3, 2048), dtype='float32')
+
+        # Single flat index as the reference for what sharded search must return
+        self.flat = FaissVectorStore(metric='cosine')
+        self.flat.add(self.vectors, self.ids)
+
+    def local_shards(self, num_shards):
+        return [LocalShard(shard_path(self.index_file, i, num_shards)) for i in range(num_shards)]
+
+    def expected(self, k):
+        distances, ids = self.flat.batch_search(self.queries, k)
+        return [[int(i) for i in row] for row in ids]
+
+    def test_merge_topk_interleaves_sorted_shard_lists(self):
+        merged = merge_topk([[(1, 0.1), (2, 0.5)], [(3, 0.2), (4, 0.3)], []], 3)
+        self.assertEqual(merged, [(1, 0.1), (3, 0.2), (4, 0.3)])
+
+    def test_merge_topk_returns_each_product_once(self):
+        merged = merge_topk([[(1, 0.1), (2, 0.4)], [(1, 0.3), (3, 0.5)]], 3)
+        self.assertEqual(merged, [(1, 0.1), (2, 0.4), (3, 0.5)])
+
+    def test_scatter_gather_matches_single_index(self):
+        sharded = ShardedIndex(self.local_shards(4))
+        sharded.add(self.vectors, self.ids)
+
+        self.assertEqual(sum(shard.ntotal for shard in sharded.shards), 60)
+        self.assertTrue(all(shard.ntotal > 0 for shard in sharded.shards))
+        results = sharded.batch_search(self.queries, 10)
+        self.assertEqual([[pid for pid, _ in row] for row in results], self.expected(10))
+
+    def test_category_partition_keeps_a_category_on_one_shard(self):
+        sharded = ShardedIndex(self.local_shards(3), partition='category')
+        categories = [pid % 5 for pid in self.ids]
+        sharded.add(self.vectors, self.ids, categories)
+
+        for category in range(5):
+            owners = {sharded.shard_for(pid, category) for pid in self.ids if pid % 5 == category}
+            self.assertEqual(len(owners), 1)
+
+    def test_product_moved_to_another_category_leaves_its_old_shard(self):
+        sharded = ShardedIndex(self.local_shards(3), partition='category')
+        sharded.add(self.vectors, self.ids, [0] * 60)
+        new_category = next(c for c in range(1, 10) if sharded.shard_for(1, c) != sharded.shard_for(1, 0))
+
+        sharded.add(self.vectors[:1], [1], [new_category])
+        self.assertEqual(sum(shard.ntotal for shard in sharded.shards), 60)
+        results = sharded.batch_search(self.vectors[:1], 5)[0]
+        self.assertEqual([pid for pid, _ in results].count(1), 1)
+        # Re-adding to the same shard replaces the vector rather than duplicating it
+        sharded.add(self.vectors[:1], [1], [new_category])
+        self.assertEqual(sum(shard.ntotal for shard in sharded.shards), 60)
+
+    def test_searches_do_not_wait_for_the_shard_lock(self):
+        shard = self.local_shards(1)[0]
+        shard.add(self.vectors, self.ids)
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with shard.lock:
+                locked.set()
+                release.wait(5)
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        self.addCleanup(holder.join)
+        self.addCleanup(release.set)
+        locked.wait(5)
+
+        # A mutation in progress keeps its own copy; the served store stays searchable
+        started = time.monotonic()
+        distances, ids = shard.batch_search(self.queries, 5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(ids.tolist(), self.expected(5))
+
+    def test_split_index_writes_shard_files(self):
+        counts = split_index(self.flat, 3, self.index_file)
+        self.assertEqual(sum(counts), 60)
+        for i in range(3):
+            self.assertTrue(os.path.exists(shard_path(self.index_file, i, 3)))
+        with self.assertRaises(FileExistsError):
+            split_index(self.flat, 3, self.index_file)
+
+    def test_shard_processes_stand_in(self):
+        split_index(self.flat, 2, self.index_file)
+        sockets = [os.path.join(self.tmpdir, f'shard-{i}.sock') for i in range(2)]
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=serve_shard, args=(sockets[i], shard_path(self.index_file, i, 2)), daemon=True)
+            for i in range(2)
+        ]
+        for process in processes:
+            process.start()
+            self.addCleanup(process.terminate)
+        deadline = time.monotonic() + 10
+        while not all(os.path.exists(path) for path in sockets) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        sharded = ShardedIndex([SidecarClient(path) for path in sockets])
+        results = sharded.batch_search(self.queries, 10)
+        self.assertEqual([[pid for pid, _ in row] for row in results], self.expected(10))
+
+        on_first = [pid for pid in self.ids if sharded.shard_for(pid) == 0]
+        self.assertEqual(sharded.shards[0].remove(on_first[:2]), 2)
+        self.assertEqual(sharded.shards[1].remove(on_first[:2]), 0)
+
+    def test_search_similar_products_uses_shards_when_configured(self):
+        split_index(self.flat, 3, self.index_file)
+        with override_settings(SEARCH_SHARDS=3), \
+                patch.object(catalogue.tasks, 'INDEX_FILE', self.index_file), \
+                patch.object(shard_module, '_SHARDED_INDEX', None):
+            results = catalogue.tasks.search_similar_products(self.queries[0], k=5)
+        self.assertEqual([pid for pid, _ in results], self.expected(5)[0])
+
+
+from catalogue.search import snapshots as snapshot_module
+from catalogue.search.snapshots import (
+    DirectoryStore, SnapshotError, SnapshotSubscriber, node_status, publish_snapshot, read_manifest,
+)
+from catalogue.search.vector_store import load_vector_store
+
+
+class IndexSnapshotTest(TestCase):
+    """Tests for publishing index snapshots and hot-swapping them on nodes"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = DirectoryStore(self.tmpdir)
+        self.rng = np.random.default_rng(1)
+        self.index = FaissVectorStore()
+        self.add(range(1, 11))
+        self.installed = []
+
+    def add(self, ids):
+        ids = list(ids)
+        self.index.add(self.rng.random((len(ids), 2048), dtype='float32'), ids)
+
+    def subscriber(self):
+        def install(index, version):
+            self.installed.append((index, version))
+        return SnapshotSubscriber(
+            self.store, install, lambda: self.installed[-1][0] if self.installed else None, node='node-a',
+        )
+
+    def test_publish_then_subscribe_installs_full_snapshot(self):
+        manifest = publish_snapshot(self.index, self.store)
+        self.assertEqual(manifest['version'], 1)
+        self.assertIsNone(manifest['delta'])
+
+        subscriber = self.subscriber()
+        self.assertTrue(subscriber.poll())
+        self.assertFalse(subscriber.poll())
+        index, version = self.installed[-1]
+        self.assertEqual((index.ntotal, version), (10, 1))
+        self.assertEqual(subscriber.lag, 0)
+
+    def test_node_one_version_behind_applies_delta(self):
+        publish_snapshot(self.index, self.store)
+        subscriber = self.subscriber()
+        subscriber.poll()
+
+        self.add(range(11, 16))
+        manifest = publish_snapshot(self.index, self.store)
+        self.assertEqual(manifest['delta']['count'], 5)
+
+        fetched = []
+        original_get = self.store.get
+        with patch.object(self.store, 'get', side_effect=lambda name: fetched.append(name) or original_get(name)):
+            self.assertTrue(subscriber.poll())
+        self.assertIn(manifest['delta']['name'], fetched)
+        self.assertNotIn(manifest['snapshot']['name'], fetched)
+
+        index, version = self.installed[-1]
+        self.assertEqual((index.ntotal, version), (15, 2))
+        query = self.index.vectors_from(14)[0]
+        self.assertEqual(index.search(query, 1)[1][0], 15)
+
+    def test_corrupt_snapshot_is_rejected(self):
+        manifest = publish_snapshot(self.index, self.store)
+        self.store.put(manifest['snapshot']['name'], b'garbage')
+
+        subscriber = self.subscriber()
+        with self.assertRaises(SnapshotError):
+            subscriber.poll()
+        self.assertEqual(self.installed, [])
+        self.assertEqual(subscriber.failures, 1)
+
+    def test_node_status_reports_lag_and_old_versions_are_pruned(self):
+        publish_snapshot(self.index, self.store, keep=2)
+        self.subscriber().poll()
+        for start in (11, 12):
+            self.add([start])
+            publish_snapshot(self.index, self.store, keep=2)
+
+        [status] = node_status(self.store)
+        self.assertEqual((status['node'], status['version'], status['lag']), ('node-a', 1, 2))
+        self.assertEqual(len(self.store.list('snapshots')), 2)
+
+    def test_unchanged_index_is_not_republished(self):
+        first = publish_snapshot(self.index, self.store)
+        self.assertEqual(publish_snapshot(self.index, self.store), first)
+        self.assertEqual(len(self.store.list('snapshots')), 1)
+        self.add([11])
+        self.assertEqual(publish_snapshot(self.index, self.store)['version'], 2)
+
+    def test_index_writer_never_loses_vectors_to_an_older_snapshot(self):
+        index_file = os.path.join(self.tmpdir, 'index.bin')
+        store_dir = os.path.join(self.tmpdir, 'store')
+        vector = lambda seed: np.random.default_rng(seed).random((1, 2048), dtype='float32')
+        with override_settings(SEARCH_SNAPSHOT_DIR=store_dir, SEARCH_VECTOR_BACKEND='numpy'), \
+                patch.object(catalogue.tasks, 'INDEX_FILE', index_file), \
+                patch.object(catalogue.tasks, '_VECTOR_STORE', None), \
+                patch.object(catalogue.tasks, '_INDEX_VERSION', None), \
+                patch.object(snapshot_module, '_SUBSCRIBER', None), \
+                patch.object(SnapshotSubscriber, 'start'):
+            catalogue.tasks.add_to_index(vector(1), [1])
+            catalogue.tasks.add_to_index(vector(2), [2])
+            catalogue.tasks.publish_index_snapshot()
+            catalogue.tasks.add_to_index(vector(3), [3])
+            catalogue.tasks.publish_index_snapshot()
+            catalogue.tasks.add_to_index(vector(4), [4])
+            catalogue.tasks.load_index()
+            snapshot_module._SUBSCRIBER.poll()
+            catalogue.tasks.add_to_index(vector(5), [5])
+            self.assertEqual(read_vector_store(index_file).ids().tolist(), [1, 2, 3, 4, 5])
+
+        # A process that writes the index does not follow snapshots at all
+        with override_settings(SEARCH_SNAPSHOT_DIR=store_dir, SEARCH_SNAPSHOT_SUBSCRIBE=False), \
+                patch.object(snapshot_module, '_SUBSCRIBER', None):
+            self.assertIsNone(snapshot_module.get_snapshot_subscriber(lambda *args: None, lambda: None))
+
+    def test_l2_snapshot_is_installed_with_the_search_metric(self):
+        publish_snapshot(self.index, self.store)
+        subscriber = SnapshotSubscriber(self.store, lambda index, version: self.installed.append((index, version)),
+                                        lambda: None, node='node-a', metric='cosine')
+        self.assertTrue(subscriber.poll())
+        index, _ = self.installed[-1]
+        self.assertEqual((index.metric, index.ntotal), ('cosine', 10))
+        # Distances are cosine distances, so the vector itself scores a similarity of 1
+        distances, ids = index.search(self.index.vectors_from(0)[0], 1)
+        self.assertEqual(ids[0], 1)
+        self.assertAlmostEqual(float(distances[0]), 0.0, places=5)
+
+    def test_publish_task_publishes_index_file_with_the_search_metric(self):
+        index_file = os.path.join(self.tmpdir, 'index.bin')
+        write_vector_store(self.index, index_file)
+        store_dir = os.path.join(self.tmpdir, 'store')
+        with override_settings(SEARCH_SNAPSHOT_DIR=store_dir, SEARCH_METRIC='cosine'), \
+                patch.object(catalogue.tasks, 'INDEX_FILE', index_file):
+            catalogue.tasks.publish_index_snapshot()
+        data = DirectoryStore(store_dir).get(read_manifest(DirectoryStore(store_dir))['snapshot']['name'])
+        self.assertEqual(load_vector_store(data).metric, 'cosine')
+
+    def test_load_index_pulls_latest_snapshot(self):
+        publish_snapshot(self.index, self.store)
+        with override_settings(SEARCH_SNAPSHOT_DIR=self.tmpdir), \
+                patch.object(catalogue.tasks, '_VECTOR_STORE', None), \
+                patch.object(catalogue.tasks, '_INDEX_VERSION', None), \
+                patch.object(snapshot_module, '_SUBSCRIBER', None), \
+                patch.object(SnapshotSubscriber, 'start'):
+            index = catalogue.tasks.load_index()
+            self.assertEqual(index.ntotal, 10)
+            self.assertEqual(catalogue.tasks.get_index_stats()['version'], 1)
+
+    def test_publish_task_reads_index_file(self):
+        index_file = os.path.join(self.tmpdir, 'index.bin')
+        write_vector_store(self.index, index_file)
+        with override_settings(SEARCH_SNAPSHOT_DIR=os.path.join(self.tmpdir, 'store')), \
+                patch.object(catalogue.tasks, 'INDEX_FILE', index_file):
+            self.assertEqual(catalogue.tasks.publish_index_snapshot(), 1)
+            self.assertEqual(read_manifest(DirectoryStore(os.path.join(self.tmpdir, 'store')))['ntotal'], 10)
+
+
+from catalogue.search.benchmark import benchmark_store, synthetic_vectors
+from catalogue.search.vector_store import (
+    MISSING_DISTANCE, load_vector_store, make_vector_store, similarity_from_distance,
+)
+
+
+class VectorStoreConformance:
+    """Behaviour every VectorStore backend must share; mixed into one TestCase per backend"""
+
+    backend = None
+    metric = 'l2'
+    dim = 16
+
+    def setUp(self):
+        self.store = make_vector_store(self.backend, self.dim, self.metric)
+        self.vectors = synthetic_vectors(50, self.dim, seed=2)
+        self.store.add(self.vectors, range(100, 150))
+
+    def test_nearest_neighbour_is_the_vector_itself(self):
+        distances, ids = self.store.search(self.vectors[7], 5)
+        self.assertEqual(ids[0], 107)
+        self.assertAlmostEqual(float(distances[0]), 0.0, places=4)
+        self.assertEqual(list(distances), sorted(distances))
+
+    def test_batch_search_matches_single_searches(self):
+        distances, ids = self.store.batch_search(self.vectors[:4], 3)
+        self.assertEqual(ids.shape, (4, 3))
+        for row, query in enumerate(self.vectors[:4]):
+            self.assertEqual(ids[row].tolist(), self.store.search(query, 3)[1].tolist())
+
+    def test_missing_results_are_padded(self):
+        distances, ids = self.store.search(self.vectors[0], 60)
+        self.assertEqual(len(ids), 60)
+        self.assertEqual(ids[50:].tolist(), [-1] * 10)
+        self.assertTrue(np.all(distances[50:] >= MISSING_DISTANCE))
+
+        empty = make_vector_store(self.backend, self.dim, self.metric)
+        self.assertEqual(empty.search(self.vectors[0], 2)[1].tolist(), [-1, -1])
+
+    def test_min_similarity_cuts_off_weak_matches(self):
+        distances, ids = self.store.search(self.vectors[7], 50)
+        similarities = [similarity_from_distance(d, self.metric) for d in distances]
+        # Halfway between the 5th and 6th best, so exactly five pass
+        threshold = float(similarities[4] + similarities[5]) / 2
+
+        cut_distances, cut_ids = self.store.search(self.vectors[7], 50, min_similarity=threshold)
+        self.assertEqual(cut_ids[:5].tolist(), ids[:5].tolist())
+        self.assertEqual(cut_ids[5:].tolist(), [-1] * 45)
+        self.assertTrue(np.all(cut_distances[5:] >= MISSING_DISTANCE))
+
+        _, top_two = self.store.search(self.vectors[7], 2, min_similarity=threshold)
+        self.assertEqual(top_two.tolist(), ids[:2].tolist())
+
+    def test_remove(self):
+        self.assertEqual(self.store.remove([107, 108, 999]), 2)
+        self.assertEqual(self.store.ntotal, 48)
+        _, ids = self.store.search(self.vectors[7], 48)
+        self.assertNotIn(107, ids.tolist())
+        self.assertNotIn(108, ids.tolist())
+
+    def test_snapshot_round_trip(self):
+        loaded = load_vector_store(self.store.snapshot())
+        self.assertEqual((loaded.backend, loaded.metric), (self.backend, self.metric))
+        self.assertEqual(loaded.ids().tolist(), list(range(100, 150)))
+        np.testing.assert_allclose(loaded.vectors_from(48), self.store.vectors_from(48), rtol=1e-5)
+        self.assertEqual(
+            loaded.search(self.vectors[3], 5)[1].tolist(), self.store.search(self.vectors[3], 5)[1].tolist()
+        )
+
+    def test_copy_is_independent(self):
+        copy = self.store.copy()
+        copy.add(self.vectors[:1], [999])
+        self.assertEqual((self.store.ntotal, copy.ntotal), (50, 51))
+
+    def test_stats(self):
+        stats = self.store.stats()
+        self.assertEqual(stats['backend'], self.backend)
+        self.assertEqual((stats['ntotal'], stats['dimension']), (50, self.dim))
+        self.assertGreater(stats['memory_bytes'], 0)
+
+    def test_benchmark_runs(self):
+        result = benchmark_store(
+            make_vector_store(self.backend, self.dim, self.metric), self.vectors, self.vectors[:5], k=3)
+        self.assertEqual(result['backend'], self.backend)
+        self.assertGreater(result['qps'], 0)
+
+
+class FaissVectorStoreTest(VectorStoreConformance, TestCase):
+    backend = 'faiss'
+
+
+class FaissCosineVectorStoreTest(VectorStoreConformance, TestCase):
+    backend = 'faiss'
+    metric = 'cosine'
+
+
+class NumpyCosineVectorStoreTest(VectorStoreConformance, TestCase):
+    backend = 'numpy'
+    metric = 'cosine'
+
+
+class NumpyVectorStoreTest(VectorStoreConformance, TestCase):
+    backend = 'numpy'
+
+    def test_matches_faiss_on_a_larger_store(self):
+        vectors = synthetic_vectors(3000, self.dim, seed=3)
+        queries = synthetic_vectors(70, self.dim, seed=4)
+        numpy_store = make_vector_store('numpy', self.dim)
+        faiss_store = make_vector_store('faiss', self.dim)
+        for store in (numpy_store, faiss_store):
+            store.add(vectors, range(3000))
+
+        numpy_distances, numpy_ids = numpy_store.batch_search(queries, 10)
+        faiss_distances, faiss_ids = faiss_store.batch_search(queries, 10)
+        np.testing.assert_array_equal(numpy_ids, faiss_ids)
+        np.testing.assert_allclose(numpy_distances, faiss_distances, rtol=1e-4, atol=1e-4)
+
+    def test_search_uses_the_configured_backend(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with override_settings(SEARCH_VECTOR_BACKEND='numpy'), \
+                patch.object(catalogue.tasks, '_VECTOR_STORE', None), \
+                patch.object(catalogue.tasks, 'INDEX_FILE', os.path.join(tmpdir, 'index.bin')):
+            catalogue.tasks.update_faiss_index(np.ones(2048), 42)
+            self.assertIsInstance(catalogue.tasks._VECTOR_STORE, NumpyVectorStore)
+            [(product_id, distance)] = catalogue.tasks.search_similar_products(np.ones(2048), k=1)
+            self.assertEqual(product_id, 42)
+            self.assertAlmostEqual(distance, 0.0, places=5)
+
+
+from catalogue.search.vector_store import normalize, read_vector_store, with_metric
+
+
+class CosineSimilarityTest(TestCase):
+    """Tests for the cosine index and calibrated similarity scores"""
+
+    def setUp(self):
+        self.vectors = synthetic_vectors(20, 2048, seed=5) - 0.5
+
+    def test_vectors_are_normalized_at_ingest_and_scores_are_cosine(self):
+        store = make_vector_store('faiss', 2048, 'cosine')
+        store.add(self.vectors * 7.5, range(20))
+        np.testing.assert_allclose(np.linalg.norm(store.vectors_from(0), axis=1), 1.0, rtol=1e-5)
+
+        distances, ids = store.search(self.vectors[3] * 0.1, 2)
+        expected = float(normalize(self.vectors[[3]])[0] @ normalize(self.vectors[[ids[1]]])[0])
+        self.assertEqual(ids[0], 3)
+        self.assertAlmostEqual(similarity_from_distance(distances[0], 'cosine'), 1.0, places=5)
+        self.assertAlmostEqual(similarity_from_distance(distances[1], 'cosine'), expected, places=5)
+
+    def test_l2_index_is_rebuilt_as_cosine_on_load(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'index.bin')
+        l2 = make_vector_store('faiss', 2048, 'l2')
+        l2.add(self.vectors, range(20))
+        write_vector_store(l2, path)
+
+        store = read_vector_store(path, 'cosine')
+        self.assertEqual((store.metric, store.ntotal), ('cosine', 20))
+        self.assertIs(with_metric(store, 'cosine'), store)
+        self.assertEqual(store.search(self.vectors[5], 1)[1][0], 5)
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    def test_min_similarity_reaches_the_index_and_scores_are_cosine(self, mock_search):
+        category = Category.objects.create(name='Electronics', slug='electronics', description='Desc')
+        product = Product.objects.create(
+            name='Product', sku='SKU-COS', description='Desc', price=10, stock_quantity=1, category=category)
+        mock_search.return_value = [(product.id, 0.25)]
+
+        response = APIClient().post(
+            reverse('product-search-vector'),
+            {
+                'embedding': base64.b64encode(self.vectors[0].astype('<f4').tobytes()).decode(),
+                'model_version': catalogue.tasks.EMBEDDING_MODEL_VERSION,
+                'min_similarity': 0.6,
+            },
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_search.call_args[1]['min_similarity'], 0.6)
+        self.assertAlmostEqual(response.data['results'][0]['similarity_score'], 0.75)
+
+
+import json
+from catalogue.search.benchmark_suite import (
+    ClusteredDataset, build_store, compare_reports, exact_neighbours, recall_at_k, run_suite,
+)
+
+
+class SearchBenchmarkSuiteTest(TestCase):
+    """Smoke tests for the recall/latency benchmark suite at toy scale"""
+
+    def test_dataset_is_deterministic_and_chunked(self):
+        first = ClusteredDataset(2500, dim=32, seed=3)
+        second = ClusteredDataset(2500, dim=32, seed=3)
+        chunks = list(first.chunks(chunk_size=1000))
+        self.assertEqual([start for start, _ in chunks], [0, 1000, 2000])
+        np.testing.assert_array_equal(chunks[2][1], list(second.chunks(chunk_size=2000))[1][1][:500])
+        np.testing.assert_allclose(np.linalg.norm(first.queries(5), axis=1), 1.0, rtol=1e-5)
+
+    def test_exact_neighbours_match_brute_force(self):
+        dataset = ClusteredDataset(3000, dim=32, seed=4)
+        queries = dataset.queries(10)
+        vectors = np.concatenate([vectors for _, vectors in dataset.chunks(chunk_size=1000)])
+        expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :5]
+
+        found = exact_neighbours(dataset, queries, 5)
+        self.assertEqual(recall_at_k(found, expected), 1.0)
+
+    def test_suite_report_and_regression_check(self):
+        report = run_suite({'tiny': 2000}, ['flat', 'numpy', 'ivf_flat'], dim=32, num_queries=50,
+                           k=5, threads=(1, 2))
+        rows = {(row['config'], row['nprobe']): row for row in report['results']}
+        self.assertEqual(rows[('flat', None)]['recall_at_k'], 1.0)
+        self.assertEqual(rows[('numpy', None)]['recall_at_k'], 1.0)
+        self.assertIn(('ivf_flat', 64), rows)
+        for row in rows.values():
+            self.assertEqual(set(row['qps']), {'1', '2'})
+            self.assertGreater(row['memory_bytes'], 0)
+        json.dumps(report)
+
+        self.assertEqual(compare_reports(report, report), [])
+        worse = json.loads(json.dumps(report))
+        worse['results'][0]['recall_at_k'] -= 0.5
+        self.assertEqual(len(compare_reports(report, worse)), 1)
+
+    def test_clusters_overlap_so_ivf_recall_depends_on_nprobe(self):
+        report = run_suite({'tiny': 5000}, ['ivf_flat'], dim=32, num_queries=100, k=10, threads=(1,))
+        recall = {row['nprobe']: row['recall_at_k'] for row in report['results']}
+        # Clusters matching the IVF lists would make even nprobe=4 exact
+        self.assertLess(recall[4], 0.95)
+        self.assertGreater(recall[64], recall[4])
+
+    def test_hnsw_memory_includes_the_graph(self):
+        dataset = ClusteredDataset(2000, dim=32, seed=5)
+        store, _ = build_store('hnsw', dataset)
+        serialized = len(store.snapshot())
+        self.assertGreater(store.stats()['memory_bytes'], 2000 * (32 * 4 + 8) * 1.5)
+        self.assertAlmostEqual(store.stats()['memory_bytes'] / serialized, 1.0, delta=0.05)
+
+    def test_large_configurations_are_skipped_over_memory_budget(self):
+        report = run_suite({'tiny': 1000}, ['flat'], dim=32, num_queries=5, k=2, threads=(1,),
+                           max_memory_bytes=1000)
+        self.assertEqual(report['results'][0]['skipped'], 'memory')
+
+
+from django.core.servers.basehttp import WSGIServer
+from django.test import LiveServerTestCase, override_settings
+from django.test.testcases import LiveServerThread
+from catalogue.loadtest import LoadStats, parse_mix, run_load_test, seed_load_test_data
+
+
+class SerialWSGIServer(WSGIServer):
+    """Handles one request at a time, on the live server thread and its database connection"""
+
+    def __init__(self, *args, connections_override=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class SerialLiveServerThread(LiveServerThread):
+    server_class = SerialWSGIServer
+
+
+@override_settings(QUERY_COUNT_HEADER=True)
+class LoadTestHarnessTest(LiveServerTestCase):
+    """Runs the asyncio load generator against a live test server"""
+    # The in-memory SQLite test database is one connection shared by every
+    # server thread, transaction state included, so concurrent requests
+    # would interfere. The client side still runs concurrently.
+    server_thread_class = SerialLiveServerThread
+
+    def test_browse_cart_and_checkout_mix(self):
+        tokens, product_ids = seed_load_test_data(users=20, products=15)
+        self.assertEqual(len(tokens), 20)
+        self.assertEqual(len(product_ids), 15)
+
+        stats = run_load_test(self.live_server_url, tokens, product_ids,
+                              parse_mix('products=2,cart=1,checkout=1'),
+                              concurrency=2, duration=None, max_requests=20)
+        report = stats.report()
+
+        self.assertEqual(report['error_rate'], 0, report)
+        self.assertIn('GET products/', report['endpoints'])
+        self.assertIn('POST cart/items/', report['endpoints'])
+        for endpoint in report['endpoints'].values():
+            self.assertGreater(endpoint['sql_queries_mean'], 0)
+        # The scenario choices are seeded, so this mix always reaches checkout
+        self.assertEqual(Order.objects.count(), report['endpoints']['POST orders/']['statuses']['201'])
+
+    def test_stats_report(self):
+        stats = LoadStats()
+        stats.started, stats.finished = 0.0, 2.0
+        for ms in range(1, 101):
+            stats.record('GET products/', ms / 1000, 200, queries=3)
+        stats.record('GET products/', 0.5, 500, queries=5, error=True)
+        stats.record('GET products/', 0.5, error=True)
+
+        endpoint = stats.report()['endpoints']['GET products/']
+        self.assertEqual(endpoint['requests'], 102)
+        self.assertEqual(endpoint['rps'], 51.0)
+        self.assertEqual(endpoint['statuses'], {'200': 100, '500': 1, 'exception': 1})
+        self.assertAlmostEqual(endpoint['error_rate'], 2 / 102, places=4)
+        self.assertEqual(endpoint['sql_queries_max'], 5)
+
+    def test_parse_mix_rejects_unknown_scenarios(self):
+        self.assertEqual(parse_mix('search=1,products=3'), {'search': 1.0, 'products': 3.0})
+        with self.assertRaises(ValueError):
+            parse_mix('browse=1')
+
+
+from django.core.management import call_command
+from django.db import connection
+from io import StringIO
+from unittest import skipUnless
+
+
+class SeedDbCommandTest(TestCase):
+    """Tests for the bulk seed_db command"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def seed(self, **options):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            call_command('seed_db', stdout=StringIO(), **options)
+        return list(Product.objects.order_by('id').values_list('name', 'sku', 'price', 'category__slug', 'image'))
+
+    def test_seeds_in_batches_with_images(self):
+        products = self.seed(products=25, batch_size=10)
+        self.assertEqual(len(products), 25)
+        self.assertEqual(Category.objects.count(), 8)
+        for *_, image in products:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, image)))
+
+    def test_same_seed_gives_the_same_catalogue(self):
+        first = self.seed(products=12, batch_size=5, workers=2)
+        first_image = open(os.path.join(self.media_root, first[7][4]), 'rb').read()
+        second = self.seed(products=12, batch_size=5)
+        second_image = open(os.path.join(self.media_root, second[7][4]), 'rb').read()
+
+        self.assertEqual([row[:4] for row in first], [row[:4] for row in second])
+        self.assertEqual(first_image, second_image)
+        self.assertNotEqual(self.seed(products=12, seed=1)[0][:2], first[0][:2])
+
+    @skipUnless(connection.vendor == 'postgresql', 'ProductEmbedding needs a PostgreSQL array column')
+    def test_synthetic_embeddings_skip_images(self):
+        index_file = os.path.join(self.media_root, 'index.bin')
+        with patch('catalogue.tasks.INDEX_FILE', index_file):
+            products = self.seed(products=30, batch_size=20, embeddings=True, index=True)
+
+        self.assertEqual(ProductEmbedding.objects.count(), 30)
+        self.assertTrue(all(not image for *_, image in products))
+        self.assertEqual(read_vector_store(index_file).ntotal, 30)
+
+
+import random
+from django.test import RequestFactory
+from rest_framework.request import Request
+from catalogue.api_views.product_views import ProductListAPIView
+from catalogue.query_plans import full_table_scans
+
+
+class ProductListQueryPlanTest(TestCase):
+    """
+    Guardrail: EXPLAIN every product list filter combination on a large table
+    and fail if any of them reads the whole product table.
+    """
+    PRODUCTS = 20000
+    FILTER_COMBINATIONS = [
+        {},
+        {'category_slug': 'category-3'},
+        {'min_price': 990},
+        {'max_price': 15},
+        {'min_price': 10, 'max_price': 20},
+        {'min_stock': 495},
+        {'max_stock': 3},
+        {'min_stock': 100, 'max_stock': 102},
+        {'category_slug': 'category-3', 'min_price': 900},
+        {'category_slug': 'category-3', 'max_price': 15},
+        {'category_slug': 'category-3', 'min_stock': 490},
+        {'category_slug': 'category-3', 'min_price': 100, 'max_price': 900, 'max_stock': 250},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        categories = Category.objects.bulk_create([
+            Category(name=f'Category {i}', slug=f'category-{i}', description='') for i in range(20)
+        ])
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', sku=f'SKU-{i}', description='', price=rng.randint(1000, 100000) / 100,
+                    stock_quantity=rng.randint(0, 500), category=rng.choice(categories),
+                    is_active=rng.random() < 0.9, image='')
+            for i in range(cls.PRODUCTS)
+        ], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def list_queryset(self, params):
+        view = ProductListAPIView()
+        view.request = Request(RequestFactory().get(reverse('product-list'), params))
+        view.format_kwarg = None
+        return view.get_queryset(), view.paginator
+
+    def test_product_list_filters_use_indexes(self):
+        for params in self.FILTER_COMBINATIONS:
+            with self.subTest(**params):
+                queryset, paginator = self.list_queryset(params)
+                # The first page as the paginator fetches it
+                page = queryset.order_by(paginator.ordering)[:paginator.page_size + 1]
+                self.assertEqual(full_table_scans(page), [])
+                # And the filters alone, so a walk in id order cannot hide a missing index
+                if params:
+                    self.assertEqual(full_table_scans(queryset.order_by()), [])
+
+    def test_detects_full_scans(self):
+        unindexed = Product.objects.filter(name__startswith='Product 1').order_by('name')[:10]
+        self.assertNotEqual(full_table_scans(unindexed), [])
+
+
+from catalogue.caching import bump_generation, get_generation
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+class CatalogueResponseCacheTest(TestCase):
+    """Tests for the cached product and category lists"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        for i in range(3):
+            Product.objects.create(name=f'Product {i}', sku=f'SKU-{i}', description='', price=10 + i,
+                                   stock_quantity=5, category=self.category, image='path/to/image.jpg')
+
+    def test_repeated_list_requests_are_served_from_cache(self):
+        url = reverse('product-list')
+        response = self.client.get(url, {'min_price': 10, 'page_size': 2})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # Same parameters in another order, plus an empty one, hit the same entry without a query
+        with self.assertNumQueries(0):
+            cached = self.client.get(f'{url}?page_size=2&max_price=&min_price=10')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.json(), response.json())
+
+        # A page cursor is part of the key
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(next_page['X-Cache'], 'MISS')
+        self.assertEqual([item['name'] for item in next_page.data['results']], ['Product 0'])
+
+    def test_product_and_category_changes_invalidate_the_lists(self):
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('category-list'))
+        generation = get_generation()
+
+        product = Product.objects.get(name='Product 0')
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(get_generation(), generation + 1)
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [item['name'] for item in response.data['results']])
+
+        Category.objects.create(name='Books', slug='books')
+        response = self.client.get(reverse('category-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data), 2)
+
+        product.delete()
+        self.assertEqual(get_generation(), generation + 3)
+
+    def test_generation_survives_eviction(self):
+        generation = get_generation()
+        cache.delete('catalogue:generation')
+        self.assertGreater(bump_generation(), generation)
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('product-list'))
+        self.assertFalse(response.has_header('X-Cache'))
+
+
+from datetime import timedelta
+from django.utils.http import http_date
+
+
+class ConditionalGetTest(TestCase):
+    """Tests for ETag / Last-Modified on the product and category endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', sku=f'SKU-{i}', description='', price=10 + i,
+                                   stock_quantity=5, category=self.category, image='path/to/image.jpg')
+            for i in range(3)
+        ]
+
+    def test_product_detail_not_modified(self):
+        url = reverse('product-detail', kwargs={'id': self.products[0].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+
+        # One query for the validators, nothing serialized
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], etag)
+
+        later = http_date((self.products[0].updated_at + timedelta(seconds=5)).timestamp())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=later).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        self.products[0].price = 99
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_product_is_still_not_found(self):
+        response = self.client.get(reverse('product-detail', kwargs={'id': 999}), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+    def test_product_list_etag_follows_the_page(self):
+        url = reverse('product-list')
+        first = self.client.get(url, {'page_size': 2})
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        # Another page has its own validators
+        self.assertNotEqual(self.client.get(first.data['next'])['ETag'], etag)
+
+        # A deletion moves the page even though no updated_at changed
+        self.products[1].delete()
+        response = self.client.get(url, {'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Product 2', 'Product 0'])
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+    def test_product_list_validators_without_the_cache(self):
+        url = reverse('product-list')
+        # A plain GET runs no validator aggregate and sends no validators
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page_size': 1})
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+        with self.assertNumQueries(2):
+            etag = self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH='W/"stale"')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The page and the row after it are covered; an edit further down is not
+        self.products[0].name = 'Renamed'
+        self.products[0].save()
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.products[2].name = 'Renamed'
+        self.products[2].save()
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_200_OK)
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+    def test_category_list_not_modified_until_a_category_changes(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Category.objects.create(name='Books', slug='books')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+from django.test.utils import CaptureQueriesContext
+from catalogue.cards import ProductCardCache, get_card_cache
+from catalogue.serializers.product_serializers import ProductSerializer
+from catalogue.serializers.search_serializers import ProductSearchResultSerializer
+
+
+class ProductCardCacheTest(TestCase):
+    """Tests for the shared product card cache and the serializers using it"""
+
+    def setUp(self):
+        cache.clear()
+        get_card_cache().local.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cards', password='password123', email='cards@test.com')
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', sku=f'SKU-{i}', description='Desc', price=10 + i,
+                                   stock_quantity=5, category=self.category, image='path/to/image.jpg')
+            for i in range(4)
+        ]
+
+    def test_cards_are_served_from_the_local_then_shared_tier(self):
+        cards = ProductCardCache(local_size=2, timeout=60)
+        with self.assertNumQueries(2):
+            first = cards.cards_for_ids([p.id for p in self.products])
+        self.assertEqual(first[self.products[0].id], dict(ProductSerializer(self.products[0]).data))
+        self.assertEqual(len(cards.local), 2)
+
+        # Evicted from the LRU, found in the shared cache: only the version query runs
+        with self.assertNumQueries(1):
+            second = cards.cards_for_ids([p.id for p in self.products])
+        self.assertEqual(second, first)
+        with self.assertNumQueries(0):
+            self.assertEqual(cards.cards_for_products(self.products[2:]), {p.id: first[p.id] for p in self.products[2:]})
+
+    def test_edited_product_gets_a_new_card(self):
+        cards = ProductCardCache(timeout=60)
+        cards.cards_for_ids([self.products[0].id])
+        self.products[0].name = 'Renamed'
+        self.products[0].save()
+        self.assertEqual(cards.cards_for_ids([self.products[0].id])[self.products[0].id]['name'], 'Renamed')
+
+    def test_cart_items_load_their_cards_in_one_batch(self):
+        self.client.force_authenticate(user=self.user)
+        cart = Cart.objects.create(user=self.user, status='active')
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        url = reverse('cart-active')
+
+        with CaptureQueriesContext(connection) as one_item:
+            self.client.get(url)
+        for product in self.products[1:]:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        cache.clear()
+        get_card_cache().local.clear()
+        with CaptureQueriesContext(connection) as four_items:
+            response = self.client.get(url)
+        self.assertEqual(len(four_items), len(one_item))
+
+        # The same output as the nested ProductSerializer it replaces, image URL included
+        request = response.wsgi_request
+        expected = ProductSerializer(self.products[0], context={'request': request}).data
+        self.assertEqual(response.data['items'][0]['product_details'], expected)
+        self.assertTrue(response.data['items'][0]['product_details']['image'].startswith('http://testserver/'))
+
+    def test_search_results_use_the_cards(self):
+        results = list(Product.objects.only('id', 'updated_at').order_by('id')[:2])
+        for product in results:
+            product.similarity_score = 0.5
+        with self.assertNumQueries(1):
+            data = ProductSearchResultSerializer(results, many=True).data
+        self.assertEqual(data[0]['name'], 'Product 0')
+        self.assertEqual(data[0]['price'], '10.00')
+        self.assertEqual(data[0]['similarity_score'], 0.5)
+        self.assertNotIn('description', data[0])
+
+        # A second response costs no query at all
+        with self.assertNumQueries(0):
+            ProductSearchResultSerializer(results, many=True).data
+
+
+import datetime
+import uuid
+from decimal import Decimal
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from catalogue.fastpath import ValuesSerializer
+from catalogue.parsers import ORJSONParser
+from catalogue.renderers import ORJSONRenderer
+from catalogue.serializers.cart_serializers import CartSerializer
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+class FastListPathTest(TestCase):
+    """Tests for the values() serializer and the orjson renderer and parser"""
+
+    def setUp(self):
+        parent = Category.objects.create(name='Home', slug='home')
+        self.category = Category.objects.create(name='Küche', slug='kitchen', parent=parent, description='Pots')
+        for i in range(12):
+            Product.objects.create(name=f'Product {i}\u2028☕', sku=f'SKU-{i}', description='"quoted"',
+                                   price=Decimal('10.5') + i, stock_quantity=i, is_active=i % 2 == 0,
+                                   category=self.category if i % 3 else None,
+                                   image=f'product_images/{i}.jpg' if i % 4 else '')
+
+    def get_both(self, url, params=None):
+        slow = self.client.get(url, params)
+        with override_settings(CATALOGUE_FAST_LISTS=True):
+            fast = self.client.get(url, params)
+        return slow, fast
+
+    def test_fast_lists_render_identical_bytes(self):
+        for url, params in [(reverse('product-list'), {'page_size': 100}),
+                            (reverse('product-list'), {'page_size': 5, 'min_price': 12}),
+                            (reverse('category-list'), None)]:
+            slow, fast = self.get_both(url, params)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, slow.content)
+            if params:
+                self.assertIn(b'http://testserver/media/product_images/', fast.content)
+                self.assertIn(b'\\u2028', fast.content)
+
+        # Cursors taken from values() rows walk the same pages
+        slow, fast = self.get_both(reverse('product-list'), {'page_size': 5})
+        slow, fast = self.get_both(fast.json()['next'])
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(len(fast.json()['results']), 5)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            'decimal': Decimal('12.30'), 'float': 0.25, 'int': 2 ** 40, 'none': None, 'bool': True,
+            'when': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 5, 1), 'uuid': uuid.UUID(int=7), 'lazy': gettext_lazy('Hello'),
+            'text': 'naïve\u2029 "quotes" </script>', 'nested': [{'a': [1, 2.5, 'x']}, ()],
+            'huge': 2 ** 70,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(ORJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_orjson_renderer_float_format(self):
+        # The format clients see for similarity scores; only the spelling differs from the stdlib
+        data = {'similarity_score': 1e-05, 'large': 1e20, 'plain': 0.8125, 'whole': 1.0}
+        rendered = ORJSONRenderer().render(data)
+        self.assertEqual(rendered, b'{"similarity_score":0.00001,"large":1e20,"plain":0.8125,"whole":1.0}')
+        self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(data)))
+
+    def test_orjson_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"name": "Küche", "n": [1, 2.5]}'.encode())),
+                         {'name': 'Küche', 'n': [1, 2.5]})
+        self.assertEqual(parser.parse(io.BytesIO('{"name": "Küche"}'.encode('latin-1')),
+                                      parser_context={'encoding': 'latin-1'}), {'name': 'Küche'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"name": NaN}'))
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"name": '))
+
+    def test_values_serializer_rejects_nested_serializers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesSerializer(CartSerializer)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_serializers', rows=12, page_size=5, repeat=1, stdout=out)
+        self.assertIn('identical output', out.getvalue())
+        self.assertIn('fast path', out.getvalue())
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+class SparseFieldsTest(TestCase):
+    """Tests for ?fields= on the product endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        get_card_cache().local.clear()
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', sku=f'SKU-{i}', description='A long description ' * 20,
+                                   price=10 + i, stock_quantity=5, category=self.category,
+                                   image='path/to/image.jpg')
+            for i in range(3)
+        ]
+
+    def test_list_narrows_response_and_columns(self):
+        url = reverse('product-list')
+        for fast in (True, False):
+            with override_settings(CATALOGUE_FAST_LISTS=fast), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'fields': 'name,price', 'page_size': 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'price'])
+            page_sql = queries.captured_queries[-1]['sql']
+            self.assertIn('"price"', page_sql)
+            self.assertNotIn('"description"', page_sql)
+
+            # The next page keeps the fieldset
+            next_page = self.client.get(response.data['next'])
+            self.assertEqual(list(next_page.data['results'][0]), ['id', 'name', 'price'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('product-list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', str(response.data['fields']))
+
+    def test_detail_narrows_gets_only(self):
+        url = reverse('product-detail', kwargs={'id': self.products[0].id})
+        response = self.client.get(url, {'fields': 'image,name'})
+        self.assertEqual(list(response.data), ['id', 'name', 'image'])
+
+        admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password123')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        response = client.patch(f'{url}?fields=name', {'stock_quantity': 7}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('description', response.data)
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @override_settings(SEARCH_CURSOR_TTL=600)
+    def test_search_results_are_narrowed(self, mock_search):
+        mock_search.return_value = [(product.id, 0.1) for product in self.products]
+        data = {
+            'embedding': base64.b64encode(np.ones(2048, dtype='<f4').tobytes()).decode(),
+            'model_version': EMBEDDING_MODEL_VERSION,
+            'limit': 2,
+        }
+        url = reverse('product-search-vector')
+        response = APIClient().post(f'{url}?fields=price', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'price', 'similarity_score'])
+        self.assertIn('fields=price', response.data['next'])
+
+        response = APIClient().post(f'{url}?fields=description', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+class ProductFacetsTest(TestCase):
+    """Tests for the product facets endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('product-facets')
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.books = Category.objects.create(name='Books', slug='books')
+        for price, stock, category in [(10, 0, self.books), (20, 3, self.books), (60, 1, self.electronics),
+                                       (120, 0, self.electronics), (2000, 8, self.electronics), (30, 2, None)]:
+            Product.objects.create(name=f'Product {price}', sku=f'SKU-{price}', description='', price=price,
+                                   stock_quantity=stock, category=category, image='path/to/image.jpg')
+
+    def test_facets_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facets = response.json()
+        self.assertEqual(facets['total'], 6)
+        self.assertEqual([(c['slug'], c['count']) for c in facets['categories']], [('electronics', 3), ('books', 2)])
+        self.assertEqual([b['count'] for b in facets['price']], [2, 1, 1, 1, 0, 0, 1])
+        self.assertEqual(facets['price'][0], {'min': 0, 'max': 25, 'count': 2})
+        self.assertEqual(facets['price'][-1], {'min': 1000, 'max': None, 'count': 1})
+        self.assertEqual(facets['stock'], {'in_stock': 4, 'out_of_stock': 2})
+
+    def test_facets_respect_filters_and_are_cached(self):
+        response = self.client.get(self.url, {'min_price': 50, 'category_slug': 'electronics'})
+        self.assertEqual(response.json()['total'], 3)
+        self.assertEqual(response.json()['stock'], {'in_stock': 2, 'out_of_stock': 1})
+
+        # Same filters in another order: no query
+        with self.assertNumQueries(0):
+            cached = self.client.get(f'{self.url}?category_slug=electronics&min_price=50')
+        self.assertEqual(cached.json(), response.json())
+
+        # A product change invalidates them
+        Product.objects.filter(price=120).get().delete()
+        self.assertEqual(self.client.get(self.url, {'min_price': 50, 'category_slug': 'electronics'}).json()['total'], 2)
+
+    def test_facets_follow_a_list_cursor(self):
+        page = self.client.get(reverse('product-list'), {'max_price': 100, 'page_size': 2})
+        response = self.client.get(self.url + '?' + page.data['next'].split('?')[1])
+        self.assertEqual(response.json()['total'], 4)
+
+
+from catalogue.category_tree import filter_subtree, subtree_ids
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=300)
+class CategoryTreeTest(TestCase):
+    """Tests for the materialized category paths, subtree filtering and the nested tree"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics', description='')
+        self.computers = Category.objects.create(name='Computers', slug='computers', description='',
+                                                 parent=self.electronics)
+        self.laptops = Category.objects.create(name='Laptops', slug='laptops', description='', parent=self.computers)
+        self.books = Category.objects.create(name='Books', slug='books', description='')
+        for number, category in enumerate([self.electronics, self.computers, self.laptops, self.laptops, self.books]):
+            Product.objects.create(name=f'Product {number}', sku=f'SKU-{number}', description='', price=10,
+                                   stock_quantity=1, category=category, image='path/to/image.jpg')
+
+    def test_paths_follow_parents(self):
+        self.assertEqual(self.electronics.path, f'/{self.electronics.id}/')
+        self.assertEqual(Category.objects.get(pk=self.laptops.pk).path,
+                         f'/{self.electronics.id}/{self.computers.id}/{self.laptops.id}/')
+        self.assertEqual({c.slug for c in self.electronics.get_descendants()}, {'electronics', 'computers', 'laptops'})
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.computers.parent = self.books
+        self.computers.save()
+        self.assertEqual(Category.objects.get(pk=self.laptops.pk).path,
+                         f'/{self.books.id}/{self.computers.id}/{self.laptops.id}/')
+        self.assertEqual(set(subtree_ids('books')), {self.books.id, self.computers.id, self.laptops.id})
+        self.assertEqual(subtree_ids('electronics'), [self.electronics.id])
+
+        self.computers.parent = None
+        self.computers.save(update_fields=['parent'])
+        self.assertEqual(Category.objects.get(pk=self.laptops.pk).path, f'/{self.computers.id}/{self.laptops.id}/')
+
+    def test_cannot_move_into_own_subtree(self):
+        self.electronics.parent = self.laptops
+        with self.assertRaises(ValueError):
+            self.electronics.save()
+
+    def test_rebuild_paths(self):
+        Category.objects.update(path='')
+        Category.rebuild_paths()
+        self.assertEqual(Category.objects.get(pk=self.laptops.pk).path,
+                         f'/{self.electronics.id}/{self.computers.id}/{self.laptops.id}/')
+
+    def test_product_list_filters_a_whole_subtree(self):
+        url = reverse('product-list')
+        names = lambda params: sorted(p['name'] for p in self.client.get(url, params).data['results'])
+        self.assertEqual(names({'category_slug': 'electronics'}),
+                         ['Product 0', 'Product 1', 'Product 2', 'Product 3'])
+        self.assertEqual(names({'category_slug': 'computers'}), ['Product 1', 'Product 2', 'Product 3'])
+        self.assertEqual(names({'category_slug': 'missing'}), [])
+        response = self.client.get(reverse('product-by-category', kwargs={'slug': 'computers'}))
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_subtree_filter_is_one_query_once_the_index_is_cached(self):
+        subtree_ids('electronics')
+        with self.assertNumQueries(1):
+            products = list(Product.objects.filter(category_id__in=subtree_ids('electronics')))
+        self.assertEqual(len(products), 4)
+
+    @override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+    def test_uncached_subtree_is_one_prefix_query(self):
+        self.computers.parent = self.books
+        self.computers.save()
+        with self.assertNumQueries(1) as context:
+            ids = subtree_ids('books')
+        self.assertEqual(set(ids), {self.books.id, self.computers.id, self.laptops.id})
+        self.assertIn('LIKE', context.captured_queries[0]['sql'])
+        with self.assertNumQueries(2):
+            self.assertEqual(len(filter_subtree(Product.objects.all(), 'books')), 4)
+        self.assertEqual(subtree_ids('electronics'), [self.electronics.id])
+        self.assertEqual(subtree_ids('missing'), [])
+
+        # A category without a path yet only matches itself, not every category
+        Category.objects.filter(pk=self.books.pk).update(path='')
+        self.assertEqual(subtree_ids('books'), [self.books.id])
+
+    def test_nested_tree(self):
+        url = reverse('category-list')
+        response = self.client.get(url, {'tree': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tree = response.json()
+        self.assertEqual([node['slug'] for node in tree], ['electronics', 'books'])
+        self.assertEqual([node['slug'] for node in tree[0]['children']], ['computers'])
+        self.assertEqual([node['slug'] for node in tree[0]['children'][0]['children']], ['laptops'])
+        self.assertEqual(tree[1]['children'], [])
+
+        with self.settings(CATALOGUE_FAST_LISTS=True):
+            cache.clear()
+            self.assertEqual(self.client.get(url, {'tree': 'true'}).json(), tree)
+
+        # Cached, and invalidated by a category change
+        self.assertEqual(self.client.get(url, {'tree': 'true'})['X-Cache'], 'HIT')
+        Category.objects.create(name='Phones', slug='phones', description='', parent=self.electronics)
+        tree = self.client.get(url, {'tree': 'true'}).json()
+        self.assertEqual([node['slug'] for node in tree[0]['children']], ['computers', 'phones'])
+
+        # The flat list is unchanged
+        self.assertEqual(len(self.client.get(url).json()), 5)
+
+
+from catalogue.search.text import reciprocal_rank_fusion, text_search
+
+
+@override_settings(SEARCH_CURSOR_TTL=600)
+class TextSearchTest(TestCase):
+    """Tests for full-text and hybrid text + image search"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.lamp = Product.objects.create(name='Brass desk lamp', sku='SKU-1', description='Warm light for a desk',
+                                           price=40, stock_quantity=3)
+        self.desk = Product.objects.create(name='Oak desk', sku='SKU-2', description='Solid oak, fits a lamp',
+                                           price=300, stock_quantity=1)
+        self.chair = Product.objects.create(name='Desk chair', sku='SKU-3', description='Swivel chair',
+                                            price=120, stock_quantity=5)
+        self.hidden = Product.objects.create(name='Old desk lamp', sku='SKU-4', description='', price=5,
+                                             stock_quantity=0, is_active=False)
+        self.url = reverse('product-search-text')
+
+    def test_text_search_ranks_active_matches(self):
+        ranked = text_search('desk lamp', 10)
+        self.assertEqual([pid for pid, _ in ranked], [self.lamp.id, self.desk.id])
+        self.assertGreater(ranked[0][1], ranked[1][1])
+        self.assertEqual(text_search('sofa', 10), [])
+
+    def test_search_vector_is_not_exposed(self):
+        response = self.client.get(reverse('product-detail', kwargs={'id': self.lamp.id}))
+        self.assertNotIn('search_vector', response.data)
+
+    def test_text_search_endpoint_pages_with_a_cursor(self):
+        response = self.client.get(self.url, {'q': 'desk', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tier'], 'text')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn(self.hidden.id, [r['id'] for r in response.data['results']])
+
+        page = self.client.get(response.data['next'])
+        self.assertEqual(page.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(page.data['results']), 1)
+        # Pages keep the text rank rather than reading it as an index distance
+        last_score = response.data['results'][-1]['similarity_score']
+        self.assertLessEqual(page.data['results'][0]['similarity_score'], last_score)
+        self.assertGreater(page.data['results'][0]['similarity_score'], 0)
+
+    def test_text_search_validation_and_no_results(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'q': 'sofa'})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['message'], 'No matching products found.')
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([[(1, 9.0), (2, 8.0), (3, 7.0)], [(3, 0.1), (1, 0.2), (4, 0.3)]], k=60)
+        self.assertEqual([pid for pid, _ in fused], [1, 3, 2, 4])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 62)
+
+    @patch('catalogue.api_views.product_views.search_similar_products')
+    @patch('catalogue.api_views.product_views.generate_image_embedding')
+    def test_hybrid_search_fuses_text_and_image(self, mock_generate_embedding, mock_search):
+        mock_generate_embedding.return_value = np.zeros(2048)
+        # The image ranks the chair first; the text query only matches the lamp and the desk
+        mock_search.return_value = [(self.chair.id, 0.1), (self.desk.id, 0.2), (self.lamp.id, 0.9)]
+        upload = create_test_upload('query.jpg')
+
+        response = self.client.post(reverse('product-search-hybrid'), {'q': 'lamp', 'image': upload, 'limit': 2},
+                                    format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Products in both lists beat the image-only leader
+        self.assertEqual([r['id'] for r in response.data['results']], [self.lamp.id, self.desk.id])
+        self.assertAlmostEqual(response.data['results'][0]['similarity_score'], 1 / 61 + 1 / 63, places=6)
+        self.assertEqual(mock_search.call_args.kwargs['k'], 200)
+        page = self.client.get(response.data['next'])
+        self.assertEqual([r['id'] for r in page.data['results']], [self.chair.id])
+
+    def test_hybrid_search_requires_a_query(self):
+        upload = SimpleUploadedFile('query.jpg', b'', content_type='image/jpeg')
+        response = self.client.post(reverse('product-search-hybrid'), {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', response.data)
+
+    @skipUnless(connection.vendor == 'postgresql', 'The search vector trigger and GIN index are PostgreSQL only')
+    def test_search_vector_is_maintained_and_indexed(self):
+        Product.objects.filter(pk=self.chair.pk).update(name='Reading lamp')
+        self.assertIn(self.chair.id, [pid for pid, _ in text_search('lamp', 10)])
+        self.assertNotIn(self.chair.id, [pid for pid, _ in text_search('chair swivel -lamp', 10)])
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        plan = Product.objects.filter(search_vector='lamp').explain()
+        self.assertIn('product_search_vector_idx', plan)
+
+
+from django.core.files.storage import FileSystemStorage
+from catalogue.images import make_derivatives, save_derivatives
+
+
+class ImageDerivativesTest(TestCase):
+    """Tests for the resized product image copies made at ingest"""
+
+    def setUp(self):
+        cache.clear()
+        get_card_cache().local.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        media = override_settings(MEDIA_ROOT=self.tmpdir, PRODUCT_IMAGE_SIZES=[320, 80],
+                                  PRODUCT_IMAGE_FORMATS=['webp', 'jpeg'])
+        media.enable()
+        self.addCleanup(media.disable)
+        self.product = Product.objects.create(name='Lamp', sku='SKU-1', description='', price=10, stock_quantity=1)
+        self.product.image.save('lamp.jpg', ContentFile(self.encode(Image.new('RGB', (800, 400), 'red'))))
+
+    @staticmethod
+    def encode(image, format='JPEG'):
+        buffer = io.BytesIO()
+        image.save(buffer, format)
+        return buffer.getvalue()
+
+    def test_make_derivatives_sizes_and_formats(self):
+        storage = FileSystemStorage(location=self.tmpdir)
+        derivatives = make_derivatives(Image.new('RGB', (800, 400)), 'product_images/lamp.jpg', storage,
+                                       sizes=[80, 320], formats=['webp', 'jpeg'])
+        self.assertEqual(derivatives['320'], {'webp': 'product_images/derivatives/lamp_320.webp',
+                                              'jpeg': 'product_images/derivatives/lamp_320.jpg'})
+        with storage.open(derivatives['80']['webp']) as stored:
+            image = Image.open(stored)
+            self.assertEqual((image.format, image.size), ('WEBP', (80, 40)))
+
+        # Small originals are never scaled up, and a rerun overwrites rather than renames
+        derivatives = make_derivatives(Image.new('RGB', (100, 60)), 'product_images/lamp.jpg', storage,
+                                       sizes=[320], formats=['jpeg'])
+        self.assertEqual(derivatives['320']['jpeg'], 'product_images/derivatives/lamp_320.jpg')
+        with storage.open(derivatives['320']['jpeg']) as stored:
+            self.assertEqual(Image.open(stored).size, (100, 60))
+
+    def test_save_derivatives_updates_the_product_and_drops_old_files(self):
+        updated_at = self.product.updated_at
+        derivatives = save_derivatives(self.product, Image.new('RGB', (800, 400)))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_derivatives, derivatives)
+        self.assertGreater(self.product.updated_at, updated_at)
+
+        storage = self.product.image.storage
+        with self.settings(PRODUCT_IMAGE_FORMATS=['webp']):
+            save_derivatives(self.product, Image.new('RGB', (800, 400)))
+        self.assertFalse(storage.exists(derivatives['320']['jpeg']))
+        self.assertTrue(storage.exists(derivatives['320']['webp']))
+
+    @patch('catalogue.tasks.update_faiss_index')
+    @patch('catalogue.tasks.ProductEmbedding')
+    @patch('catalogue.tasks.embed_tensors', return_value=np.zeros((1, 2048), dtype='float32'))
+    def test_ingest_decodes_the_image_once(self, mock_embed, mock_embedding_model, mock_update_index):
+        with patch('catalogue.tasks.Image.open', wraps=Image.open) as mock_open:
+            generate_embedding(self.product.id)
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(mock_embed.call_args[0][0][0].shape, (3, 224, 224))
+        mock_update_index.assert_called_once()
+        self.assertEqual(set(Product.objects.get(pk=self.product.pk).image_derivatives), {'320', '80'})
+
+    def test_serializers_expose_derivative_urls(self):
+        save_derivatives(self.product, Image.new('RGB', (800, 400)))
+        expected = {'webp': 'http://testserver/media/product_images/derivatives/lamp_80.webp',
+                    'jpeg': 'http://testserver/media/product_images/derivatives/lamp_80.jpg'}
+
+        with self.settings(CATALOGUE_FAST_LISTS=True):
+            fast = self.client.get(reverse('product-list')).json()['results'][0]
+        self.assertEqual(fast['images']['80'], expected)
+        with self.settings(CATALOGUE_CACHE_TIMEOUT=0):
+            self.assertEqual(self.client.get(reverse('product-list')).json()['results'][0], fast)
+        sparse = self.client.get(reverse('product-list'), {'fields': 'images'}).json()['results'][0]
+        self.assertEqual(sparse, {'id': self.product.id, 'images': fast['images']})
+
+        # Search result cards carry them too, in the same form as their image URL
+        with patch('catalogue.api_views.product_views.search_similar_products',
+                   return_value=[(self.product.id, 0.1)]):
+            vector = base64.b64encode(np.ones(2048, dtype='<f4').tobytes()).decode()
+            response = APIClient().post(reverse('product-search-vector'),
+                                        {'embedding': vector, 'model_version': EMBEDDING_MODEL_VERSION},
+                                        format='json')
+        result = response.json()['results'][0]
+        self.assertEqual(result['images']['80'], {fmt: url.replace('http://testserver', '')
+                                                  for fmt, url in expected.items()})
+        self.assertEqual(result['image'], '/media/product_images/lamp.jpg')
@@ -4,10 +4,12 @@ from catalogue.api_views.category_views import CategoryListAPIView
 from catalogue.api_views.product_views import (
     ProductListAPIView, ProductByCategoryListAPIView, 
     ProductCreateAPIView, ProductImageSearchAPIView,
-    ProductDetailAPIView
+    ProductDetailAPIView, ProductImageSearchPageAPIView, ProductEmbeddingSearchAPIView, ProductFacetsAPIView,
+    ProductHybridSearchAPIView, ProductTextSearchAPIView
 )
 from catalogue.api_views.cart_views import CartActiveAPIView, CartItemViewSet, CartClearAPIView
 from catalogue.api_views.order_views import OrderViewSet, OrderItemListAPIView
+from catalogue.api_views.metrics_views import MetricsAPIView
 
 router = DefaultRouter()
 router.register(r'cart/items', CartItemViewSet, basename='cart-item')
@@ -17,11 +19,17 @@ urlpatterns = [
     path('', include(router.urls)),
     path('categories/', CategoryListAPIView.as_view(), name='category-list'),
     path('products/', ProductListAPIView.as_view(), name='product-list'),
+    path('products/facets/', ProductFacetsAPIView.as_view(), name='product-facets'),
     path('products/create/', ProductCreateAPIView.as_view(), name='product-create'),
     path('products/<int:id>/', ProductDetailAPIView.as_view(), name='product-detail'),
     path('products/search/upload/', ProductImageSearchAPIView.as_view(), name='product-search-upload'),
+    path('products/search/vector/', ProductEmbeddingSearchAPIView.as_view(), name='product-search-vector'),
+    path('products/search/text/', ProductTextSearchAPIView.as_view(), name='product-search-text'),
+    path('products/search/hybrid/', ProductHybridSearchAPIView.as_view(), name='product-search-hybrid'),
+    path('products/search/results/', ProductImageSearchPageAPIView.as_view(), name='product-search-page'),
     path('products/category/<slug:slug>/', ProductByCategoryListAPIView.as_view(), name='product-by-category'),
     path('cart/active/', CartActiveAPIView.as_view(), name='cart-active'),
     path('cart/clear/', CartClearAPIView.as_view(), name='cart-clear'),
     path('orders/<int:id>/items/', OrderItemListAPIView.as_view(), name='order-items'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 ]